@@ -0,0 +1,147 @@
+"""Apuração mensal de IR sobre operações realizadas (renda variável, pessoa física).
+
+Regras aplicadas:
+- Categorias com apuração e compensação de prejuízo próprias:
+  swing trade (Ações + ETFs), day trade e FIIs.
+- Alíquotas: swing trade 15%, day trade 20%, FIIs 20%.
+- Isenção para vendas de ações em swing trade ≤ R$ 20.000 no mês (não vale
+  para ETFs nem FIIs). Prejuízos de meses isentos continuam compensáveis.
+- Prejuízo acumulado é compensado com lucros futuros da mesma categoria.
+- Day trade só vale até a quantidade comprada em day trade no dia; o
+  excedente da venda é swing trade, custeado pelo PM.
+- DARF abaixo de R$ 10 é diferido e somado ao dos meses seguintes.
+
+Tudo é vetorizado: o resultado de cada venda vem do PM registrado na
+operação e a compensação de prejuízo usa somas/máximos acumulados por
+categoria, sem laço por mês (o diferimento do DARF mínimo é o único laço).
+"""
+import numpy as np
+import pandas as pd
+
+ISENCAO_ACOES_MES = 20_000.0
+DARF_CODIGO = "6015"
+DARF_MINIMO = 10.0  # DARF abaixo de R$ 10 não é recolhido; o valor passa para os meses seguintes
+
+ALIQUOTAS = {"Swing trade": 0.15, "Day trade": 0.20, "FII": 0.20}
+
+_COLUNAS_OPS = ["data", "ticker", "tipo", "quantity", "price", "avg_price", "day_trade"]
+
+
+def realized_results(ops: pd.DataFrame) -> pd.DataFrame:
+    """
+    Resultado de cada venda. `ops` segue `load_operations`: quantity negativa
+    é venda e `avg_price` é o PM (de swing trade) antes da operação. Em vendas
+    day trade o custo é o preço médio das compras day trade do mesmo ticker no
+    mesmo dia; a parte da venda que excede essas compras é swing trade, com
+    custo pelo PM, e sai numa linha própria.
+    """
+    ops = ops[_COLUNAS_OPS].copy()
+    ops["data"] = pd.to_datetime(ops["data"])
+    ops["day_trade"] = ops["day_trade"].fillna(False).astype(bool)
+
+    buys_dt = ops[(ops["quantity"] > 0) & ops["day_trade"]]
+    if not buys_dt.empty:
+        custo_dt = (buys_dt.assign(v=buys_dt["quantity"] * buys_dt["price"])
+                    .groupby(["data", "ticker"])[["v", "quantity"]].sum())
+        custo_dt = pd.DataFrame({"pm_dt": custo_dt["v"] / custo_dt["quantity"],
+                                 "qtd_dt": custo_dt["quantity"]}).reset_index()
+        ops = ops.merge(custo_dt, on=["data", "ticker"], how="left")
+    else:
+        ops["pm_dt"], ops["qtd_dt"] = np.nan, np.nan
+
+    sells = ops[ops["quantity"] < 0].copy()
+    # Vendas day trade consomem, em ordem, as compras day trade do dia; o excedente é swing trade
+    qty = -sells["quantity"].astype(float)
+    qty_dt = qty.where(sells["day_trade"], 0.0)
+    acum = qty_dt.groupby([sells["data"], sells["ticker"]]).cumsum()
+    teto = sells["qtd_dt"].fillna(0.0)
+    parte_dt = np.minimum(acum, teto) - np.minimum(acum - qty_dt, teto)
+    parte_swing = qty - parte_dt
+    sells = pd.concat([
+        sells[parte_dt > 0].assign(qtd=parte_dt[parte_dt > 0], pm=sells["pm_dt"], day_trade=True),
+        sells[parte_swing > 0].assign(qtd=parte_swing[parte_swing > 0], pm=sells["avg_price"], day_trade=False),
+    ]).sort_index(kind="stable")
+
+    sells["quantity"] = -sells["qtd"]
+    sells["vendas"] = sells["qtd"] * sells["price"].astype(float)
+    sells["custo"] = sells["qtd"] * sells["pm"].astype(float)
+    sells["resultado"] = sells["vendas"] - sells["custo"]
+    sells["categoria"] = np.select(
+        [sells["tipo"] == "FII", sells["day_trade"]], ["FII", "Day trade"], "Swing trade"
+    )
+    sells["mes"] = sells["data"].dt.to_period("M")
+    return sells.drop(columns=["pm_dt", "qtd_dt", "qtd", "pm"]).reset_index(drop=True)
+
+
+def monthly_tax(ops: pd.DataFrame, isencao: float = ISENCAO_ACOES_MES) -> pd.DataFrame:
+    """
+    Apuração por (categoria, mês): vendas, resultado, isenção, prejuízo
+    compensado, base de cálculo e imposto devido.
+    """
+    cols = ["categoria", "mes", "vendas", "resultado", "isento", "prejuizo_compensado",
+            "base_calculo", "aliquota", "imposto", "prejuizo_a_compensar"]
+    sells = realized_results(ops)
+    if sells.empty:
+        return pd.DataFrame(columns=cols)
+
+    acao_swing = (sells["categoria"] == "Swing trade") & (sells["tipo"] == "Ação")
+    sells["vendas_acoes"] = sells["vendas"].where(acao_swing, 0.0)
+    sells["resultado_acoes"] = sells["resultado"].where(acao_swing, 0.0)
+
+    m = (sells.groupby(["categoria", "mes"])[["vendas", "resultado", "vendas_acoes", "resultado_acoes"]]
+         .sum().reset_index().sort_values(["categoria", "mes"], kind="stable"))
+
+    m["isento"] = (m["vendas_acoes"] > 0) & (m["vendas_acoes"] <= isencao)
+    # Em mês isento o lucro das ações sai da apuração; o prejuízo permanece compensável
+    lucro_isento = m["resultado_acoes"].clip(lower=0).where(m["isento"], 0.0)
+    g = m["resultado"] - lucro_isento
+
+    # Compensação: prejuízo acumulado L_t = max(0, max_{k<=t} S_k) - S_t, com S = soma acumulada
+    s = g.groupby(m["categoria"]).cumsum()
+    pico = s.groupby(m["categoria"]).cummax().clip(lower=0)
+    prejuizo = pico - s
+    prejuizo_ant = prejuizo.groupby(m["categoria"]).shift(1).fillna(0.0)
+
+    m["base_calculo"] = (g - prejuizo_ant).clip(lower=0)
+    m["prejuizo_compensado"] = np.where(g > 0, g - m["base_calculo"], 0.0)
+    m["aliquota"] = m["categoria"].map(ALIQUOTAS)
+    m["imposto"] = (m["base_calculo"] * m["aliquota"]).round(2)
+    m["prejuizo_a_compensar"] = prejuizo
+    return m[cols].reset_index(drop=True)
+
+
+def darf_table(tax: pd.DataFrame, minimo: float = DARF_MINIMO) -> pd.DataFrame:
+    """
+    DARF mensal (código 6015) a partir de `monthly_tax`: imposto por categoria
+    e vencimento. Total abaixo de `minimo` (R$ 10) não é recolhido no mês: é
+    somado ao imposto dos meses seguintes até atingir o mínimo.
+    """
+    cols = ["Mês", "Swing trade (R$)", "Day trade (R$)", "FII (R$)", "Meses anteriores (R$)",
+            "Total DARF (R$)", "Código", "Vencimento"]
+    if tax.empty:
+        return pd.DataFrame(columns=cols)
+    darf = tax.pivot_table(index="mes", columns="categoria", values="imposto", aggfunc="sum", fill_value=0.0)
+    darf = darf.reindex(columns=list(ALIQUOTAS), fill_value=0.0).sort_index()
+    devido = darf.sum(axis=1).to_numpy()
+    # Saldo abaixo do mínimo é diferido (laço curto: um passo por mês com imposto)
+    anterior, total, saldo = np.zeros(len(devido)), np.zeros(len(devido)), 0.0
+    for i, valor in enumerate(devido):
+        anterior[i] = saldo
+        saldo = round(saldo + valor, 2)
+        if saldo >= minimo:
+            total[i], saldo = saldo, 0.0
+    darf["Meses anteriores (R$)"], darf["Total DARF (R$)"] = anterior, total
+    darf = darf[darf["Total DARF (R$)"] > 0]
+    # Vencimento: último dia útil do mês seguinte ao da apuração
+    vencimento = (darf.index.to_timestamp() + pd.offsets.MonthBegin(1) + pd.offsets.BMonthEnd(0))
+    out = pd.DataFrame({
+        "Mês": darf.index.astype(str),
+        "Swing trade (R$)": darf["Swing trade"].to_numpy(),
+        "Day trade (R$)": darf["Day trade"].to_numpy(),
+        "FII (R$)": darf["FII"].to_numpy(),
+        "Meses anteriores (R$)": darf["Meses anteriores (R$)"].to_numpy(),
+        "Total DARF (R$)": darf["Total DARF (R$)"].to_numpy(),
+        "Código": DARF_CODIGO,
+        "Vencimento": vencimento.strftime("%Y-%m-%d"),
+    })
+    return out.reset_index(drop=True)
@@ -0,0 +1,204 @@
+"""Fronteira eficiente média-variância com restrições por classe.
+
+- Retorno esperado de cada ativo: retorno anual de preço (média dos retornos
+  diários × 252) + DY 12m da carteira.
+- Covariância: estimador de Ledoit-Wolf, que encolhe a covariância amostral
+  na direção de um alvo de variância constante (mais estável com poucos
+  pregões em relação ao número de ativos). A estimativa e o seu fator de
+  Cholesky ficam em cache pela versão do histórico.
+- Cada ponto da fronteira minimiza λ·wᵀΣw − μᵀw por Frank-Wolfe em pares: o
+  oráculo linear sobre {w ≥ 0, Σw = 1, mín_c ≤ peso da classe c ≤ máx_c} é
+  resolvido de forma gulosa, e cada ponto parte do conjunto ativo do ponto
+  anterior (warm start).
+"""
+import numpy as np
+import pandas as pd
+
+from analytics.risk import TRADING_DAYS, history_version
+from cache import _MISSING, MemoryLRUCache
+
+_estimates = MemoryLRUCache(max_entries=16)
+
+
+def ledoit_wolf(returns: np.ndarray) -> tuple[np.ndarray, float]:
+    """Covariância encolhida (Ledoit-Wolf, alvo μ·I) de retornos sem NaN. Retorna (Σ, intensidade)."""
+    t, n = returns.shape
+    x = returns - returns.mean(axis=0)
+    sample = x.T @ x / t
+    mu = np.trace(sample) / n
+    delta = ((sample - mu * np.eye(n)) ** 2).sum() / n
+    x2 = x ** 2
+    beta = min(((x2.T @ x2) / t - sample ** 2).sum() / n / t, delta)
+    shrinkage = beta / delta if delta > 0 else 1.0
+    return shrinkage * mu * np.eye(n) + (1 - shrinkage) * sample, shrinkage
+
+
+def estimate(prices: pd.DataFrame) -> dict:
+    """
+    Retornos médios anuais de preço, covariância anual encolhida e seu fator
+    de Cholesky, em cache pela versão do histórico.
+    """
+    key = history_version(prices)
+    est = _estimates.get(key)
+    if est is not _MISSING:
+        return est
+    rets = prices.pct_change(fill_method=None).iloc[1:]
+    mean = rets.mean().fillna(0.0).to_numpy()
+    # Pregões sem cotação (ativo listado depois) entram como a média do ativo
+    filled = rets.fillna(rets.mean()).fillna(0.0).to_numpy()
+    cov, shrinkage = ledoit_wolf(filled)
+    cov *= TRADING_DAYS
+    chol = np.linalg.cholesky(cov + 1e-12 * np.eye(len(cov)))
+    est = {"tickers": list(prices.columns), "mean": mean * TRADING_DAYS, "cov": cov,
+           "chol": chol, "shrinkage": shrinkage}
+    _estimates.set(key, est, None)
+    return est
+
+
+def expected_returns(est: dict, dy_pct: pd.Series) -> np.ndarray:
+    """Retorno anual esperado por ativo: retorno de preço + DY 12m (Series em %, por ticker)."""
+    return est["mean"] + dy_pct.reindex(est["tickers"]).fillna(0.0).to_numpy(dtype=float) / 100
+
+
+def _check_bounds(classes: np.ndarray, bounds: dict[str, tuple[float, float]]) -> tuple[list, np.ndarray, np.ndarray]:
+    names = list(pd.unique(classes))
+    lo = np.array([bounds.get(c, (0.0, 1.0))[0] for c in names], dtype=float)
+    hi = np.array([bounds.get(c, (0.0, 1.0))[1] for c in names], dtype=float)
+    if (lo > hi).any() or lo.sum() > 1 + 1e-9 or hi.sum() < 1 - 1e-9:
+        raise ValueError("Limites por classe inviáveis: a soma dos mínimos deve ser ≤ 100% e a dos máximos ≥ 100%.")
+    return names, lo, hi
+
+
+def linear_oracle(grad: np.ndarray, members: list[np.ndarray], lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """
+    Vértice do conjunto viável que minimiza gradᵀs: em cada classe toda a
+    massa vai para o ativo de menor gradiente; as massas das classes partem
+    do mínimo e o restante vai para as classes mais baratas até o máximo.
+    """
+    best = [idx[np.argmin(grad[idx])] for idx in members]
+    mass = lo.copy()
+    left = 1.0 - mass.sum()
+    for c in np.argsort(grad[best]):
+        add = min(hi[c] - mass[c], left)
+        mass[c] += add
+        left -= add
+        if left <= 1e-15:
+            break
+    s = np.zeros_like(grad)
+    s[best] = mass
+    return s
+
+
+class _ActiveSet:
+    """Vértices com peso positivo (linhas de uma matriz) e seus pesos na combinação convexa."""
+
+    def __init__(self, n: int):
+        self.verts = np.empty((8, n))
+        self.alpha = np.empty(8)
+        self.keys: list[bytes] = []
+        self.rows: dict[bytes, int] = {}
+
+    def copy(self) -> "_ActiveSet":
+        other = _ActiveSet.__new__(_ActiveSet)
+        other.verts, other.alpha = self.verts.copy(), self.alpha.copy()
+        other.keys, other.rows = list(self.keys), dict(self.rows)
+        return other
+
+    def add(self, v: np.ndarray, amount: float) -> None:
+        key = v.tobytes()
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            if row == len(self.alpha):
+                self.verts = np.vstack([self.verts, np.empty_like(self.verts)])
+                self.alpha = np.concatenate([self.alpha, np.empty_like(self.alpha)])
+            self.verts[row], self.alpha[row] = v, 0.0
+            self.keys.append(key)
+            self.rows[key] = row
+        self.alpha[row] += amount
+
+    def remove_row(self, row: int) -> None:
+        last = len(self.keys) - 1
+        del self.rows[self.keys[row]]
+        if row != last:
+            self.verts[row], self.alpha[row], self.keys[row] = self.verts[last], self.alpha[last], self.keys[last]
+            self.rows[self.keys[row]] = row
+        self.keys.pop()
+
+    def point(self) -> np.ndarray:
+        k = len(self.keys)
+        return self.alpha[:k] @ self.verts[:k]
+
+
+def frank_wolfe(mu: np.ndarray, cov: np.ndarray, risk_aversion: float, members: list[np.ndarray],
+                lo: np.ndarray, hi: np.ndarray, active: _ActiveSet | None = None,
+                tol: float = 1e-6, max_iter: int = 5000) -> tuple[np.ndarray, _ActiveSet, int]:
+    """
+    Minimiza λ·wᵀΣw − μᵀw no conjunto viável por Frank-Wolfe em pares: a cada
+    passo, peso migra do vértice ativo de pior gradiente para o vértice do
+    oráculo, o que converge linearmente em poliedros. `active` permite partir
+    da solução anterior. Retorna (pesos, conjunto ativo, iterações).
+    """
+    if active is None:
+        active = _ActiveSet(len(mu))
+        active.add(linear_oracle(-mu, members, lo, hi), 1.0)
+    else:
+        active = active.copy()
+    w = active.point()
+    cw = cov @ w
+    for it in range(1, max_iter + 1):
+        grad = 2 * risk_aversion * cw - mu
+        s = linear_oracle(grad, members, lo, hi)
+        if grad @ (w - s) <= tol:
+            return w, active, it
+        k = len(active.keys)
+        away = int(np.argmax(active.verts[:k] @ grad))
+        alpha_v = active.alpha[away]
+        d = s - active.verts[away]
+        slope = -grad @ d
+        if slope <= 0:
+            return w, active, it
+        cd = cov @ d
+        curv = 2 * risk_aversion * (d @ cd)
+        step = alpha_v if curv <= 0 else min(alpha_v, slope / curv)
+        if alpha_v - step <= 1e-12:
+            active.remove_row(away)
+        else:
+            active.alpha[away] -= step
+        active.add(s, step)
+        w = w + step * d
+        cw = cw + step * cd
+    return w, active, max_iter
+
+
+def efficient_frontier(mu: np.ndarray, cov: np.ndarray, classes: np.ndarray,
+                       bounds: dict[str, tuple[float, float]] | None = None, n_points: int = 50,
+                       dy: np.ndarray | None = None, chol: np.ndarray | None = None) -> tuple[pd.DataFrame, np.ndarray]:
+    """
+    Fronteira de `n_points` carteiras, da mais arrojada à mais conservadora,
+    com warm start entre pontos. `bounds` = {classe: (mín, máx)} em fração.
+    Retorna (tabela com retorno, volatilidade e DY de cada ponto, pesos pontos × ativos).
+    """
+    classes = np.asarray(classes)
+    names, lo, hi = _check_bounds(classes, bounds or {})
+    members = [np.flatnonzero(classes == c) for c in names]
+    chol = np.linalg.cholesky(cov + 1e-12 * np.eye(len(cov))) if chol is None else chol
+    dy = np.zeros_like(mu) if dy is None else dy
+
+    # Grade de aversão a risco na escala dos dados: do canto de máximo retorno à mínima variância
+    escala = max(float(np.ptp(mu)), 1e-6) / max(float(np.diag(cov).mean()), 1e-12)
+    lambdas = escala * np.logspace(-2, 2, n_points)
+    weights = np.empty((n_points, len(mu)))
+    active, iters = None, 0
+    for k, lam in enumerate(lambdas):
+        weights[k], active, it = frank_wolfe(mu, cov, lam, members, lo, hi, active=active)
+        iters += it
+    vol = np.linalg.norm(weights @ chol, axis=1)  # ‖Lᵀw‖ = √(wᵀΣw)
+    frontier = pd.DataFrame({
+        "Aversão a risco": lambdas,
+        "Retorno esperado (%)": weights @ mu * 100,
+        "Volatilidade (%)": vol * 100,
+        "DY (%)": weights @ dy * 100,
+    })
+    frontier.attrs["iteracoes"] = iters
+    return frontier, weights
@@ -0,0 +1,92 @@
+"""Projeção de patrimônio e renda ativo a ativo.
+
+Cada posição evolui com a valorização da sua classe e recebe uma fração fixa
+de cada aporte (política de alocação). Com o fator de crescimento
+G[t] = (1 + r)^t, o valor de cada ativo tem forma fechada
+
+    V[t] = G[t] * (V[0] + soma_{k<t} aporte[k] * a / G[k+1])
+
+calculada para a matriz (meses × ativos) com um `cumsum`, sem laço por mês.
+A renda de cada ativo é V[t] vezes o yield mensal atual da posição, corrigido
+pelo crescimento de dividendos da classe.
+"""
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from analytics.rebalance import target_weights
+
+ALLOCATION_POLICIES = ("Proporcional à carteira", "Igual entre ativos", "Pesos-alvo por classe")
+
+
+def allocation_vector(df: pd.DataFrame, policy: str, targets: dict[str, float] | None = None) -> np.ndarray:
+    """Fração de cada aporte destinada a cada ativo (soma 1)."""
+    n = len(df)
+    values = df["Valor de Mercado (R$)"].to_numpy(dtype=float)
+    if policy == "Pesos-alvo por classe" and targets:
+        a = target_weights(df, targets, by="Tipo")
+    elif policy == "Proporcional à carteira" and values.sum() > 0:
+        a = values / values.sum()
+    else:
+        a = np.full(n, 1.0 / n)
+    total = a.sum()
+    return a / total if total > 0 else np.full(n, 1.0 / n)
+
+
+def simulate_asset_projection(
+    df: pd.DataFrame,
+    monthly_contribution: float,
+    target_monthly_income: float,
+    class_return: dict[str, float],
+    class_dividend_growth: dict[str, float],
+    yearly_contrib_growth: float = 0.0,
+    max_years: int = 40,
+    policy: str = "Proporcional à carteira",
+    targets: dict[str, float] | None = None,
+) -> tuple[pd.DataFrame, int | None, pd.DataFrame]:
+    """
+    Simula cada posição de `df` (saída de `calc_portfolio_metrics`) mês a mês.
+    `class_return`/`class_dividend_growth` são taxas anuais por `Tipo`.
+    Retorna (série mensal com totais e renda por classe, mês em que a meta
+    foi atingida ou None, posição final por ativo).
+    """
+    months = max_years * 12
+    tipos = df["Tipo"].to_numpy()
+    v0 = df["Valor de Mercado (R$)"].to_numpy(dtype=float)
+    renda0 = df["Renda Mensal Est. (R$)"].to_numpy(dtype=float)
+    y0 = np.divide(renda0, v0, out=np.zeros_like(v0), where=v0 > 0)
+
+    r_m = np.array([(1 + class_return.get(t, 0.0)) ** (1 / 12) - 1 for t in tipos])
+    g_m = np.array([(1 + class_dividend_growth.get(t, 0.0)) ** (1 / 12) - 1 for t in tipos])
+    t = np.arange(months + 1)[:, None]
+    growth = (1 + r_m) ** t                                       # (meses+1) × ativos
+    aportes = monthly_contribution * (1 + yearly_contrib_growth) ** (t[:-1, 0] / 12)
+
+    contrib = aportes[:, None] * allocation_vector(df, policy, targets)[None, :]
+    acumulado = np.vstack([np.zeros((1, len(df))), np.cumsum(contrib / growth[1:], axis=0)])
+    values = (growth * (v0 + acumulado))[:months]                 # meses × ativos
+    income = values * y0 * (1 + g_m) ** t[:months]
+
+    today = datetime.today()
+    df_sim = pd.DataFrame({
+        "Data": [today + relativedelta(months=m) for m in range(months)],
+        "Patrimônio (R$)": values.sum(axis=1),
+        "Renda Mensal (R$)": income.sum(axis=1),
+    })
+    for tipo in pd.unique(tipos):
+        df_sim[f"Renda {tipo} (R$)"] = income[:, tipos == tipo].sum(axis=1)
+
+    hit = np.flatnonzero(df_sim["Renda Mensal (R$)"].to_numpy() >= target_monthly_income)
+    months_to_goal = int(hit[0]) if hit.size else None
+
+    df_assets = pd.DataFrame({
+        "Ticker": df["Ticker"].to_numpy(),
+        "Tipo": tipos,
+        "Valor atual (R$)": v0,
+        "Valor final (R$)": values[-1],
+        "Renda mensal final (R$)": income[-1],
+        "Total aportado (R$)": contrib.sum(axis=0),
+    })
+    return df_sim, months_to_goal, df_assets
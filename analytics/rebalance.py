@@ -0,0 +1,82 @@
+"""Distribuição de um aporte em ordens de compra (lotes inteiros) rumo aos pesos-alvo.
+
+O aporte é primeiro repartido de forma vetorizada, proporcional ao déficit de
+cada ativo em relação ao alvo (arredondando as cotas para baixo). A sobra de
+caixa é então alocada cota a cota por um heap que escolhe sempre a compra que
+mais reduz (ou menos aumenta) o desvio quadrático em relação aos alvos,
+até que nenhuma cota caiba no caixa restante. O custo é
+O(n log n) no número de posições, independente do valor do aporte.
+"""
+import heapq
+
+import numpy as np
+import pandas as pd
+
+
+def target_weights(df: pd.DataFrame, targets: dict[str, float], by: str = "Ticker") -> np.ndarray:
+    """
+    Pesos-alvo por linha de `df` (saída de `calc_portfolio_metrics`).
+    Com `by="Tipo"`, o alvo da classe é dividido entre os ativos da classe
+    proporcionalmente ao valor atual (ou igualmente, se a classe está zerada).
+    """
+    keys = df[by].to_numpy()
+    w_key = np.array([max(float(targets.get(k, 0.0)), 0.0) for k in keys])
+    if by == "Ticker":
+        w = w_key
+    else:
+        values = df["Valor de Mercado (R$)"].to_numpy(dtype=float)
+        class_total = df.groupby(by)["Valor de Mercado (R$)"].transform("sum").to_numpy(dtype=float)
+        class_count = df.groupby(by)[by].transform("size").to_numpy(dtype=float)
+        share = np.where(class_total > 0, values / np.where(class_total > 0, class_total, 1.0), 1.0 / class_count)
+        w = w_key * share
+    total = w.sum()
+    return w / total if total > 0 else w
+
+
+def rebalance(df: pd.DataFrame, targets: dict[str, float], cash: float,
+              by: str = "Ticker") -> tuple[pd.DataFrame, float]:
+    """
+    Calcula as cotas inteiras a comprar com `cash` para aproximar a carteira
+    dos `targets` (pesos por ticker ou por `Tipo`; não precisam somar 1).
+    Não gera vendas. Retorna (tabela de ordens, caixa que sobrou).
+    """
+    prices = df["Preço Atual (R$)"].to_numpy(dtype=float)
+    values = df["Valor de Mercado (R$)"].to_numpy(dtype=float)
+    w = target_weights(df, targets, by)
+    total = values.sum() + cash
+    buyable = prices > 0
+
+    deficit = np.where(buyable, np.clip(w * total - values, 0, None), 0.0)
+    need = deficit.sum()
+    alloc = deficit * (cash / need) if need > cash else deficit
+    qty = np.floor(np.divide(alloc, prices, out=np.zeros_like(alloc), where=buyable)).astype(np.int64)
+    left = cash - float((qty * prices).sum())
+
+    # Sobra: compra a cota que mais reduz sum((alvo - valor)^2); ganho = p * (2 * gap - p).
+    # Como sum(déficits) >= aporte, a sobra é só arredondamento (menor que a soma dos preços).
+    gap = w * total - values - qty * prices
+    heap = [(-(p * (2 * g - p)), i) for i, (p, g) in enumerate(zip(prices, gap)) if p > 0]
+    heapq.heapify(heap)
+    while heap:
+        _, i = heapq.heappop(heap)
+        p = prices[i]
+        if p > left:
+            continue  # o caixa só diminui: este ativo não volta a caber
+        qty[i] += 1
+        left -= p
+        gap[i] -= p
+        heapq.heappush(heap, (-(p * (2 * gap[i] - p)), i))
+
+    final_values = values + qty * prices
+    orders = pd.DataFrame({
+        "Ticker": df["Ticker"].to_numpy(),
+        "Tipo": df["Tipo"].to_numpy(),
+        "Preço Atual (R$)": prices,
+        "Qtde atual": df["Qtde"].to_numpy(),
+        "Peso atual (%)": values / values.sum() * 100 if values.sum() > 0 else 0.0,
+        "Peso alvo (%)": w * 100,
+        "Comprar (qtde)": qty,
+        "Valor da compra (R$)": qty * prices,
+        "Peso final (%)": final_values / final_values.sum() * 100 if final_values.sum() > 0 else 0.0,
+    })
+    return orders, round(left, 2)
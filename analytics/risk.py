@@ -0,0 +1,200 @@
+"""Métricas de risco sobre históricos de fechamento diário (datas × tickers).
+
+As estatísticas de segunda ordem vêm de somas correntes dos retornos
+(contagens, somas e produtos cruzados por par de ativos, respeitando dados
+ausentes). As somas são aditivas: quando o histórico ganha pregões novos, só
+as linhas novas entram (e, com janela móvel, as que saem são subtraídas), sem
+reprocessar a matriz inteira. Os relatórios ficam em cache pela versão do
+histórico (hash do conteúdo) e pelos pesos.
+
+Os motores incrementais são compartilhados entre as sessões (threads do
+Streamlit): ficam num LRU por (tickers, período, janela) e cada um tem um
+lock próprio para a atualização e a leitura das estatísticas.
+"""
+import hashlib
+import threading
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from cache import _MISSING, MemoryLRUCache
+
+TRADING_DAYS = 252
+
+_reports = MemoryLRUCache(max_entries=32)
+_engines = MemoryLRUCache(max_entries=16)
+_engines_lock = threading.Lock()
+
+
+def history_version(prices: pd.DataFrame) -> str:
+    """Versão do histórico: hash do conteúdo, das datas e dos tickers."""
+    h = hashlib.blake2b(pd.util.hash_pandas_object(prices, index=True).values.tobytes(), digest_size=16)
+    h.update(repr(list(prices.columns)).encode())
+    return h.hexdigest()
+
+
+class RollingMoments:
+    """Somas correntes por par de ativos: n_ij, Σr_i (onde j existe) e Σ r_i r_j."""
+
+    def __init__(self, n_assets: int):
+        self.count = np.zeros((n_assets, n_assets))
+        self.sums = np.zeros((n_assets, n_assets))
+        self.cross = np.zeros((n_assets, n_assets))
+
+    def _terms(self, returns: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        valid = ~np.isnan(returns)
+        r0 = np.where(valid, returns, 0.0)
+        m = valid.astype(float)
+        return m.T @ m, r0.T @ m, r0.T @ r0
+
+    def add(self, returns: np.ndarray) -> None:
+        c, s, x = self._terms(returns)
+        self.count += c
+        self.sums += s
+        self.cross += x
+
+    def remove(self, returns: np.ndarray) -> None:
+        c, s, x = self._terms(returns)
+        self.count -= c
+        self.sums -= s
+        self.cross -= x
+
+    def cov(self) -> np.ndarray:
+        """Covariância amostral par a par (NaN onde há menos de 2 observações em comum)."""
+        n = self.count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = (self.cross - self.sums * self.sums.T / n) / (n - 1)
+        return np.where(n > 1, cov, np.nan)
+
+    def mean(self) -> np.ndarray:
+        n = np.diag(self.count)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.diag(self.sums) / n
+
+
+class RiskEngine:
+    """
+    Retornos diários e momentos de um conjunto fixo de tickers. `update`
+    recebe o histórico mais recente: pregões que saíram do início são
+    subtraídos e só os pregões novos do fim são somados. Se os preços já
+    vistos mudaram (ex.: ajuste por provento), recomeça do zero.
+    `window` limita as estatísticas aos últimos N retornos.
+    """
+
+    def __init__(self, tickers: list[str], window: int | None = None):
+        self.tickers = list(tickers)
+        self.window = window
+        self.lock = threading.Lock()  # `update` e a leitura dos momentos não podem se intercalar
+        self._reset()
+
+    def _reset(self) -> None:
+        self.moments = RollingMoments(len(self.tickers))
+        self.prices = pd.DataFrame(columns=self.tickers, dtype=float)
+        self.returns = np.empty((0, len(self.tickers)))
+
+    def _drop_first(self, k: int) -> None:
+        if k > 0:
+            self.moments.remove(self.returns[:k])
+            self.returns = self.returns[k:]
+
+    def update(self, prices: pd.DataFrame) -> int:
+        """Incorpora `prices` (datas × tickers). Retorna quantos retornos novos entraram."""
+        prices = prices.reindex(columns=self.tickers).astype(float)
+        old = self.prices
+        pos = int(old.index.searchsorted(prices.index[0])) if len(old) and len(prices) else 0
+        overlap = min(len(old) - pos, len(prices))
+        reuse = (len(old) > 0 and overlap > 0
+                 and old.index[pos:pos + overlap].equals(prices.index[:overlap])
+                 and np.allclose(old.to_numpy()[pos:pos + overlap], prices.to_numpy()[:overlap], equal_nan=True)
+                 and pos + overlap == len(old))
+        if reuse:
+            self._drop_first(pos)  # o retorno i liga os preços i e i+1
+        else:
+            self._reset()
+            overlap = 0
+        novos = prices.to_numpy()[max(overlap - 1, 0):]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            rets = novos[1:] / novos[:-1] - 1 if len(novos) > 1 else np.empty((0, len(self.tickers)))
+        rets[~np.isfinite(rets)] = np.nan
+        self.prices = prices
+        if len(rets):
+            self.moments.add(rets)
+            self.returns = np.vstack([self.returns, rets])
+        if self.window is not None and len(self.returns) > self.window:
+            self._drop_first(len(self.returns) - self.window)
+        return len(rets)
+
+
+def max_drawdown(returns: np.ndarray) -> np.ndarray:
+    """Maior queda do pico ao vale (fração negativa) de cada coluna de retornos."""
+    wealth = np.cumprod(1 + np.nan_to_num(returns), axis=0)
+    wealth = np.vstack([np.ones((1, wealth.shape[1])), wealth])
+    return (wealth / np.maximum.accumulate(wealth, axis=0) - 1).min(axis=0)
+
+
+def _engine_for(prices: pd.DataFrame, window: int | None, period: str | None) -> RiskEngine:
+    key = repr((tuple(prices.columns), period, window))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is _MISSING:
+            engine = RiskEngine(list(prices.columns), window)
+            _engines.set(key, engine, None)
+    return engine
+
+
+def risk_report(prices: pd.DataFrame, weights: pd.Series, confidence: float = 0.95,
+                window: int | None = None, period: str | None = None) -> dict:
+    """
+    Risco por ativo e da carteira a partir dos fechamentos (`prices`, datas ×
+    tickers) e dos pesos (Series por ticker). Retorna dict com `ativos`
+    (volatilidade, retorno e drawdown anuais por ticker), `correlacao` e
+    `carteira` (volatilidade, drawdown e VaR de 1 dia histórico/paramétrico,
+    em % do patrimônio). `period` identifica o histórico pedido ("1y", "5y"...)
+    para que cada período tenha o seu motor incremental.
+    """
+    w = weights.reindex(prices.columns).fillna(0.0)
+    w = w / w.sum() if w.sum() > 0 else w
+    key = f"{history_version(prices)}:{window}:{confidence}:{hash(tuple(w.round(10)))}"
+    report = _reports.get(key)
+    if report is not _MISSING:
+        return report
+
+    engine = _engine_for(prices, window, period)
+    with engine.lock:
+        engine.update(prices)
+        tickers, rets = engine.tickers, engine.returns
+        cov, mean = engine.moments.cov(), engine.moments.mean()
+    var = np.diag(cov)
+    std = np.sqrt(var)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        corr = cov / np.outer(std, std)
+    np.fill_diagonal(corr, 1.0)
+
+    ativos = pd.DataFrame({
+        "Ticker": tickers,
+        "Volatilidade anual (%)": std * np.sqrt(TRADING_DAYS) * 100,
+        "Retorno anual (%)": mean * TRADING_DAYS * 100,
+        "Max drawdown (%)": max_drawdown(rets) * 100,
+        "Peso (%)": w.to_numpy() * 100,
+    })
+
+    # Série da carteira: retorno ausente (ativo ainda sem cotação) conta como zero
+    rp = np.nan_to_num(rets) @ w.to_numpy()
+    alpha = 1 - confidence
+    mu, sigma = (rp.mean(), rp.std(ddof=1)) if len(rp) > 1 else (0.0, 0.0)
+    z = NormalDist().inv_cdf(alpha)
+    carteira = {
+        "Volatilidade anual (%)": sigma * np.sqrt(TRADING_DAYS) * 100,
+        "Max drawdown (%)": float(max_drawdown(rp[:, None])[0]) * 100 if len(rp) else 0.0,
+        "VaR histórico 1d (%)": -float(np.quantile(rp, alpha)) * 100 if len(rp) else 0.0,
+        "VaR paramétrico 1d (%)": -(mu + z * sigma) * 100,
+        "Pregões": len(rp),
+    }
+    report = {
+        "ativos": ativos,
+        "correlacao": pd.DataFrame(corr, index=tickers, columns=tickers),
+        "carteira": carteira,
+    }
+    _reports.set(key, report, None)
+    return report
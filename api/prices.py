@@ -4,48 +4,87 @@ import os
 import time
 from datetime import datetime
 
+import pandas as pd
 import requests
-import streamlit as st
 import yfinance as yf
 from brapi import Brapi
 
+from api.singleflight import singleflight
+from cache import cached
+from config import BRAPI_BASE_URL, BRAPI_QUOTE_BATCH, LIVE_INTERVAL_SECONDS
+
 logger = logging.getLogger(__name__)
 
 BRAPI_API_KEY = os.getenv("BRAPI_API_KEY", "")
-_client = Brapi(api_key=BRAPI_API_KEY)
+_client = Brapi(api_key=BRAPI_API_KEY, base_url=BRAPI_BASE_URL)
 
 
-@st.cache_data(ttl=60 * 30)
+@singleflight
+@cached(ttl=60 * 30)
 def get_last_price(ticker: str) -> float | None:
     """Busca último preço via Brapi SDK com retry exponencial (3 tentativas)."""
     for attempt in range(3):
+        start = time.perf_counter()
         try:
             quote = _client.quote.retrieve(tickers=ticker)
+            extra = {"ticker": ticker, "source": "brapi", "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
             if quote.results:
                 result = quote.results[0]
                 if hasattr(result, "regular_market_price") and result.regular_market_price:
                     price = float(result.regular_market_price)
-                    logger.info("Preço obtido: %s = R$ %.2f", ticker, price)
+                    logger.info("Preço obtido: %s = R$ %.2f", ticker, price, extra=extra)
                     return price
-            logger.warning("Preço não encontrado na resposta Brapi para %s", ticker)
+            logger.warning("Preço não encontrado na resposta Brapi para %s", ticker, extra=extra)
             return None
         except Exception as e:
             wait = 2 ** attempt
-            logger.warning("Tentativa %d/3 falhou para %s: %s. Aguardando %ds...", attempt + 1, ticker, e, wait)
+            logger.warning("Tentativa %d/3 falhou para %s: %s. Aguardando %ds...", attempt + 1, ticker, e, wait,
+                           extra={"ticker": ticker, "source": "brapi",
+                                  "latency_ms": round((time.perf_counter() - start) * 1000, 1)})
             if attempt < 2:
                 time.sleep(wait)
-    logger.error("Todas as tentativas falharam ao buscar preço de %s", ticker)
+    logger.error("Todas as tentativas falharam ao buscar preço de %s", ticker,
+                 extra={"ticker": ticker, "source": "brapi"})
     return None
 
 
-@st.cache_data(ttl=60 * 30)
+@singleflight
+@cached(ttl=LIVE_INTERVAL_SECONDS)
+def get_quotes_batch(tickers: tuple[str, ...]) -> dict[str, float]:
+    """
+    Últimos preços de vários tickers numa requisição à Brapi (em lotes de
+    BRAPI_QUOTE_BATCH). Sem retry: quem faz polling tenta de novo no próximo
+    ciclo. Tickers sem preço ficam de fora. Cache de um intervalo do polling,
+    compartilhado entre as sessões.
+    """
+    prices = {}
+    for i in range(0, len(tickers), BRAPI_QUOTE_BATCH):
+        batch = tickers[i:i + BRAPI_QUOTE_BATCH]
+        start = time.perf_counter()
+        extra = {"source": "brapi"}
+        try:
+            quote = _client.quote.retrieve(tickers=",".join(batch))
+            extra["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            for result in quote.results or []:
+                price = getattr(result, "regular_market_price", None)
+                if price:
+                    prices[str(result.symbol).upper()] = float(price)
+            logger.info("Cotações em lote: %d de %d tickers", len(prices), len(batch), extra=extra)
+        except Exception as e:
+            extra["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            logger.warning("Erro nas cotações em lote (%d tickers): %s", len(batch), e, extra=extra)
+    return prices
+
+
+@singleflight
+@cached(ttl=60 * 30)
 def fetch_ativos_from_brapi(asset_type: str = "fund") -> list[dict]:
     """
     Busca lista de ativos + preço atual via endpoint REST Brapi.
     asset_type: 'fund' (FIIs/ETFs) ou 'stock' (ações).
     """
     try:
-        url = f"https://brapi.dev/api/quote/list?type={asset_type}&token={BRAPI_API_KEY}"
+        url = f"{BRAPI_BASE_URL}/api/quote/list?type={asset_type}&token={BRAPI_API_KEY}"
         r = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=15)
         if r.status_code == 200:
             stocks = r.json().get("stocks", [])
@@ -56,7 +95,7 @@ def fetch_ativos_from_brapi(asset_type: str = "fund") -> list[dict]:
     return []
 
 
-@st.cache_data(ttl=60 * 60 * 6)
+@cached(ttl=60 * 60 * 6)
 def get_benchmark_performance(symbol: str = "IFIX11.SA", period: str = "1y") -> tuple:
     """Busca histórico de um índice via yfinance. Retorna (DataFrame, pct_variação)."""
     fallbacks = {"IFIX11.SA": ["IFIX11.SA", "^IFIX"], "^BVSP": ["^BVSP"]}
@@ -71,3 +110,72 @@ def get_benchmark_performance(symbol: str = "IFIX11.SA", period: str = "1y") ->
         except Exception as e:
             logger.warning("Erro ao buscar benchmark %s: %s", t, e)
     return None, None
+
+
+def fetch_dividend_history(tickers: list[str], start: str | None = None,
+                           batch_size: int = 50) -> pd.DataFrame:
+    """
+    Histórico de proventos por cota via yfinance, em lotes de `batch_size`
+    tickers por requisição. Retorna DataFrame (ticker, data, valor).
+    """
+    frames = []
+    for i in range(0, len(tickers), batch_size):
+        batch = tickers[i:i + batch_size]
+        symbols = [f"{t}.SA" for t in batch]
+        try:
+            hist = yf.download(symbols, start=start, period=None if start else "2y", actions=True,
+                               group_by="ticker", progress=False, auto_adjust=False, threads=True)
+        except Exception as e:
+            logger.warning("Erro ao buscar dividendos (lote %d): %s", i // batch_size + 1, e)
+            continue
+        if hist is None or hist.empty:
+            continue
+        for ticker, symbol in zip(batch, symbols):
+            try:
+                divs = hist[symbol]["Dividends"] if isinstance(hist.columns, pd.MultiIndex) else hist["Dividends"]
+            except KeyError:
+                continue
+            divs = divs[divs > 0]
+            if not divs.empty:
+                frames.append(pd.DataFrame({
+                    "ticker": ticker,
+                    "data": pd.to_datetime(divs.index).tz_localize(None).strftime("%Y-%m-%d"),
+                    "valor": divs.to_numpy(dtype=float),
+                }))
+        logger.info("Dividendos: lote %d com %d tickers", i // batch_size + 1, len(batch))
+    if not frames:
+        return pd.DataFrame(columns=["ticker", "data", "valor"])
+    return pd.concat(frames, ignore_index=True)
+
+
+@cached(ttl=60 * 60 * 6)
+def get_price_history(tickers: tuple[str, ...], period: str = "1y", batch_size: int = 50) -> pd.DataFrame:
+    """
+    Fechamentos diários ajustados (datas × tickers) via yfinance, em lotes de
+    `batch_size` tickers por requisição. Tickers sem dados ficam de fora.
+    """
+    frames = []
+    for i in range(0, len(tickers), batch_size):
+        batch = list(tickers[i:i + batch_size])
+        symbols = [f"{t}.SA" for t in batch]
+        try:
+            hist = yf.download(symbols, period=period, group_by="ticker", progress=False,
+                               auto_adjust=True, threads=True)
+        except Exception as e:
+            logger.warning("Erro ao buscar histórico de preços (lote %d): %s", i // batch_size + 1, e)
+            continue
+        if hist is None or hist.empty:
+            continue
+        for ticker, symbol in zip(batch, symbols):
+            try:
+                close = hist[symbol]["Close"] if isinstance(hist.columns, pd.MultiIndex) else hist["Close"]
+            except KeyError:
+                continue
+            if close.notna().any():
+                frames.append(close.rename(ticker))
+        logger.info("Histórico de preços: lote %d com %d tickers (%s)", i // batch_size + 1, len(batch), period)
+    if not frames:
+        return pd.DataFrame()
+    prices = pd.concat(frames, axis=1).sort_index()
+    prices.index = pd.to_datetime(prices.index).tz_localize(None)
+    return prices.astype(float)
@@ -1,27 +1,46 @@
 """Web scraping de DY/Dividend Yield via FundsExplorer e StatusInvest."""
 import logging
 import time
+from collections import Counter
 
 import requests
-import streamlit as st
 from bs4 import BeautifulSoup
 
+from api.singleflight import singleflight
+from cache import cached
+from config import FUNDSEXPLORER_BASE_URL, STATUSINVEST_BASE_URL
+
 logger = logging.getLogger(__name__)
 
+# Roteamento do scraping por ticker: chamadas por tipo, fallbacks (rota primária
+# sem DY, requisição desperdiçada) e tickers que terminaram sem DY
+SCRAPE_STATS: Counter = Counter()
+
 _HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
 
 
+def _log_extra(ticker: str | None, source: str, r: requests.Response | None = None) -> dict:
+    """Campos estruturados do registro (ver logging_setup.py)."""
+    extra = {"ticker": ticker, "source": source}
+    if r is not None:
+        extra["latency_ms"] = round(r.elapsed.total_seconds() * 1000, 1)
+    return extra
+
+
 def _scrape_with_retry(url: str, label: str) -> requests.Response | None:
     """GET com retry exponencial (3 tentativas). Retorna response ou None."""
+    source, _, ticker = label.partition("/")
+    ticker = ticker if ticker and "/" not in ticker else None  # "StatusInvest/bulk/FII" não é um ticker
     for attempt in range(3):
         try:
             return requests.get(url, headers=_HEADERS, timeout=10)
         except requests.RequestException as e:
             wait = 2 ** attempt
-            logger.warning("%s tentativa %d/3: %s. Aguardando %ds...", label, attempt + 1, e, wait)
+            logger.warning("%s tentativa %d/3: %s. Aguardando %ds...", label, attempt + 1, e, wait,
+                           extra=_log_extra(ticker, source))
             if attempt < 2:
                 time.sleep(wait)
-    logger.error("%s: todas as tentativas falharam", label)
+    logger.error("%s: todas as tentativas falharam", label, extra=_log_extra(ticker, source))
     return None
 
 
@@ -34,14 +53,15 @@ def _parse_float(text: str, low: float = 0, high: float = 100) -> float | None:
         return None
 
 
-@st.cache_data(ttl=60 * 60 * 24)
+@cached(ttl=60 * 60 * 24)
 def get_dy_from_fundsexplorer(ticker: str) -> float | None:
     """Busca DY no FundsExplorer (exclusivo para FIIs). Retorna decimal (ex: 0.0846)."""
-    url = f"https://www.fundsexplorer.com.br/funds/{ticker.lower()}"
+    url = f"{FUNDSEXPLORER_BASE_URL}/funds/{ticker.lower()}"
     r = _scrape_with_retry(url, f"FundsExplorer/{ticker}")
     if r is None or r.status_code != 200:
         if r:
-            logger.warning("FundsExplorer HTTP %d para %s", r.status_code, ticker)
+            logger.warning("FundsExplorer HTTP %d para %s", r.status_code, ticker,
+                           extra=_log_extra(ticker, "FundsExplorer", r))
         return None
 
     soup = BeautifulSoup(r.content, "html.parser")
@@ -50,7 +70,7 @@ def get_dy_from_fundsexplorer(ticker: str) -> float | None:
     for elem in soup.find_all("span", class_="indicator-value"):
         v = _parse_float(elem.get_text().strip(), 0, 50)
         if v:
-            logger.info("DY FundsExplorer: %s = %.2f%%", ticker, v)
+            logger.info("DY FundsExplorer: %s = %.2f%%", ticker, v, extra=_log_extra(ticker, "FundsExplorer", r))
             return v / 100
 
     # Estratégia 2: tabela com label "dividend yield" ou "dy"
@@ -63,14 +83,15 @@ def get_dy_from_fundsexplorer(ticker: str) -> float | None:
                     if i + 1 < len(cells):
                         v = _parse_float(cells[i + 1].get_text().strip(), 0, 50)
                         if v:
-                            logger.info("DY FundsExplorer (tabela): %s = %.2f%%", ticker, v)
+                            logger.info("DY FundsExplorer (tabela): %s = %.2f%%", ticker, v,
+                                        extra=_log_extra(ticker, "FundsExplorer", r))
                             return v / 100
 
-    logger.debug("DY não encontrado no FundsExplorer para %s", ticker)
+    logger.debug("DY não encontrado no FundsExplorer para %s", ticker, extra=_log_extra(ticker, "FundsExplorer", r))
     return None
 
 
-@st.cache_data(ttl=60 * 60 * 24)
+@cached(ttl=60 * 60 * 24)
 def get_dy_from_statusinvest(ticker: str, asset_type: str = "FII") -> float | None:
     """
     Busca Dividend Yield no StatusInvest pelo label 'Dividend Yield'.
@@ -78,11 +99,12 @@ def get_dy_from_statusinvest(ticker: str, asset_type: str = "FII") -> float | No
     """
     path_map = {"FII": "fundos-imobiliarios", "Ação": "acoes", "ETF": "etfs"}
     path = path_map.get(asset_type, "acoes")
-    url = f"https://statusinvest.com.br/{path}/{ticker.lower()}"
+    url = f"{STATUSINVEST_BASE_URL}/{path}/{ticker.lower()}"
     r = _scrape_with_retry(url, f"StatusInvest/{ticker}")
     if r is None or r.status_code != 200:
         if r:
-            logger.warning("StatusInvest HTTP %d para %s", r.status_code, ticker)
+            logger.warning("StatusInvest HTTP %d para %s", r.status_code, ticker,
+                           extra=_log_extra(ticker, "StatusInvest", r))
         return None
 
     soup = BeautifulSoup(r.content, "html.parser")
@@ -97,7 +119,8 @@ def get_dy_from_statusinvest(ticker: str, asset_type: str = "FII") -> float | No
             if val_elem:
                 v = _parse_float(val_elem.get_text().strip(), 0, 100)
                 if v:
-                    logger.info("DY StatusInvest: %s = %.2f%%", ticker, v)
+                    logger.info("DY StatusInvest: %s = %.2f%%", ticker, v,
+                                extra=_log_extra(ticker, "StatusInvest", r))
                     return v / 100
 
     # Estratégia 2: fallback numérico — apenas FIIs e Ações (ETFs sem label = dado não confiável)
@@ -105,13 +128,15 @@ def get_dy_from_statusinvest(ticker: str, asset_type: str = "FII") -> float | No
         for tag in soup.find_all(["div", "strong", "span"], class_="value"):
             v = _parse_float(tag.get_text().strip(), 0, 50)
             if v:
-                logger.info("DY StatusInvest (fallback): %s = %.2f%%", ticker, v)
+                logger.info("DY StatusInvest (fallback): %s = %.2f%%", ticker, v,
+                            extra=_log_extra(ticker, "StatusInvest", r))
                 return v / 100
 
-    logger.debug("DY não encontrado no StatusInvest para %s", ticker)
+    logger.debug("DY não encontrado no StatusInvest para %s", ticker, extra=_log_extra(ticker, "StatusInvest", r))
     return None
 
 
+@singleflight
 def get_dy_estimate(ticker: str, asset_type: str = "FII") -> float | None:
     """
     Busca DY de múltiplas fontes por prioridade.
@@ -119,8 +144,58 @@ def get_dy_estimate(ticker: str, asset_type: str = "FII") -> float | None:
     Ações/ETFs: StatusInvest.
     Retorna decimal (ex: 0.0846) ou None.
     """
+    SCRAPE_STATS[f"rota:{asset_type}"] += 1
     if asset_type == "FII":
         dy = get_dy_from_fundsexplorer(ticker)
         if dy is not None and dy > 0:
             return dy
-    return get_dy_from_statusinvest(ticker, asset_type)
+        SCRAPE_STATS["fallback"] += 1
+    dy = get_dy_from_statusinvest(ticker, asset_type)
+    if dy is None:
+        SCRAPE_STATS["sem_dy"] += 1
+    return dy
+
+
+# Buscador avançado do StatusInvest: uma resposta JSON com todos os ativos da categoria
+_STATUSINVEST_BULK_CATEGORIES = {"Ação": 1, "FII": 2}
+
+
+@singleflight
+@cached(ttl=60 * 60 * 24)
+def get_dy_bulk_from_statusinvest(asset_type: str = "FII") -> dict[str, float]:
+    """
+    Busca o DY de toda a categoria numa única requisição (export do buscador
+    avançado). Retorna {ticker: DY decimal}; vazio se a categoria não existe
+    ou a fonte falhar.
+    """
+    category = _STATUSINVEST_BULK_CATEGORIES.get(asset_type)
+    if category is None:
+        return {}
+    url = f"{STATUSINVEST_BASE_URL}/category/advancedsearchresult?search=%7B%7D&CategoryType={category}"
+    r = _scrape_with_retry(url, f"StatusInvest/bulk/{asset_type}")
+    if r is None or r.status_code != 200:
+        if r:
+            logger.warning("StatusInvest bulk HTTP %d para %s", r.status_code, asset_type)
+        return {}
+    try:
+        payload = r.json()
+    except ValueError as e:
+        logger.warning("StatusInvest bulk %s: resposta não é JSON: %s", asset_type, e)
+        return {}
+    items = payload.get("list", []) if isinstance(payload, dict) else payload
+    result = {}
+    for item in items or []:
+        ticker = str(item.get("ticker") or "").upper().strip()
+        dy = item.get("dy")
+        if ticker and isinstance(dy, (int, float)) and 0 <= dy < 100:
+            result[ticker] = dy / 100
+    logger.info("StatusInvest bulk %s: DY de %d ativos", asset_type, len(result))
+    return result
+
+
+def get_dy_bulk(asset_types: tuple[str, ...] = ("FII", "Ação")) -> dict[str, float]:
+    """DY em lote de várias categorias: {ticker: DY decimal}. Uma requisição por categoria."""
+    result = {}
+    for asset_type in asset_types:
+        result.update(get_dy_bulk_from_statusinvest(asset_type))
+    return result
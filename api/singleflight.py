@@ -0,0 +1,88 @@
+"""Coalescência de chamadas concorrentes (single-flight) para as fontes externas.
+
+Quando várias sessões pedem o mesmo (função, ticker) ao mesmo tempo — típico
+logo após a expiração do cache — apenas uma chamada vai ao upstream; as demais
+aguardam e recebem o mesmo resultado (ou a mesma exceção).
+"""
+import functools
+import logging
+import threading
+from collections import Counter
+from typing import Any, Callable, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Grupo de chamadas em voo, indexado por chave."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+        self.stats: Counter = Counter()
+
+    def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Executa `fn` uma única vez por chave em voo e compartilha o resultado."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.stats["suprimidas"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.stats["executadas"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.debug("single-flight %s: %d chamadas coalescidas", key, call.waiters)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+_group = SingleFlight()
+
+
+def singleflight(func: Callable) -> Callable:
+    """Decorator: coalesce chamadas concorrentes com os mesmos argumentos."""
+    name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (name, args, tuple(sorted(kwargs.items())))
+        return _group.do(key, func, *args, **kwargs)
+
+    return wrapper
+
+
+def singleflight_stats() -> dict[str, int]:
+    """Contadores globais: chamadas executadas e duplicatas suprimidas."""
+    return {"executadas": _group.stats["executadas"], "suprimidas": _group.stats["suprimidas"]}
@@ -1,5 +1,4 @@
 """Dashboard Invest BR — entrada principal."""
-import logging
 import os
 
 import streamlit as st
@@ -8,15 +7,9 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # ---- Logging ----
-os.makedirs("data", exist_ok=True)
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("data/dashboard.log", encoding="utf-8"),
-        logging.StreamHandler(),
-    ],
-)
+from logging_setup import setup_logging  # noqa: E402
+
+setup_logging()
 
 # ---- Brapi API key guard ----
 if not os.getenv("BRAPI_API_KEY"):
@@ -24,7 +17,10 @@ if not os.getenv("BRAPI_API_KEY"):
     st.error("❌ BRAPI_API_KEY não encontrada! Configure o arquivo .env")
     st.stop()
 
+from config import DEFAULT_PORTFOLIO_ID, PROFILING_TOKEN, STORAGE_BACKEND  # noqa: E402
+from data_layer.alerts import get_alert_store  # noqa: E402
 from pages import explore, portfolio, projection  # noqa: E402 (after env check)
+from profiling import profile_rerun  # noqa: E402
 
 st.set_page_config(page_title="Dashboard Invest BR", layout="wide")
 
@@ -33,6 +29,13 @@ st.sidebar.title("📊 Dashboard Invest BR")
 st.sidebar.markdown("---")
 page = st.sidebar.radio("🧭 Navegação", ["🔍 Explorar Ativos", "💼 Minha Carteira", "🎯 Projeções"])
 
+portfolio_id = DEFAULT_PORTFOLIO_ID
+if STORAGE_BACKEND == "sqlite":
+    portfolio_id = st.sidebar.text_input(
+        "🗂️ Carteira", value=DEFAULT_PORTFOLIO_ID,
+        help="Identificador da carteira (usuário/carteira). Cada id tem posições e proventos próprios.",
+    ).strip() or DEFAULT_PORTFOLIO_ID
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 🔔 Alertas de DY/Yield")
 dy_min = st.sidebar.number_input(
@@ -43,12 +46,25 @@ dy_max = st.sidebar.number_input(
     "DY máximo (%)", min_value=0.0, max_value=100.0, value=15.0, step=0.5, format="%.1f",
     help="Destaque amarelo para DY muito alto (possível risco)",
 )
+alert_store = get_alert_store(create=False)
+if alert_store is not None and (novos_alertas := alert_store.unseen_count()):
+    st.sidebar.warning(f"🔔 {novos_alertas} alertas novos no universo — veja em **Explorar Ativos**")
 
 st.sidebar.markdown("---")
 st.sidebar.success("✅ **Conectado à Brapi**")
 st.sidebar.info("💡 **Preços:** Brapi REST API")
 st.sidebar.info("📊 **DY:** FundsExplorer + StatusInvest")
 
+# ---- Perfil sob demanda (administradores: ?profile=<PROFILING_TOKEN>) ----
+profiling = False
+if PROFILING_TOKEN:
+    if st.query_params.get("profile") == PROFILING_TOKEN:
+        st.session_state["profiling_admin"] = True
+    if st.session_state.get("profiling_admin"):
+        st.sidebar.markdown("---")
+        profiling = st.sidebar.toggle("🔬 Perfilar execuções", value=True, key="profiling_on",
+                                      help="Grava um perfil cProfile de cada execução da página em data/profiles/")
+
 st.sidebar.markdown("---")
 st.sidebar.markdown("### 📚 Sobre")
 st.sidebar.markdown("Dashboard de investimentos brasileiros: FIIs, Ações e ETFs.")
@@ -60,8 +76,23 @@ st.sidebar.markdown(
 
 # ---- Page routing ----
 if page == "🔍 Explorar Ativos":
-    explore.render()
+    render, kwargs = explore.render, {"portfolio_id": portfolio_id}
 elif page == "💼 Minha Carteira":
-    portfolio.render(dy_min=dy_min, dy_max=dy_max)
+    render, kwargs = portfolio.render, {"dy_min": dy_min, "dy_max": dy_max, "portfolio_id": portfolio_id}
+else:
+    render, kwargs = projection.render, {"portfolio_id": portfolio_id}
+
+if not profiling:
+    render(**kwargs)
 else:
-    projection.render()
+    with profile_rerun(page) as run:
+        render(**kwargs)
+    if run.report is None:
+        st.info("🔬 Outra sessão está sendo perfilada; esta execução não foi perfilada.")
+    else:
+        with st.expander(f"🔬 Perfil desta execução: {run.report.seconds * 1000:,.0f} ms", expanded=True):
+            st.caption(f"Gravado em `{run.report.path}` (abra com `python -m pstats` ou snakeviz)")
+            ordem = st.radio("Ordenar por", ["Tempo próprio", "Tempo acumulado"], horizontal=True,
+                             key="profiling_ordem")
+            st.dataframe(run.report.top(25, "proprio" if ordem == "Tempo próprio" else "acumulado"),
+                         use_container_width=True, hide_index=True)
@@ -0,0 +1,295 @@
+"""Cache com TTL e limite de tamanho, independente do Streamlit.
+
+Dois backends:
+- MemoryLRUCache: dicionário LRU em memória, local ao processo.
+- SQLiteCache: arquivo SQLite compartilhado entre processos do mesmo host
+  (várias réplicas atrás de um load balancer enxergam as mesmas entradas).
+
+O decorator `cached` substitui `st.cache_data` nas camadas api/ e data_layer/,
+permitindo reutilizar as funções em jobs batch sem o runtime do Streamlit.
+Numa chave ausente, só quem reivindica a chave no backend chama a função; os
+demais processos aguardam o valor aparecer no cache em vez de repetir a busca.
+"""
+import functools
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+from config import CACHE_BACKEND, CACHE_DB, CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+# Prazo da reivindicação de uma chave: se quem a reivindicou morrer, outro assume depois disso
+CLAIM_LEASE_SECONDS = 60.0
+
+
+class CacheBackend:
+    """Interface comum dos backends de cache."""
+
+    def get(self, key: str) -> Any:
+        """Retorna o valor ou `_MISSING` se ausente/expirado."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float | None) -> None:
+        raise NotImplementedError
+
+    def delete_prefix(self, prefix: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def claim(self, key: str, lease: float) -> bool:
+        """
+        Reivindica a busca de `key` por até `lease` segundos. Só um dono por
+        vez; backends locais ao processo sempre concedem (o single-flight já
+        coalesce as threads).
+        """
+        return True
+
+    def claimed(self, key: str) -> bool:
+        """Se há uma reivindicação vigente de `key`."""
+        return False
+
+    def release(self, key: str) -> None:
+        """Libera a reivindicação feita por este processo/thread."""
+
+
+class MemoryLRUCache(CacheBackend):
+    """Cache LRU em memória, thread-safe, com TTL por entrada."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[float | None, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            expires_at, value = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float | None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache em arquivo SQLite (modo WAL), compartilhado entre processos.
+    Valores são serializados com pickle; a evicção remove expirados e,
+    se ainda acima do limite, as entradas menos acessadas recentemente.
+    """
+
+    def __init__(self, path: str = CACHE_DB, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL,"
+            " expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache(accessed_at)")
+        conn.execute("CREATE TABLE IF NOT EXISTS claims (key TEXT PRIMARY KEY, owner TEXT NOT NULL,"
+                     " expires_at REAL NOT NULL)")
+        conn.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return _MISSING
+        blob, expires_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            with conn:
+                conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            return _MISSING
+        try:
+            value = pickle.loads(blob)
+        except Exception as e:
+            logger.warning("Entrada de cache ilegível (%s): %s", key, e)
+            return _MISSING
+        with conn:
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def set(self, key: str, value: Any, ttl: float | None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, blob, expires_at, now),
+            )
+            count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self.max_entries:
+                count -= conn.execute(
+                    "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+                ).rowcount
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM cache WHERE key IN ("
+                    " SELECT key FROM cache ORDER BY accessed_at ASC LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def delete_prefix(self, prefix: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE substr(key, 1, ?) = ?", (len(prefix), prefix))
+
+    def clear(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    @staticmethod
+    def _owner() -> str:
+        return f"{os.getpid()}:{threading.get_ident()}"
+
+    def claim(self, key: str, lease: float) -> bool:
+        now = time.time()
+        conn = self._conn()
+        with conn:  # a remoção da reivindicação vencida e a inserção na mesma transação
+            conn.execute("DELETE FROM claims WHERE key = ? AND expires_at <= ?", (key, now))
+            cur = conn.execute("INSERT OR IGNORE INTO claims (key, owner, expires_at) VALUES (?, ?, ?)",
+                               (key, self._owner(), now + lease))
+        return cur.rowcount == 1
+
+    def claimed(self, key: str) -> bool:
+        row = self._conn().execute("SELECT 1 FROM claims WHERE key = ? AND expires_at > ?",
+                                   (key, time.time())).fetchone()
+        return row is not None
+
+    def release(self, key: str) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM claims WHERE key = ? AND owner = ?", (key, self._owner()))
+
+
+_backend: CacheBackend | None = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> CacheBackend:
+    """Backend padrão do processo, escolhido por CACHE_BACKEND ('sqlite' ou 'memory')."""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if CACHE_BACKEND == "memory":
+                    _backend = MemoryLRUCache()
+                else:
+                    try:
+                        _backend = SQLiteCache()
+                    except sqlite3.Error as e:
+                        logger.warning("Cache SQLite indisponível, usando memória: %s", e)
+                        _backend = MemoryLRUCache()
+    return _backend
+
+
+def set_backend(backend: CacheBackend | None) -> None:
+    """Troca o backend padrão (útil em testes e jobs batch)."""
+    global _backend
+    _backend = backend
+
+
+def _wait_for(store: CacheBackend, key: str, timeout: float) -> Any:
+    """Aguarda outro processo gravar `key`; `_MISSING` se ele desistiu (reivindicação liberada ou vencida)."""
+    deadline = time.time() + timeout
+    delay = 0.02
+    while time.time() < deadline:
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+        value = store.get(key)
+        if value is not _MISSING or not store.claimed(key):
+            return value
+    return _MISSING
+
+
+def cached(ttl: float | None = None, backend: CacheBackend | None = None) -> Callable:
+    """
+    Memoiza o resultado da função por argumentos, com TTL em segundos.
+    A função decorada ganha `.clear()` para invalidar suas entradas.
+    Entre processos, uma chave ausente é buscada uma vez só (ver `claim`).
+    """
+    def decorator(func: Callable) -> Callable:
+        prefix = f"{func.__module__}.{func.__qualname__}:"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            store = backend if backend is not None else get_backend()
+            key = prefix + repr((args, sorted(kwargs.items())))
+            value = store.get(key)
+            if value is not _MISSING:
+                return value
+            owner = store.claim(key, CLAIM_LEASE_SECONDS)
+            if owner:
+                value = store.get(key)  # gravado entre a consulta e a reivindicação
+            else:
+                value = _wait_for(store, key, CLAIM_LEASE_SECONDS)
+            if value is not _MISSING:
+                if owner:
+                    store.release(key)
+                return value
+            try:
+                value = func(*args, **kwargs)
+                store.set(key, value, ttl)
+            finally:
+                if owner:
+                    store.release(key)
+            return value
+
+        wrapper.clear = lambda: (backend if backend is not None else get_backend()).delete_prefix(prefix)
+        return wrapper
+
+    return decorator
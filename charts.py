@@ -0,0 +1,204 @@
+"""Construção de figuras Plotly com memoização e downsampling de séries longas.
+
+As figuras são memoizadas pelo hash dos dados de entrada: um rerun que só
+muda, por exemplo, o limiar de DY na barra lateral reaproveita as figuras já
+montadas. Séries temporais longas passam por LTTB (Largest-Triangle-Three-
+Buckets), que preserva picos e vales com uma fração dos pontos.
+"""
+import functools
+import hashlib
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from cache import _MISSING, MemoryLRUCache
+
+# Pontos máximos enviados ao navegador por série temporal
+MAX_SERIES_POINTS = 400
+
+_figures = MemoryLRUCache(max_entries=64)
+
+
+def _fingerprint(value) -> bytes:
+    """Hash estável dos dados: DataFrames/Series pelo conteúdo, o resto por repr."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        h = pd.util.hash_pandas_object(value, index=True).values.tobytes()
+        cols = repr(list(value.columns)) if isinstance(value, pd.DataFrame) else repr(value.name)
+        return hashlib.blake2b(h + cols.encode(), digest_size=16).digest()
+    if isinstance(value, (list, tuple)):
+        return b"".join(_fingerprint(v) for v in value)
+    if isinstance(value, dict):
+        return b"".join(_fingerprint(k) + _fingerprint(v) for k, v in sorted(value.items()))
+    return repr(value).encode()
+
+
+def memo_figure(func: Callable[..., go.Figure]) -> Callable[..., go.Figure]:
+    """Memoiza a figura pelo hash dos argumentos."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        digest = hashlib.blake2b(_fingerprint((args, kwargs)), digest_size=16).hexdigest()
+        key = f"{func.__qualname__}:{digest}"
+        fig = _figures.get(key)
+        if fig is _MISSING:
+            fig = func(*args, **kwargs)
+            _figures.set(key, fig, None)
+        return fig
+
+    return wrapper
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Índices selecionados pelo LTTB. Mantém o primeiro e o último ponto e, em
+    cada bucket, o ponto que forma o maior triângulo com o anterior e a média
+    do bucket seguinte.
+    """
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    idx = np.empty(threshold, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        idx[i + 1] = a
+    return idx
+
+
+def downsample(df: pd.DataFrame, x: str, y: str, max_points: int = MAX_SERIES_POINTS) -> pd.DataFrame:
+    """Reduz `df` a no máximo `max_points` linhas com LTTB sobre (x, y)."""
+    if len(df) <= max_points:
+        return df
+    xs = df[x]
+    if pd.api.types.is_datetime64_any_dtype(xs):
+        xv = (xs - xs.iloc[0]).dt.total_seconds().to_numpy()
+    else:
+        xv = xs.to_numpy()
+    return df.iloc[lttb(xv, df[y].to_numpy(), max_points)]
+
+
+# ---- Figuras da página Minha Carteira ----
+
+@memo_figure
+def allocation_pie(df: pd.DataFrame) -> go.Figure:
+    fig = go.Figure(go.Pie(
+        labels=df["Ticker"],
+        values=df["Valor de Mercado (R$)"],
+        hole=0.4,
+        textinfo="label+percent",
+        hovertemplate="<b>%{label}</b><br>R$ %{value:,.2f}<br>%{percent}<extra></extra>",
+    ))
+    fig.update_layout(title="Participação por ativo (%)", showlegend=False, height=380,
+                      margin=dict(t=40, b=0, l=0, r=0))
+    return fig
+
+
+@memo_figure
+def market_value_bar(df: pd.DataFrame) -> go.Figure:
+    df_sorted = df.sort_values("Valor de Mercado (R$)", ascending=True)
+    fig = go.Figure(go.Bar(
+        x=df_sorted["Valor de Mercado (R$)"],
+        y=df_sorted["Ticker"],
+        orientation="h",
+        text=df_sorted["Valor de Mercado (R$)"].apply(lambda v: f"R$ {v:,.0f}"),
+        textposition="outside",
+        marker_color="royalblue",
+        hovertemplate="<b>%{y}</b><br>R$ %{x:,.2f}<extra></extra>",
+    ))
+    fig.update_layout(title="Valor de Mercado por ativo (R$)", height=380,
+                      xaxis=dict(title="R$"), yaxis=dict(title=""),
+                      margin=dict(t=40, b=0, l=0, r=10))
+    return fig
+
+
+@memo_figure
+def type_pie(df_tipo: pd.DataFrame) -> go.Figure:
+    fig = go.Figure(go.Pie(
+        labels=df_tipo["Tipo"],
+        values=df_tipo["Valor de Mercado (R$)"],
+        hole=0.4,
+        textinfo="label+percent",
+        hovertemplate="<b>%{label}</b><br>R$ %{value:,.2f}<br>%{percent}<extra></extra>",
+    ))
+    fig.update_layout(title="Alocação por tipo de ativo", height=300,
+                      margin=dict(t=40, b=0, l=0, r=0))
+    return fig
+
+
+@memo_figure
+def benchmark_line(hist_bench: pd.DataFrame, benchmark_label: str, period_label: str,
+                   carteira_pct: float) -> go.Figure:
+    hist_norm = hist_bench.assign(Base100=hist_bench["Close"] / hist_bench["Close"].iloc[0] * 100)
+    hist_norm = downsample(hist_norm, "Date", "Base100")
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=hist_norm["Date"], y=hist_norm["Base100"],
+        name=benchmark_label, line=dict(color="darkorange", width=2),
+        hovertemplate=f"<b>{benchmark_label}</b><br>%{{x}}<br>Base 100: %{{y:.1f}}<extra></extra>",
+    ))
+    fig.add_hline(
+        y=100 + carteira_pct, line_dash="dash", line_color="royalblue",
+        annotation_text=f"Sua carteira: {100 + carteira_pct:.1f}",
+        annotation_position="right",
+    )
+    fig.update_layout(
+        title=f"{benchmark_label} — {period_label} (base 100)",
+        xaxis=dict(title="Data"), yaxis=dict(title="Base 100"),
+        height=350, margin=dict(t=40, b=0, l=0, r=10),
+    )
+    return fig
+
+
+@memo_figure
+def proventos_bar(df_mensal: pd.DataFrame) -> go.Figure:
+    fig = go.Figure(go.Bar(
+        x=df_mensal["Mês"], y=df_mensal["Total (R$)"],
+        marker_color="seagreen",
+        text=df_mensal["Total (R$)"].apply(lambda v: f"R$ {v:,.2f}"),
+        textposition="outside",
+        hovertemplate="<b>%{x}</b><br>R$ %{y:,.2f}<extra></extra>",
+    ))
+    fig.update_layout(title="Proventos por mês (R$)", height=300,
+                      xaxis=dict(title="Mês"), yaxis=dict(title="R$"),
+                      margin=dict(t=40, b=0, l=0, r=0))
+    return fig
+
+
+@memo_figure
+def correlation_heatmap(corr: pd.DataFrame) -> go.Figure:
+    fig = go.Figure(go.Heatmap(
+        z=corr.to_numpy(), x=list(corr.columns), y=list(corr.index),
+        zmin=-1, zmax=1, colorscale="RdBu", reversescale=True,
+        hovertemplate="%{y} × %{x}<br>ρ = %{z:.2f}<extra></extra>",
+    ))
+    fig.update_layout(title="Correlação dos retornos diários", height=max(300, 22 * len(corr) + 120),
+                      margin=dict(t=40, b=0, l=0, r=0))
+    return fig
+
+
+@memo_figure
+def frontier_line(frontier: pd.DataFrame, atual: tuple[float, float], escolhida: tuple[float, float] | None) -> go.Figure:
+    fig = go.Figure(go.Scatter(
+        x=frontier["Volatilidade (%)"], y=frontier["Retorno esperado (%)"], mode="lines+markers",
+        name="Fronteira eficiente", line=dict(color="royalblue", width=2), marker=dict(size=5),
+        customdata=frontier["DY (%)"],
+        hovertemplate="Vol. %{x:.2f}%<br>Retorno %{y:.2f}%<br>DY %{customdata:.2f}%<extra></extra>",
+    ))
+    fig.add_trace(go.Scatter(x=[atual[0]], y=[atual[1]], mode="markers", name="Carteira atual",
+                             marker=dict(color="darkorange", size=12, symbol="diamond")))
+    if escolhida is not None:
+        fig.add_trace(go.Scatter(x=[escolhida[0]], y=[escolhida[1]], mode="markers",
+                                 name="Melhor com o risco atual", marker=dict(color="seagreen", size=12)))
+    fig.update_layout(title="Fronteira eficiente (retorno de preço + DY)", height=400,
+                      xaxis=dict(title="Volatilidade anual (%)"), yaxis=dict(title="Retorno esperado (%)"),
+                      margin=dict(t=40, b=0, l=0, r=10))
+    return fig
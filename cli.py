@@ -0,0 +1,201 @@
+"""Linha de comando headless: atualização do universo e relatórios das carteiras.
+
+Roda sem o Streamlit, por exemplo no cron noturno:
+
+    python cli.py refresh [--lacunas] [--dividendos]
+    python cli.py report [--carteiras ID ...] [--saida DIR] [--workers N]
+
+`refresh` reconstrói o universo (lista, preços e DY em lote) ignorando o cache
+de 30 min. `report` gera, para cada carteira, `posicoes.csv`, `projecao.csv`
+e `resumo.json` em `<saida>/<carteira>/`; as carteiras são distribuídas entre
+processos (um por núcleo), cada um carregando o universo do CSV uma única vez.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()  # antes do `config`: o .env define STORAGE_BACKEND, REPORTS_DIR, LOG_LEVEL...
+
+from config import DEFAULT_PORTFOLIO_ID, LOG_LEVEL, REPORTS_DIR, STORAGE_BACKEND  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Premissas padrão da projeção (as mesmas da página de Projeções)
+PROJECTION_DEFAULTS = {
+    "monthly_contribution": 1000.0,
+    "target_monthly_income": 5000.0,
+    "yearly_return": 0.06,
+    "yearly_dividend_growth": 0.02,
+    "yearly_contrib_growth": 0.0,
+    "max_years": 30,
+}
+
+
+def portfolio_ids() -> list[str]:
+    """Carteiras existentes: todas as do SQLite ou a carteira única do backend JSON."""
+    if STORAGE_BACKEND == "sqlite":
+        from data_layer.storage import get_store
+        return get_store().list_portfolios()
+    return [DEFAULT_PORTFOLIO_ID]
+
+
+# ---- refresh ----
+
+def refresh(lacunas: bool = False, dividendos: bool = False) -> dict:
+    """Reconstrói o universo; opcionalmente busca DY por ticker onde o lote falhou e o histórico de proventos."""
+    from data_layer.assets import refresh_dy, refresh_universe
+    from data_layer.dividends import local_dy, update_dividend_history
+    from data_layer.portfolio import read_portfolio
+
+    start = time.perf_counter()
+    universe = refresh_universe()
+    stats = {"ativos": len(universe), "dy_lacunas": 0, "proventos_novos": 0}
+    if lacunas:
+        gaps = universe.df[universe.df["dy_12m"] <= 0]
+        data_att = datetime.now().strftime("%Y-%m-%d %H:%M")
+        novos = refresh_dy(gaps)
+        stats["dy_lacunas"] = universe.update_fields(
+            {t: {"dy_12m": v, "data_atualizacao": data_att} for t, v in novos.items() if v > 0})
+    if dividendos:
+        held = {p["ticker"] for pid in portfolio_ids() for p in read_portfolio(pid)["positions"]}
+        stats["proventos_novos"] = update_dividend_history(sorted(held))
+        universe.update_fields({t: {"dy_12m": v} for t, v in local_dy(universe.df).items()})
+    logger.info("Universo atualizado em %.1fs: %s", time.perf_counter() - start, stats)
+    return stats
+
+
+# ---- report ----
+
+def build_report(portfolio_id: str, out_dir: str, params: dict | None = None) -> dict:
+    """Métricas e projeção de uma carteira gravadas em `out_dir/<carteira>/`. Retorna o resumo."""
+    from data_layer.portfolio import calc_portfolio_metrics, read_portfolio
+    from utils import simulate_projection
+
+    params = {**PROJECTION_DEFAULTS, **(params or {})}
+    df_pf, totals = calc_portfolio_metrics(read_portfolio(portfolio_id))
+    df_sim, months = simulate_projection(
+        start_capital=totals["Patrimônio (R$)"],
+        current_monthly_income=totals["Renda Mensal (R$)"],
+        **params,
+    )
+    resumo = {
+        "carteira": portfolio_id,
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "posicoes": len(df_pf),
+        **totals,
+        "meses_ate_meta": months,
+        "data_meta": df_sim["Data"].iloc[months].strftime("%Y-%m") if months is not None else None,
+        "premissas": params,
+    }
+    dest = os.path.join(out_dir, portfolio_id)
+    os.makedirs(dest, exist_ok=True)
+    df_pf.to_csv(os.path.join(dest, "posicoes.csv"), index=False, encoding="utf-8")
+    df_sim.to_csv(os.path.join(dest, "projecao.csv"), index=False, encoding="utf-8", date_format="%Y-%m-%d")
+    with open(os.path.join(dest, "resumo.json"), "w", encoding="utf-8") as f:
+        json.dump(resumo, f, ensure_ascii=False, indent=2)
+    return resumo
+
+
+def _report_task(args: tuple[str, str, dict]) -> tuple[str, dict | None, str | None]:
+    """Falha de uma carteira não derruba as demais: o erro volta para o processo principal."""
+    portfolio_id, out_dir, params = args
+    try:
+        return portfolio_id, build_report(portfolio_id, out_dir, params), None
+    except Exception as e:
+        logger.exception("Falha no relatório da carteira %s", portfolio_id)
+        return portfolio_id, None, f"{type(e).__name__}: {e}"
+
+
+def _init_worker(level: str) -> None:
+    """Cada processo carrega o universo uma vez; o log vai para stderr (o arquivo é do processo principal)."""
+    logging.basicConfig(level=level, format="%(asctime)s [%(levelname)s] %(processName)s %(message)s")
+    from data_layer.assets import get_universe
+    get_universe()
+
+
+def report(ids: list[str], out_dir: str = REPORTS_DIR, workers: int | None = None,
+           params: dict | None = None) -> list[tuple[str, dict | None, str | None]]:
+    """
+    Relatórios de `ids` em paralelo. O universo é validado antes no processo
+    principal, para que os processos só leiam o CSV já atualizado.
+    """
+    from data_layer.assets import get_universe
+
+    get_universe()
+    workers = max(1, min(workers or os.cpu_count() or 1, len(ids)))
+    tasks = [(pid, out_dir, params or {}) for pid in ids]
+    start = time.perf_counter()
+    if workers == 1:
+        results = [_report_task(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_worker, initargs=(LOG_LEVEL,)) as pool:
+            results = list(pool.map(_report_task, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    logger.info("%d relatórios em %.1fs com %d processo(s); %d falha(s)", len(results),
+                time.perf_counter() - start, workers, sum(err is not None for _, _, err in results))
+    return results
+
+
+# ---- Entrada ----
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli.py", description="Dashboard Invest BR sem interface")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_refresh = sub.add_parser("refresh", help="Reconstrói o universo (preços e DY)")
+    p_refresh.add_argument("--lacunas", action="store_true",
+                           help="Busca DY por ticker (scraping) onde o lote não trouxe valor")
+    p_refresh.add_argument("--dividendos", action="store_true",
+                           help="Atualiza o histórico de proventos dos ativos em carteira e recalcula o DY local")
+
+    p_report = sub.add_parser("report", help="Métricas e projeção das carteiras")
+    p_report.add_argument("--carteiras", nargs="+", metavar="ID", help="Padrão: todas")
+    p_report.add_argument("--saida", default=REPORTS_DIR, help=f"Diretório de saída (padrão: {REPORTS_DIR})")
+    p_report.add_argument("--workers", type=int, default=None, help="Processos (padrão: núcleos da CPU)")
+    p_report.add_argument("--aporte", type=float, default=PROJECTION_DEFAULTS["monthly_contribution"])
+    p_report.add_argument("--meta", type=float, default=PROJECTION_DEFAULTS["target_monthly_income"])
+    p_report.add_argument("--valorizacao", type=float, default=PROJECTION_DEFAULTS["yearly_return"] * 100,
+                          help="Valorização anual (%%)")
+    p_report.add_argument("--crescimento-dividendos", type=float,
+                          default=PROJECTION_DEFAULTS["yearly_dividend_growth"] * 100, help="(%% a.a.)")
+    p_report.add_argument("--crescimento-aporte", type=float,
+                          default=PROJECTION_DEFAULTS["yearly_contrib_growth"] * 100, help="(%% a.a.)")
+    p_report.add_argument("--anos", type=int, default=PROJECTION_DEFAULTS["max_years"])
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parser().parse_args(argv)
+    from logging_setup import setup_logging
+    setup_logging()
+
+    if args.comando == "refresh":
+        print(json.dumps(refresh(args.lacunas, args.dividendos), ensure_ascii=False))
+        return 0
+
+    params = {
+        "monthly_contribution": args.aporte,
+        "target_monthly_income": args.meta,
+        "yearly_return": args.valorizacao / 100,
+        "yearly_dividend_growth": args.crescimento_dividendos / 100,
+        "yearly_contrib_growth": args.crescimento_aporte / 100,
+        "max_years": args.anos,
+    }
+    results = report(args.carteiras or portfolio_ids(), args.saida, args.workers, params)
+    falhas = [(pid, err) for pid, _, err in results if err is not None]
+    for pid, err in falhas:
+        print(f"{pid}: {err}", file=sys.stderr)
+    print(f"{len(results) - len(falhas)} relatório(s) em {args.saida}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
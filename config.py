@@ -3,8 +3,62 @@ import os
 
 DATA_DIR = "data"
 ATIVOS_CSV = os.path.join(DATA_DIR, "ativos.csv")
+ATIVOS_DELTA_CSV = os.path.join(DATA_DIR, "ativos_delta.csv")
 PORTFOLIO_JSON = os.path.join(DATA_DIR, "portfolio.json")
 PROVENTOS_JSON = os.path.join(DATA_DIR, "proventos.json")
+DIVIDENDOS_CSV = os.path.join(DATA_DIR, "dividendos.csv")
+
+# Histórico de preço/DY (ver data_layer/history.py): resolução completa nos
+# últimos HISTORY_FULL_DAYS dias, um ponto por dia depois disso, até a retenção
+HISTORY_DIR = os.path.join(DATA_DIR, "historico")
+HISTORY_FULL_DAYS = int(os.getenv("HISTORY_FULL_DAYS", "90"))
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "730"))
+
+# Fontes externas (sobrescrevíveis para apontar a stubs locais, ver loadtest.py)
+BRAPI_BASE_URL = os.getenv("BRAPI_BASE_URL", "https://brapi.dev").rstrip("/")
+FUNDSEXPLORER_BASE_URL = os.getenv("FUNDSEXPLORER_BASE_URL", "https://www.fundsexplorer.com.br").rstrip("/")
+STATUSINVEST_BASE_URL = os.getenv("STATUSINVEST_BASE_URL", "https://statusinvest.com.br").rstrip("/")
+
+# Cotações ao vivo das posições (ver pages/portfolio.py): intervalo do polling,
+# tickers por requisição à Brapi e pregão da B3 (horário de Brasília, dias úteis;
+# B3_FERIADOS = datas AAAA-MM-DD separadas por vírgula)
+LIVE_INTERVAL_SECONDS = int(os.getenv("LIVE_INTERVAL_SECONDS", "15"))
+BRAPI_QUOTE_BATCH = int(os.getenv("BRAPI_QUOTE_BATCH", "20"))
+B3_OPEN, B3_CLOSE = "10:00", "17:00"
+B3_FERIADOS = {d.strip() for d in os.getenv("B3_FERIADOS", "").split(",") if d.strip()}
+
+# Armazenamento das carteiras: "json" (arquivo único, legado) ou "sqlite" (várias carteiras)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json")
+STORAGE_DB = os.getenv("STORAGE_DB", os.path.join(DATA_DIR, "carteiras.sqlite3"))
+DEFAULT_PORTFOLIO_ID = "default"
+
+# Regras e eventos de alerta (ver data_layer/alerts.py)
+ALERTS_DB = os.getenv("ALERTS_DB", os.path.join(DATA_DIR, "alertas.sqlite3"))
+
+# Cache (ver cache.py): "sqlite" é compartilhado entre processos do host; "memory" é local
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+CACHE_DB = os.getenv("CACHE_DB", os.path.join(DATA_DIR, "cache.sqlite3"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "20000"))
+
+# Logging (ver logging_setup.py): arquivo JSON rotacionado por tamanho, backups em gzip
+LOG_FILE = os.getenv("LOG_FILE", os.path.join(DATA_DIR, "dashboard.log"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(5 * 1024 * 1024)))
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
+
+# Relatórios gerados pela linha de comando (ver cli.py)
+REPORTS_DIR = os.getenv("REPORTS_DIR", os.path.join(DATA_DIR, "relatorios"))
+
+# API JSON somente leitura (ver server.py)
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8502"))
+SERVER_REFRESH_SECONDS = float(os.getenv("SERVER_REFRESH_SECONDS", "5"))
+
+# Perfil sob demanda (ver profiling.py): habilitado só com PROFILING_TOKEN definido,
+# acessando o app com ?profile=<token>; mantém os PROFILES_KEEP perfis mais recentes
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILES_DIR = os.path.join(DATA_DIR, "profiles")
+PROFILES_KEEP = int(os.getenv("PROFILES_KEEP", "50"))
 
 # Alíquotas de IR por tipo de ativo
 ASSET_CONFIG = {
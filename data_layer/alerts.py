@@ -0,0 +1,338 @@
+"""Motor de alertas sobre o universo inteiro.
+
+As regras (faixas de DY, limites de preço, variação percentual entre
+atualizações e dados desatualizados) ficam em SQLite, junto com os eventos
+que a interface lê. A avaliação é incremental: cada atualização do universo
+entrega só as linhas que mudaram (valor anterior e novo), e cada linha é
+confrontada apenas com as regras que se aplicam a ela — as do próprio ticker
+(por dicionário) e as gerais, avaliadas de forma vetorizada sobre as
+mudanças. O custo é proporcional ao número de mudanças, não ao tamanho do
+universo. Os alertas de nível disparam na transição (o valor passou a violar
+a regra), não a cada atualização.
+
+Regras de dados desatualizados dependem do relógio, não de mudanças: a
+varredura usa o índice ordenado de datas do screener (uma busca binária) e
+registra quais tickers já foram avisados, até que voltem a ser atualizados.
+"""
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from config import ALERTS_DB
+
+logger = logging.getLogger(__name__)
+
+# tipo de regra → rótulo (o limiar está na unidade indicada)
+RULE_KINDS = {
+    "dy_abaixo": "DY abaixo de (%)",
+    "dy_acima": "DY acima de (%)",
+    "preco_abaixo": "Preço abaixo de (R$)",
+    "preco_acima": "Preço acima de (R$)",
+    "variacao": "Variação de preço entre atualizações (%)",
+    "desatualizado": "Sem atualização há mais de (h)",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rules (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind       TEXT NOT NULL,
+    threshold  REAL NOT NULL,
+    ticker     TEXT,
+    tipo       TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    rule_id INTEGER NOT NULL,
+    ticker  TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    message TEXT NOT NULL,
+    value   REAL,
+    ts      TEXT NOT NULL,
+    seen    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_events_seen_id ON events(seen, id DESC);
+CREATE TABLE IF NOT EXISTS stale (
+    rule_id INTEGER NOT NULL,
+    ticker  TEXT NOT NULL,
+    PRIMARY KEY (rule_id, ticker)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_stale_ticker ON stale(ticker);
+"""
+
+
+class AlertStore:
+    """Regras e eventos de alerta em SQLite."""
+
+    def __init__(self, path: str = ALERTS_DB):
+        self.path = path
+        self._local = threading.local()
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---- Regras ----
+
+    def add_rule(self, kind: str, threshold: float, ticker: str | None = None, tipo: str | None = None) -> int:
+        """Cria uma regra; `ticker`/`tipo` None = todo o universo. Retorna o id."""
+        if kind not in RULE_KINDS:
+            raise ValueError(f"Tipo de regra desconhecido: {kind}")
+        if threshold < 0:
+            raise ValueError("O limiar da regra não pode ser negativo.")
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO rules (kind, threshold, ticker, tipo, created_at) VALUES (?, ?, ?, ?, ?)",
+                (kind, float(threshold), ticker.upper() if ticker else None, tipo or None,
+                 datetime.now().isoformat(timespec="seconds")),
+            )
+        return int(cur.lastrowid)
+
+    def delete_rule(self, rule_id: int) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM rules WHERE id = ?", (rule_id,))
+            conn.execute("DELETE FROM stale WHERE rule_id = ?", (rule_id,))
+
+    def rules(self) -> list[dict]:
+        cur = self._conn().execute("SELECT id, kind, threshold, ticker, tipo FROM rules ORDER BY id")
+        return [dict(zip(("id", "kind", "threshold", "ticker", "tipo"), r)) for r in cur]
+
+    # ---- Eventos ----
+
+    def add_events(self, events: list[dict]) -> None:
+        if not events:
+            return
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO events (rule_id, ticker, kind, message, value, ts) "
+                "VALUES (:rule_id, :ticker, :kind, :message, :value, :ts)", events,
+            )
+
+    def events(self, limit: int = 100, unseen_only: bool = False) -> pd.DataFrame:
+        """Eventos mais recentes primeiro."""
+        sql = "SELECT id, ts, ticker, kind, message, value, seen FROM events"
+        if unseen_only:
+            sql += " WHERE seen = 0"
+        return pd.read_sql_query(sql + " ORDER BY id DESC LIMIT ?", self._conn(), params=(limit,))
+
+    def unseen_count(self) -> int:
+        return int(self._conn().execute("SELECT COUNT(*) FROM events WHERE seen = 0").fetchone()[0])
+
+    def mark_seen(self) -> None:
+        with self._conn() as conn:
+            conn.execute("UPDATE events SET seen = 1 WHERE seen = 0")
+
+    # ---- Estado das regras de dados desatualizados ----
+
+    def stale_known(self, rule_id: int, tickers: list[str]) -> set[str]:
+        """Quais de `tickers` já foram avisados por esta regra."""
+        known = set()
+        conn = self._conn()
+        for i in range(0, len(tickers), 500):
+            chunk = tickers[i:i + 500]
+            cur = conn.execute(
+                f"SELECT ticker FROM stale WHERE rule_id = ? AND ticker IN ({','.join('?' * len(chunk))})",
+                (rule_id, *chunk),
+            )
+            known.update(r[0] for r in cur)
+        return known
+
+    def mark_stale(self, rule_id: int, tickers: list[str]) -> None:
+        with self._conn() as conn:
+            conn.executemany("INSERT OR IGNORE INTO stale (rule_id, ticker) VALUES (?, ?)",
+                             [(rule_id, t) for t in tickers])
+
+    def clear_stale(self, tickers: list[str]) -> None:
+        """Tickers atualizados voltam a poder gerar alerta de desatualização."""
+        with self._conn() as conn:
+            conn.executemany("DELETE FROM stale WHERE ticker = ?", [(t,) for t in tickers])
+
+
+_store: AlertStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_alert_store(create: bool = True) -> AlertStore | None:
+    """Store padrão do processo. Com `create=False`, None enquanto não houver regras criadas."""
+    global _store
+    if _store is None:
+        if not create and not os.path.exists(ALERTS_DB):
+            return None
+        with _store_lock:
+            if _store is None:
+                _store = AlertStore(ALERTS_DB)
+    return _store
+
+
+# ---- Avaliação ----
+
+def _violates(kind: str, threshold: float, preco: np.ndarray, dy: np.ndarray) -> np.ndarray:
+    """Condição de nível da regra (DY 0 = sem dado, como no destaque da carteira)."""
+    with np.errstate(invalid="ignore"):
+        if kind == "dy_abaixo":
+            return (dy > 0) & (dy < threshold)
+        if kind == "dy_acima":
+            return dy >= threshold
+        if kind == "preco_abaixo":
+            return (preco > 0) & (preco < threshold)
+        if kind == "preco_acima":
+            return preco >= threshold
+    raise ValueError(f"Regra sem condição de nível: {kind}")
+
+
+def _message(kind: str, threshold: float, preco: float, dy: float, variacao: float) -> tuple[str, float]:
+    if kind == "dy_abaixo":
+        return f"DY {dy:.2f}% abaixo de {threshold:.2f}%", dy
+    if kind == "dy_acima":
+        return f"DY {dy:.2f}% acima de {threshold:.2f}%", dy
+    if kind == "preco_abaixo":
+        return f"Preço R$ {preco:.2f} abaixo de R$ {threshold:.2f}", preco
+    if kind == "preco_acima":
+        return f"Preço R$ {preco:.2f} acima de R$ {threshold:.2f}", preco
+    return f"Preço variou {variacao:+.2f}% na última atualização (limite {threshold:.2f}%)", variacao
+
+
+class AlertEngine:
+    """
+    Regras indexadas para avaliação incremental: as de um ticker ficam num
+    dicionário por ticker; as gerais (todo o universo ou um tipo) são
+    avaliadas vetorialmente sobre as mudanças.
+    """
+
+    def __init__(self, rules: list[dict]):
+        self.by_ticker: dict[str, list[dict]] = {}
+        self.general: list[dict] = []
+        self.stale: list[dict] = []
+        for rule in rules:
+            if rule["kind"] == "desatualizado":
+                self.stale.append(rule)
+            elif rule["ticker"]:
+                self.by_ticker.setdefault(rule["ticker"], []).append(rule)
+            else:
+                self.general.append(rule)
+
+    def evaluate(self, changes: pd.DataFrame, now: datetime | None = None) -> list[dict]:
+        """
+        Eventos para as linhas de `changes` (colunas ticker, tipo, preco_ant,
+        preco, dy_ant, dy; valores anteriores NaN para tickers novos).
+        """
+        if changes.empty:
+            return []
+        ts = (now or datetime.now()).isoformat(timespec="seconds")
+        tickers = changes["ticker"].to_numpy()
+        tipos = changes["tipo"].to_numpy()
+        preco, dy = changes["preco"].to_numpy(dtype=float), changes["dy"].to_numpy(dtype=float)
+        preco_ant, dy_ant = changes["preco_ant"].to_numpy(dtype=float), changes["dy_ant"].to_numpy(dtype=float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            variacao = np.where(preco_ant > 0, (preco / preco_ant - 1) * 100, np.nan)
+
+        def fire(rule: dict, rows: np.ndarray) -> np.ndarray:
+            if rule["kind"] == "variacao":
+                with np.errstate(invalid="ignore"):
+                    return rows[np.abs(variacao[rows]) >= rule["threshold"]]
+            novo = _violates(rule["kind"], rule["threshold"], preco[rows], dy[rows])
+            antes = _violates(rule["kind"], rule["threshold"], preco_ant[rows], dy_ant[rows])
+            return rows[novo & ~antes]
+
+        events = []
+        all_rows = np.arange(len(changes))
+        hits = [(rule, fire(rule, all_rows if not rule["tipo"] else all_rows[tipos == rule["tipo"]]))
+                for rule in self.general]
+        for i, t in enumerate(tickers):
+            for rule in self.by_ticker.get(t, ()):
+                hits.append((rule, fire(rule, np.array([i]))))
+        for rule, rows in hits:
+            for i in rows:
+                message, value = _message(rule["kind"], rule["threshold"], preco[i], dy[i], variacao[i])
+                events.append({"rule_id": rule["id"], "ticker": tickers[i], "kind": rule["kind"],
+                               "message": message, "value": float(value), "ts": ts})
+        return events
+
+
+def changes_between(old: pd.DataFrame | None, new: pd.DataFrame) -> pd.DataFrame:
+    """
+    Linhas do universo `new` cujo preço ou DY difere de `old` (ou que não
+    existiam), com os valores anteriores. Uma comparação vetorizada pelo ticker.
+    """
+    cur = new[["ticker", "tipo", "preco_atual", "dy_12m"]].rename(columns={"preco_atual": "preco", "dy_12m": "dy"})
+    if old is None or old.empty:
+        return cur.assign(preco_ant=np.nan, dy_ant=np.nan)
+    prev = old.drop_duplicates("ticker", keep="last").set_index("ticker")
+    cur = cur.assign(preco_ant=cur["ticker"].map(prev["preco_atual"]).to_numpy(dtype=float),
+                     dy_ant=cur["ticker"].map(prev["dy_12m"]).to_numpy(dtype=float))
+    changed = ~(np.isclose(cur["preco"], cur["preco_ant"]) & np.isclose(cur["dy"], cur["dy_ant"]))
+    return cur[changed].reset_index(drop=True)
+
+
+def refreshed_between(old: pd.DataFrame | None, new: pd.DataFrame) -> list[str]:
+    """
+    Tickers de `new` cuja `data_atualizacao` (preenchida) difere da de `old`,
+    ou que não existiam: foram atualizados, mesmo que com os mesmos valores.
+    """
+    data = new["data_atualizacao"].fillna("").astype(str).to_numpy()
+    if old is None or old.empty or "data_atualizacao" not in old.columns:
+        antes = np.full(len(new), "")
+    else:
+        prev = old.drop_duplicates("ticker", keep="last").set_index("ticker")["data_atualizacao"]
+        antes = new["ticker"].map(prev.fillna("").astype(str)).fillna("").to_numpy()
+    return new["ticker"][(data != "") & (data != antes)].tolist()
+
+
+def evaluate_changes(changes: pd.DataFrame, now: datetime | None = None) -> int:
+    """Avalia as regras sobre as mudanças de uma atualização e grava os eventos. Retorna quantos."""
+    store = get_alert_store(create=False)
+    if store is None or changes.empty:
+        return 0
+    rules = store.rules()
+    if not rules:
+        return 0
+    events = AlertEngine(rules).evaluate(changes, now)
+    store.add_events(events)
+    if events:
+        logger.info("Alertas: %d eventos em %d mudanças", len(events), len(changes))
+    return len(events)
+
+
+def sweep_stale(screener, now: datetime | None = None) -> int:
+    """
+    Aplica as regras de desatualização sobre o universo do `screener`
+    (`AssetScreener`): os tickers sem atualização dentro do prazo saem de uma
+    busca no índice ordenado de datas. Cada ticker é avisado uma vez até ser
+    atualizado de novo. Retorna quantos eventos gerou.
+    """
+    store = get_alert_store(create=False)
+    if store is None:
+        return 0
+    now = now or datetime.now()
+    events = []
+    for rule in AlertEngine(store.rules()).stale:
+        df = screener.query(tipos=[rule["tipo"]] if rule["tipo"] else None, stale_hours=rule["threshold"], now=now)
+        if rule["ticker"]:
+            df = df[df["ticker"] == rule["ticker"]]
+        tickers = df["ticker"].tolist()
+        known = store.stale_known(rule["id"], tickers)
+        novos = [t for t in tickers if t not in known]
+        if not novos:
+            continue
+        datas = dict(zip(df["ticker"], df["data_atualizacao"]))
+        ts = now.isoformat(timespec="seconds")
+        events += [{"rule_id": rule["id"], "ticker": t, "kind": "desatualizado",
+                    "message": f"Sem atualização há mais de {rule['threshold']:.0f} h "
+                               f"(última: {datas[t] or 'nunca'})", "value": None, "ts": ts} for t in novos]
+        store.mark_stale(rule["id"], novos)
+    store.add_events(events)
+    return len(events)
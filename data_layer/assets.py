@@ -1,24 +1,78 @@
 """Gerenciamento da lista de ativos (FIIs, Ações, ETFs)."""
 import logging
 import os
+import sqlite3
+import threading
 import time
+from collections import Counter
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
-import streamlit as st
 
 from config import (
-    ATIVOS_CSV, DATA_DIR, ETFS_BR,
+    ATIVOS_CSV, ATIVOS_DELTA_CSV, DATA_DIR, ETFS_BR,
     FIIS_FALLBACK, ACOES_FALLBACK,
 )
 from api.prices import fetch_ativos_from_brapi
+from api.scraping import get_dy_bulk, get_dy_estimate
+from data_layer.alerts import changes_between, evaluate_changes, get_alert_store, refreshed_between
+from data_layer.dividends import apply_local_dy
+from data_layer.history import append_snapshot
 
 logger = logging.getLogger(__name__)
 
+# Validade do CSV do universo em disco
+ATIVOS_CACHE_MIN = 30
+# O delta é incorporado ao CSV quando passa desta fração do universo
+DELTA_COMPACT_RATIO = 0.25
+
+_COLUMN_DEFAULTS = {"preco_atual": 0.0, "dy_12m": 0.0, "data_atualizacao": "", "tipo": "FII"}
+_HISTORY_FIELDS = {"preco_atual", "dy_12m"}
+_ALERT_COLUMNS = ["ticker", "preco_atual", "dy_12m", "data_atualizacao"]
+
+
+# Índice ticker → tipo montado a partir das listagens da Brapi e persistido com o
+# universo (coluna `tipo` do CSV). A heurística de sufixo só vale para tickers fora dele.
+_tipo_index: dict[str, str] = {}
+_tipo_index_mtime: float | None = None
+CLASSIFICATION_STATS: Counter = Counter()
+
+# Sufixos de BDRs, excluídos da listagem de ações
+_BDR_SUFFIXES = ("32", "33", "34", "35")
+
+
+def set_classification_index(df: pd.DataFrame) -> None:
+    """Substitui o índice de classificação pelas colunas ticker/tipo do universo."""
+    global _tipo_index
+    _tipo_index = dict(zip(df["ticker"].str.upper(), df["tipo"]))
+
+
+def _ensure_index() -> None:
+    """Carrega o índice do CSV do universo quando ele mudou em disco (ex.: processo novo)."""
+    global _tipo_index_mtime
+    try:
+        mtime = os.path.getmtime(ATIVOS_CSV)
+    except OSError:
+        return
+    if mtime == _tipo_index_mtime:
+        return
+    _tipo_index_mtime = mtime
+    try:
+        set_classification_index(pd.read_csv(ATIVOS_CSV, usecols=["ticker", "tipo"], dtype=str).dropna())
+    except (ValueError, OSError) as e:
+        logger.warning("Índice de classificação indisponível: %s", e)
+
 
 def classify_ticker(ticker: str) -> str:
-    """Classifica o tipo do ativo pelo sufixo do ticker."""
+    """Tipo do ativo pelo índice das listagens; na falta dele, pelo sufixo do ticker."""
     t = ticker.upper()
+    _ensure_index()
+    tipo = _tipo_index.get(t)
+    if tipo is not None:
+        CLASSIFICATION_STATS["indice"] += 1
+        return tipo
+    CLASSIFICATION_STATS["heuristica"] += 1
     if t in ETFS_BR:
         return "ETF"
     if t.endswith("11"):
@@ -26,6 +80,15 @@ def classify_ticker(ticker: str) -> str:
     return "Ação"
 
 
+def _brapi_dy(record: dict) -> float:
+    """DY (%) presente no registro da Brapi, quando o plano/endpoint o inclui; senão 0."""
+    for key in ("dividendYield", "dividend_yield", "dy"):
+        v = record.get(key)
+        if isinstance(v, (int, float)) and 0 < v < 100:
+            return float(v)
+    return 0.0
+
+
 def _build_ativos_list() -> list[dict]:
     """Monta lista unificada de FIIs, ETFs e Ações com preços da Brapi."""
     now_str = datetime.now().strftime("%Y-%m-%d %H:%M")
@@ -42,21 +105,22 @@ def _build_ativos_list() -> list[dict]:
             "nome": s.get("name", ticker),
             "tipo": tipo,
             "preco_atual": float(s.get("close") or 0.0),
-            "dy_12m": 0.0,
+            "dy_12m": _brapi_dy(s),
             "data_atualizacao": now_str if s.get("close") else "",
         })
 
-    # Ações (exclui fundos e BDRs)
+    # Ações, incluindo units (TAEE11, SANB11...); exclui fundos já listados e BDRs
+    fundos = {a["ticker"] for a in ativos}
     for s in fetch_ativos_from_brapi("stock"):
         ticker = s.get("stock", "").upper()
-        if ticker.endswith("11") or ticker.endswith("34") or ticker.endswith("32"):
+        if not ticker or ticker in fundos or ticker.endswith(_BDR_SUFFIXES):
             continue
         ativos.append({
             "ticker": ticker,
             "nome": s.get("name", ticker),
-            "tipo": "Ação",
+            "tipo": "ETF" if ticker in ETFS_BR else "Ação",
             "preco_atual": float(s.get("close") or 0.0),
-            "dy_12m": 0.0,
+            "dy_12m": _brapi_dy(s),
             "data_atualizacao": now_str if s.get("close") else "",
         })
 
@@ -76,33 +140,371 @@ def _build_ativos_list() -> list[dict]:
     return ativos
 
 
-def load_ativos_list() -> pd.DataFrame:
+class AssetUniverse:
+    """
+    Universo de ativos indexado por ticker.
+
+    `df` mantém o formato do CSV (uma linha por ticker); o índice ticker →
+    posição torna as consultas O(1) e permite aplicar um lote de resultados
+    com uma atribuição vetorizada por coluna. As mudanças vão para um arquivo
+    delta (só as linhas alteradas, em modo append), incorporado ao CSV
+    quando cresce demais. O mesmo universo é compartilhado pelas sessões
+    (threads): `_lock` serializa a escrita, o delta e o screener.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.drop_duplicates("ticker", keep="last").reset_index(drop=True)
+        self._index = pd.Index(self.df["ticker"])
+        self.version = 0
+        self._delta_rows = 0
+        self._screener: tuple[int, "AssetScreener"] | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def __contains__(self, ticker: str) -> bool:
+        return ticker in self._index
+
+    def get(self, ticker: str) -> dict | None:
+        """Linha do ticker como dict, ou None se fora do universo."""
+        pos = self._index.get_indexer([ticker])[0]
+        return None if pos < 0 else self.df.iloc[pos].to_dict()
+
+    def update_fields(self, values: dict[str, dict], persist: bool = True) -> int:
+        """
+        Aplica {ticker: {campo: valor}} de uma vez; cada ticker pode trazer
+        campos diferentes, e só os informados são alterados. Tickers fora do
+        universo são ignorados. Retorna quantas linhas mudaram.
+        """
+        frame = pd.DataFrame.from_dict(values, orient="index")
+        if frame.empty:
+            return 0
+        unknown = set(frame.columns) - (set(self.df.columns) - {"ticker"})
+        if unknown:
+            raise ValueError(f"Campos inválidos para o universo: {', '.join(sorted(unknown))}")
+        pos = self._index.get_indexer(frame.index)
+        known = pos >= 0
+        frame, pos = frame[known], pos[known]
+        if not len(pos):
+            return 0
+        watched = persist and bool(_HISTORY_FIELDS & set(frame.columns))
+        alerted = persist and bool(set(_ALERT_COLUMNS) & set(frame.columns))
+        with self._lock:
+            before = self.df.iloc[pos][_ALERT_COLUMNS] if alerted else None
+            for col in frame.columns:
+                # Lote com formatos mistos: campo ausente num ticker vira NaN no frame e não sobrescreve o valor atual
+                present = frame[col].notna().to_numpy()
+                self.df.iloc[pos[present], self.df.columns.get_loc(col)] = frame[col].to_numpy()[present]
+            self.version += 1
+            if persist:
+                self._persist(pos)
+            after = self.df.iloc[pos] if watched or alerted else None
+        if after is not None:
+            if watched:
+                _record_history(after)
+            if alerted:
+                _notify_alerts(after, before)
+        return len(pos)
+
+    def _persist(self, pos: np.ndarray) -> None:
+        """Acrescenta as linhas alteradas ao delta; compacta no CSV quando ele cresce demais (sob `_lock`)."""
+        global _universe_key
+        self._delta_rows += len(pos)
+        if self._delta_rows > DELTA_COMPACT_RATIO * len(self.df):
+            save_ativos_list(self.df)
+            self._delta_rows = 0
+        else:
+            os.makedirs(DATA_DIR, exist_ok=True)
+            header = not os.path.exists(ATIVOS_DELTA_CSV)
+            self.df.iloc[pos].to_csv(ATIVOS_DELTA_CSV, mode="a", header=header, index=False, encoding="utf-8")
+        if _universe is self:
+            _universe_key = universe_version()  # a própria escrita não invalida o universo em memória
+
+    def screener(self) -> "AssetScreener":
+        """Screener da versão atual (reconstruído só depois de `update_fields`)."""
+        with self._lock:
+            if self._screener is None or self._screener[0] != self.version:
+                self._screener = (self.version, AssetScreener(self.df))
+            return self._screener[1]
+
+
+_universe: AssetUniverse | None = None
+_universe_key: tuple | None = None
+
+
+def _notify_alerts(new: pd.DataFrame, old: pd.DataFrame | None) -> None:
+    """
+    Avalia as regras de alerta só sobre as linhas cujo preço/DY mudou e libera
+    o aviso de desatualização das que foram atualizadas (falha no store não
+    impede a atualização).
+    """
+    store = get_alert_store(create=False)
+    if store is None:
+        return
+    try:
+        evaluate_changes(changes_between(old, new))
+        store.clear_stale(refreshed_between(old, new))
+    except sqlite3.Error as e:
+        logger.warning("Alertas não avaliados: %s", e)
+
+
+def _record_history(df: pd.DataFrame) -> None:
+    """Snapshot de preço/DY no histórico (falha de disco não impede a atualização do universo)."""
+    df = df[(df["preco_atual"] > 0) | (df["dy_12m"] > 0)]
+    try:
+        append_snapshot(df["ticker"], df["preco_atual"], df["dy_12m"])
+    except OSError as e:
+        logger.warning("Histórico de preço/DY não gravado: %s", e)
+
+
+def universe_version() -> tuple[float, float | None] | None:
+    """(mtime do CSV, mtime do delta) do universo em disco, ou None se não houver CSV."""
+    try:
+        base = os.path.getmtime(ATIVOS_CSV)
+    except OSError:
+        return None
+    try:
+        delta = os.path.getmtime(ATIVOS_DELTA_CSV)
+    except OSError:
+        delta = None
+    return base, delta
+
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df["ticker"] = df["ticker"].str.upper().str.strip()
+    if "data_atualizacao" in df.columns:
+        # Texto mesmo quando o CSV só tem datas vazias (lidas como float NaN)
+        df["data_atualizacao"] = df["data_atualizacao"].fillna("").astype(str)
+    return df
+
+
+def _read_universe(classify: bool = True) -> AssetUniverse:
     """
-    Carrega lista de ativos com prioridade:
-    1. CSV em disco com menos de 30 min (cache local)
-    2. Brapi REST (lista + preços em uma chamada)
-    3. Fallback offline
+    CSV do universo com o delta aplicado por cima (última versão de cada
+    ticker). `classify=False` não alimenta o índice de classificação.
     """
-    if os.path.exists(ATIVOS_CSV):
+    df = pd.read_csv(ATIVOS_CSV)
+    has_tipo = "tipo" in df.columns  # CSV antigo sem tipo não alimenta o índice de classificação
+    for col, default in _COLUMN_DEFAULTS.items():
+        if col not in df.columns:
+            df[col] = default
+    universe = AssetUniverse(_normalize(df))
+    if os.path.exists(ATIVOS_DELTA_CSV):
+        delta = _normalize(pd.read_csv(ATIVOS_DELTA_CSV))
+        universe._delta_rows = len(delta)
+        delta = delta.drop_duplicates("ticker", keep="last").set_index("ticker")
+        universe.update_fields(delta[delta.columns.intersection(df.columns)].to_dict("index"), persist=False)
+        universe.version = 0
+    if has_tipo and classify:
+        set_classification_index(universe.df)
+    return universe
+
+
+def _previous_csv() -> pd.DataFrame | None:
+    """Universo vencido em disco (base das mudanças quando o processo ainda não o carregou)."""
+    try:
+        return _read_universe(classify=False).df
+    except Exception:
+        return None
+
+
+def get_universe(refresh: bool = True) -> AssetUniverse:
+    """
+    Universo com prioridade:
+    1. Memória, enquanto o CSV/delta em disco não mudam e o CSV tem menos de 30 min
+    2. CSV em disco com menos de 30 min (mais o delta)
+    3. Brapi REST (lista + preços em uma chamada), com DY em lote e, onde há
+       histórico local de proventos, DY recalculado sobre o preço novo
+    4. Fallback offline
+
+    Com `refresh=False` serve o que estiver em disco, de qualquer idade, sem
+    consultar as fontes (FileNotFoundError se o universo ainda não foi gerado).
+    """
+    global _universe, _universe_key
+    version = universe_version()
+    if version is not None and (not refresh or (time.time() - version[0]) / 60 < ATIVOS_CACHE_MIN):
+        if _universe is not None and version == _universe_key:
+            return _universe
         try:
-            age_min = (time.time() - os.path.getmtime(ATIVOS_CSV)) / 60
-            if age_min < 30:
-                df = pd.read_csv(ATIVOS_CSV)
-                df["ticker"] = df["ticker"].str.upper().str.strip()
-                for col, default in [("preco_atual", 0.0), ("dy_12m", 0.0),
-                                     ("data_atualizacao", ""), ("tipo", "FII")]:
-                    if col not in df.columns:
-                        df[col] = default
-                logger.info("CSV cache carregado (%.0f min atrás, %d ativos)", age_min, len(df))
-                return df
+            universe = _read_universe()
+            logger.info("CSV cache carregado (%.0f min atrás, %d ativos)",
+                        (time.time() - version[0]) / 60, len(universe))
+            _universe, _universe_key = universe, version
+            return universe
         except Exception as e:
+            if not refresh:
+                raise
             logger.warning("CSV corrompido, recriando: %s", e)
+    if not refresh:
+        raise FileNotFoundError(ATIVOS_CSV)
+    return refresh_universe()
+
 
+def refresh_universe() -> AssetUniverse:
+    """Reconstrói o universo a partir das fontes (itens 3 e 4 de `get_universe`), ignorando o cache."""
+    global _universe, _universe_key
+    previous = None
+    if get_alert_store(create=False) is not None:  # o universo anterior só serve aos alertas
+        previous = _universe.df if _universe is not None else _previous_csv()
     df = pd.DataFrame(_build_ativos_list()).sort_values(["tipo", "ticker"]).reset_index(drop=True)
+    df = fill_dy_bulk(df)
+    df = apply_local_dy(df)
     save_ativos_list(df)
+    set_classification_index(df)
+    _record_history(df)
+    _notify_alerts(df, previous)
+    _universe, _universe_key = AssetUniverse(df), universe_version()
+    return _universe
+
+
+def load_ativos_list() -> pd.DataFrame:
+    """Universo de ativos (uma linha por ticker), compartilhado: use `update_fields` para alterá-lo."""
+    return get_universe().df
+
+
+def fill_dy_bulk(df: pd.DataFrame, dy_bulk: dict[str, float] | None = None) -> pd.DataFrame:
+    """
+    Preenche `dy_12m` do universo inteiro a partir de respostas em lote
+    (uma por categoria), sem scraping por ticker. Ativos ausentes do lote
+    ficam como estão.
+    """
+    if dy_bulk is None:
+        dy_bulk = get_dy_bulk()
+    if not dy_bulk:
+        return df
+    dy = df["ticker"].map(dy_bulk)
+    mask = dy.notna()
+    df.loc[mask, "dy_12m"] = dy[mask] * 100
+    df.loc[mask, "data_atualizacao"] = datetime.now().strftime("%Y-%m-%d %H:%M")
+    logger.info("DY em lote: %d de %d ativos preenchidos", int(mask.sum()), len(df))
     return df
 
 
+def refresh_dy(df: pd.DataFrame, progress=None) -> dict[str, float]:
+    """
+    Atualiza o DY (%) dos ativos de `df`: primeiro pelas respostas em lote,
+    depois scraping por ticker só para as lacunas. `progress(feitos, total)`
+    é chamado a cada ticker do fallback. Retorna {ticker: DY %}.
+    """
+    dy_bulk = get_dy_bulk()
+    result = {t: dy_bulk[t] * 100 for t in df["ticker"] if t in dy_bulk}
+    gaps = df[~df["ticker"].isin(result.keys())]
+    logger.info("Atualização de DY: %d via lote, %d via scraping", len(result), len(gaps))
+    for i, (ticker, tipo) in enumerate(zip(gaps["ticker"], gaps["tipo"])):
+        dy = get_dy_estimate(ticker, tipo)
+        result[ticker] = (dy * 100) if dy is not None else 0.0
+        if progress:
+            progress(i + 1, len(gaps))
+    return result
+
+
 def save_ativos_list(df: pd.DataFrame) -> None:
+    """Grava o universo inteiro no CSV; o delta, já incorporado, é descartado."""
     os.makedirs(DATA_DIR, exist_ok=True)
     df.to_csv(ATIVOS_CSV, index=False, encoding="utf-8")
+    if os.path.exists(ATIVOS_DELTA_CSV):
+        os.remove(ATIVOS_DELTA_CSV)
+
+
+class AssetScreener:
+    """
+    Screener multicritério sobre o universo de ativos.
+
+    Na construção (uma vez por carga do universo) ordena as colunas numéricas
+    e guarda a permutação; cada filtro de faixa vira dois `searchsorted`. A
+    consulta parte do filtro mais seletivo e só avalia os demais sobre esses
+    candidatos, em vez de varrer o universo inteiro.
+    """
+
+    RANGE_COLS = ("preco_atual", "dy_12m", "atualizado_em")
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df.reset_index(drop=True)
+        ts = pd.to_datetime(self.df["data_atualizacao"], format="%Y-%m-%d %H:%M", errors="coerce")
+        self._cols = {
+            "preco_atual": self.df["preco_atual"].to_numpy(dtype=float),
+            "dy_12m": self.df["dy_12m"].to_numpy(dtype=float),
+            # Sem data = infinitamente antigo
+            "atualizado_em": ts.to_numpy(dtype="datetime64[ns]").astype("int64").astype(float),
+        }
+        self._cols["atualizado_em"][ts.isna().to_numpy()] = -np.inf
+        self._sorted = {}
+        for col, values in self._cols.items():
+            order = np.argsort(values, kind="stable")
+            self._sorted[col] = (order, values[order])
+        tipos = self.df["tipo"].astype("category")
+        self._tipo_codes = tipos.cat.codes.to_numpy()
+        self._tipo_lookup = {t: i for i, t in enumerate(tipos.cat.categories)}
+
+    def _range(self, col: str, lo: float | None, hi: float | None) -> tuple[int, int]:
+        _, values = self._sorted[col]
+        i = 0 if lo is None else int(np.searchsorted(values, lo, side="left"))
+        j = len(values) if hi is None else int(np.searchsorted(values, hi, side="right"))
+        return i, max(i, j)
+
+    def query(
+        self,
+        preco_min: float | None = None,
+        preco_max: float | None = None,
+        dy_min: float | None = None,
+        dy_max: float | None = None,
+        tipos: list[str] | None = None,
+        max_age_hours: float | None = None,
+        stale_hours: float | None = None,
+        sort_by: str | None = None,
+        ascending: bool = False,
+        top_k: int | None = None,
+        now: datetime | None = None,
+    ) -> pd.DataFrame:
+        """
+        Filtra por faixas de preço/DY (%), tipos e frescor (atualizados nas
+        últimas `max_age_hours` ou sem atualização há mais de `stale_hours`);
+        ordena por `sort_by` (ou mantém a ordem do universo) e retorna os
+        `top_k` primeiros.
+        """
+        filters = {}
+        if preco_min is not None or preco_max is not None:
+            filters["preco_atual"] = (preco_min, preco_max)
+        if dy_min is not None or dy_max is not None:
+            filters["dy_12m"] = (dy_min, dy_max)
+        if max_age_hours is not None or stale_hours is not None:
+            agora = pd.Timestamp(now or datetime.now())
+            lo = None if max_age_hours is None else float((agora - pd.Timedelta(hours=max_age_hours)).value)
+            hi = None if stale_hours is None else float((agora - pd.Timedelta(hours=stale_hours)).value) - 1
+            filters["atualizado_em"] = (lo, hi)
+
+        # Candidatos: o filtro de faixa mais seletivo, direto do índice ordenado
+        ranges = {col: self._range(col, lo, hi) for col, (lo, hi) in filters.items()}
+        if ranges:
+            best = min(ranges, key=lambda c: ranges[c][1] - ranges[c][0])
+            i, j = ranges.pop(best)
+            idx = self._sorted[best][0][i:j]
+        else:
+            idx = np.arange(len(self.df))
+
+        for col, (lo, hi) in filters.items():
+            if col not in ranges:
+                continue
+            v = self._cols[col][idx]
+            keep = np.ones(len(idx), dtype=bool)
+            if lo is not None:
+                keep &= v >= lo
+            if hi is not None:
+                keep &= v <= hi
+            idx = idx[keep]
+        if tipos:
+            codes = [self._tipo_lookup[t] for t in tipos if t in self._tipo_lookup]
+            idx = idx[np.isin(self._tipo_codes[idx], codes)]
+
+        if sort_by in self._cols:
+            key = self._cols[sort_by][idx]
+            key = key if ascending else -key
+            if top_k is not None and top_k < len(idx):
+                part = np.argpartition(key, top_k - 1)[:top_k]
+                idx = idx[part[np.argsort(key[part], kind="stable")]]
+            else:
+                idx = idx[np.argsort(key, kind="stable")]
+        else:
+            idx = np.sort(idx)[:top_k]
+        return self.df.iloc[idx]
@@ -0,0 +1,114 @@
+"""Histórico local de proventos por cota e DY trailing-12-meses calculado localmente.
+
+O histórico é buscado em lotes e atualizado de forma incremental (apenas
+pagamentos posteriores ao último já armazenado de cada ticker são
+acrescentados ao CSV). Com a soma dos últimos 12 meses em memória, recalcular
+o DY do universo inteiro após uma nova cotação é uma única divisão vetorizada,
+sem rede.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from config import DATA_DIR, DIVIDENDOS_CSV
+from api.prices import fetch_dividend_history
+
+logger = logging.getLogger(__name__)
+
+_COLS = ["ticker", "data", "valor"]
+_ttm_cache: dict = {}
+
+
+def load_dividend_history() -> pd.DataFrame:
+    """Histórico completo (ticker, data, valor por cota)."""
+    if not os.path.exists(DIVIDENDOS_CSV):
+        return pd.DataFrame(columns=_COLS)
+    try:
+        return pd.read_csv(DIVIDENDOS_CSV, dtype={"ticker": str, "data": str, "valor": float})
+    except Exception as e:
+        logger.warning("Histórico de dividendos ilegível: %s", e)
+        return pd.DataFrame(columns=_COLS)
+
+
+def update_dividend_history(tickers: list[str]) -> int:
+    """
+    Busca em lote os proventos novos de `tickers` e acrescenta ao histórico.
+    Para tickers já conhecidos, a busca começa no último pagamento armazenado.
+    Retorna quantas linhas novas foram gravadas.
+    """
+    tickers = sorted({t.upper() for t in tickers})
+    if not tickers:
+        return 0
+    hist = load_dividend_history()
+    last = hist.groupby("ticker")["data"].max() if not hist.empty else pd.Series(dtype=str)
+    known = [t for t in tickers if t in last.index]
+    new = [t for t in tickers if t not in last.index]
+
+    fetched = []
+    if known:
+        fetched.append(fetch_dividend_history(known, start=last[known].min()))
+    if new:
+        fetched.append(fetch_dividend_history(new))
+    fetched = [f for f in fetched if not f.empty]
+    if not fetched:
+        return 0
+    df_new = pd.concat(fetched, ignore_index=True)
+
+    # Mantém só o que é posterior ao último pagamento conhecido de cada ticker
+    corte = df_new["ticker"].map(last).fillna("")
+    df_new = df_new[df_new["data"] > corte].drop_duplicates(["ticker", "data"])
+    if df_new.empty:
+        return 0
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    header = not os.path.exists(DIVIDENDOS_CSV)
+    df_new[_COLS].to_csv(DIVIDENDOS_CSV, mode="a", header=header, index=False, encoding="utf-8")
+    _ttm_cache.clear()
+    logger.info("Histórico de dividendos: %d pagamentos novos para %d tickers",
+                len(df_new), df_new["ticker"].nunique())
+    return len(df_new)
+
+
+def ttm_dividends(as_of: datetime | None = None) -> pd.Series:
+    """Soma dos proventos por cota nos 12 meses até `as_of`, indexada por ticker (memoizada)."""
+    as_of = as_of or datetime.now()
+    try:
+        version = os.path.getmtime(DIVIDENDOS_CSV)
+    except OSError:
+        version = None
+    key = (version, as_of.strftime("%Y-%m-%d"))
+    if _ttm_cache.get("key") != key:
+        hist = load_dividend_history()
+        inicio = (as_of - timedelta(days=365)).strftime("%Y-%m-%d")
+        fim = as_of.strftime("%Y-%m-%d")
+        janela = hist[(hist["data"] > inicio) & (hist["data"] <= fim)]
+        _ttm_cache["key"] = key
+        _ttm_cache["ttm"] = janela.groupby("ticker")["valor"].sum()
+    return _ttm_cache["ttm"]
+
+
+def compute_dy(prices: pd.Series, ttm: pd.Series) -> pd.Series:
+    """DY (%) = proventos 12m / preço, alinhado pelo índice (ticker). NaN sem histórico ou sem preço."""
+    div = ttm.reindex(prices.index)
+    return (div / prices.where(prices > 0) * 100).astype(float)
+
+
+def local_dy(df: pd.DataFrame, as_of: datetime | None = None) -> pd.Series:
+    """DY (%) calculado sobre o histórico local, por ticker, só onde há histórico e preço."""
+    ttm = ttm_dividends(as_of)
+    if ttm.empty:
+        return pd.Series(dtype=float)
+    return compute_dy(df.set_index("ticker")["preco_atual"], ttm).dropna()
+
+
+def apply_local_dy(df: pd.DataFrame, as_of: datetime | None = None) -> pd.DataFrame:
+    """Recalcula `dy_12m` do universo onde há histórico local, em uma operação vetorizada."""
+    ttm = ttm_dividends(as_of)
+    if ttm.empty:
+        return df
+    dy = compute_dy(df.set_index("ticker")["preco_atual"], ttm).to_numpy()
+    mask = pd.notna(dy)
+    df.loc[mask, "dy_12m"] = dy[mask]
+    return df
@@ -0,0 +1,79 @@
+"""Exportação de tabelas sob demanda (CSV, Parquet e XLSX).
+
+Os arquivos só são gerados quando o usuário pede e ficam em cache pela versão
+dos dados (hash do conteúdo): gerar de novo o mesmo arquivo sem que a carteira
+tenha mudado não serializa nada. O CSV é produzido em blocos de linhas, o que
+permite gravar históricos grandes direto em disco sem montar o arquivo inteiro
+em memória.
+"""
+import hashlib
+import importlib.util
+import io
+import logging
+from typing import IO, Iterator
+
+import pandas as pd
+
+from cache import _MISSING, MemoryLRUCache
+
+logger = logging.getLogger(__name__)
+
+# formato → (extensão, MIME, módulo opcional necessário)
+FORMATS = {
+    "CSV": (".csv", "text/csv", None),
+    "Parquet": (".parquet", "application/vnd.apache.parquet", "pyarrow"),
+    "XLSX": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "openpyxl"),
+}
+CSV_CHUNK_ROWS = 10_000
+
+_exports = MemoryLRUCache(max_entries=16)
+
+
+def available_formats() -> list[str]:
+    """Formatos cujas dependências estão instaladas (CSV sempre disponível)."""
+    return [f for f, (_, _, mod) in FORMATS.items() if mod is None or importlib.util.find_spec(mod)]
+
+
+def data_version(df: pd.DataFrame) -> str:
+    """Versão dos dados: hash do conteúdo, índice e nomes das colunas."""
+    h = hashlib.blake2b(pd.util.hash_pandas_object(df, index=True).values.tobytes(), digest_size=16)
+    h.update(repr(list(df.columns)).encode())
+    return h.hexdigest()
+
+
+def iter_csv(df: pd.DataFrame, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[bytes]:
+    """CSV (UTF-8 com BOM, compatível com Excel) em blocos de `chunk_rows` linhas."""
+    yield df.head(0).to_csv(index=False).encode("utf-8-sig")
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode("utf-8")
+
+
+def write_export(df: pd.DataFrame, fmt: str, target: str | IO[bytes]) -> None:
+    """Grava `df` em `target` (caminho ou arquivo binário); o CSV é escrito bloco a bloco."""
+    if fmt == "CSV":
+        if isinstance(target, str):
+            with open(target, "wb") as f:
+                for chunk in iter_csv(df):
+                    f.write(chunk)
+        else:
+            for chunk in iter_csv(df):
+                target.write(chunk)
+    elif fmt == "Parquet":
+        df.to_parquet(target, index=False)
+    elif fmt == "XLSX":
+        df.to_excel(target, index=False, engine="openpyxl")
+    else:
+        raise ValueError(f"Formato de exportação desconhecido: {fmt}")
+
+
+def export_bytes(df: pd.DataFrame, fmt: str, version: str | None = None) -> bytes:
+    """Conteúdo do arquivo exportado, em cache por (formato, versão dos dados)."""
+    key = f"{fmt}:{version or data_version(df)}"
+    data = _exports.get(key)
+    if data is _MISSING:
+        buf = io.BytesIO()
+        write_export(df, fmt, buf)
+        data = buf.getvalue()
+        _exports.set(key, data, None)
+        logger.info("Exportação %s gerada: %d linhas, %d bytes", fmt, len(df), len(data))
+    return data
@@ -0,0 +1,326 @@
+"""Histórico compacto de preço e DY por ticker.
+
+Cada atualização do universo acrescenta um snapshot (ticker, instante, preço,
+DY) sem reescrever o que já existe. O histórico é particionado por mês
+(`data/historico/AAAA-MM/`):
+
+- `pendente/`: um arquivo `.npz` pequeno por snapshot (append-only);
+- `segmento/`: colunas `.npy` ordenadas por (ticker, instante), lidas por
+  memory-map — `tickers` (únicos, ordenados), `offsets` (linhas de cada
+  ticker), `t_first` (primeiro instante do ticker) e `dt` (diferenças entre
+  instantes consecutivos, em segundos), além de `preco` e `dy` em float32.
+
+A cada `COMPACT_EVERY` snapshots pendentes o mês é compactado no segmento.
+A compactação de um mês é serializada entre threads (lock por mês) e entre
+processos (app, CLI, API) por um lock de arquivo na partição; cada uma usa
+um diretório temporário próprio e só apaga os pendentes que leu.
+Meses com mais de `HISTORY_FULL_DAYS` dias ficam com um ponto por dia
+(o último) e meses além de `HISTORY_RETENTION_DAYS` são apagados. Uma
+consulta por intervalo só abre as partições dos meses do intervalo e, em
+cada uma, só as fatias dos tickers pedidos.
+"""
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from cache import _MISSING, MemoryLRUCache
+from config import HISTORY_DIR, HISTORY_FULL_DAYS, HISTORY_RETENTION_DAYS
+
+try:
+    import fcntl
+except ImportError:  # Windows: só o lock entre threads do processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+COMPACT_EVERY = 16
+_SEGMENT_COLUMNS = ("tickers", "offsets", "t_first", "dt", "preco", "dy")
+
+_queries = MemoryLRUCache(max_entries=64)
+_seq = itertools.count(1)  # next() é atômico: nomes únicos entre threads
+_last_retention: date | None = None
+# np.load interpreta o cabeçalho .npy com ast.literal_eval, que não é seguro entre
+# threads no Python 3.11 (sessões simultâneas do Streamlit); as leituras são serializadas
+_load_lock = threading.Lock()
+_month_locks: dict[str, threading.Lock] = {}
+_month_locks_guard = threading.Lock()
+
+
+def _partition(month: str) -> str:
+    return os.path.join(HISTORY_DIR, month)
+
+
+def _months(start: float, end: float) -> list[str]:
+    """Partições (AAAA-MM) que cobrem o intervalo [start, end] em segundos."""
+    first = datetime.fromtimestamp(start).replace(day=1)
+    last = datetime.fromtimestamp(end)
+    months = []
+    while first <= last:
+        months.append(first.strftime("%Y-%m"))
+        first = (first + timedelta(days=32)).replace(day=1)
+    return months
+
+
+def _utc_offset() -> int:
+    """Diferença (s) do fuso local para UTC: dias e datas do histórico seguem o horário local."""
+    return int(datetime.now().astimezone().utcoffset().total_seconds())
+
+
+def _touch_version() -> None:
+    os.makedirs(HISTORY_DIR, exist_ok=True)
+    with open(os.path.join(HISTORY_DIR, ".versao"), "w", encoding="utf-8") as f:
+        f.write(str(time.time_ns()))
+
+
+@contextmanager
+def _month_lock(month: str) -> Iterator[None]:
+    """Exclusão mútua da compactação do mês: entre threads e, via `flock`, entre processos."""
+    with _month_locks_guard:
+        lock = _month_locks.setdefault(month, threading.Lock())
+    part = _partition(month)
+    os.makedirs(part, exist_ok=True)
+    with lock, open(os.path.join(part, ".compactacao.lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)  # liberado ao fechar o arquivo
+        yield
+
+
+def history_version() -> int:
+    """Muda a cada escrita no histórico (invalida as consultas em cache)."""
+    try:
+        return os.stat(os.path.join(HISTORY_DIR, ".versao")).st_mtime_ns
+    except OSError:
+        return 0
+
+
+# ---- Escrita ----
+
+def append_snapshot(tickers, preco, dy, ts: float | None = None) -> int:
+    """Acrescenta um snapshot (mesmo instante para todos os tickers). Retorna o número de pontos."""
+    tickers = np.asarray(tickers, dtype=str)
+    if not len(tickers):
+        return 0
+    ts = int(ts if ts is not None else time.time())
+    month = datetime.fromtimestamp(ts).strftime("%Y-%m")
+    pending = os.path.join(_partition(month), "pendente")
+    os.makedirs(pending, exist_ok=True)
+    name = os.path.join(pending, f"{ts}_{os.getpid()}_{next(_seq)}")
+    np.savez(name + ".tmp.npz", ticker=tickers, ts=np.full(len(tickers), ts, dtype=np.int64),
+             preco=np.asarray(preco, dtype=np.float32), dy=np.asarray(dy, dtype=np.float32))
+    os.replace(name + ".tmp.npz", name + ".npz")  # leitores nunca veem arquivo pela metade
+    if len(_pending_files(month)) >= COMPACT_EVERY:
+        compact(month)
+    _touch_version()
+    if _last_retention != date.today():
+        apply_retention()
+    return len(tickers)
+
+
+def _pending_files(month: str) -> list[str]:
+    pending = os.path.join(_partition(month), "pendente")
+    try:
+        names = sorted(n for n in os.listdir(pending) if n.endswith(".npz") and not n.endswith(".tmp.npz"))
+    except OSError:
+        return []
+    return [os.path.join(pending, n) for n in names]
+
+
+def _read_pending(files: list[str]) -> pd.DataFrame:
+    frames = []
+    for path in files:
+        with _load_lock, np.load(path) as z:
+            frames.append(pd.DataFrame({"ticker": z["ticker"], "ts": z["ts"], "preco": z["preco"], "dy": z["dy"]}))
+    return pd.concat(frames, ignore_index=True) if frames else _empty()
+
+
+def _empty() -> pd.DataFrame:
+    return pd.DataFrame({"ticker": pd.Series(dtype=str), "ts": pd.Series(dtype=np.int64),
+                         "preco": pd.Series(dtype=np.float32), "dy": pd.Series(dtype=np.float32)})
+
+
+def _write_segment(month: str, df: pd.DataFrame, resolution: str) -> None:
+    """Grava o segmento do mês (substitui o anterior de forma atômica). Chamar com `_month_lock`."""
+    df = (df.sort_values(["ticker", "ts"], kind="stable")
+            .drop_duplicates(["ticker", "ts"], keep="last").reset_index(drop=True))
+    ticker = df["ticker"].to_numpy(dtype=str)
+    ts = df["ts"].to_numpy(dtype=np.int64)
+    tickers, starts = np.unique(ticker, return_index=True)
+    offsets = np.append(starts, len(df)).astype(np.int64)
+    dt = np.diff(ts, prepend=ts[:1]) if len(ts) else ts
+    dt[starts] = 0  # cada ticker recomeça em t_first
+    columns = {
+        "tickers": tickers,
+        "offsets": offsets,
+        "t_first": ts[starts],
+        "dt": dt.astype(np.uint32),
+        "preco": df["preco"].to_numpy(dtype=np.float32),
+        "dy": df["dy"].to_numpy(dtype=np.float32),
+    }
+    part = _partition(month)
+    tmp = tempfile.mkdtemp(prefix="segmento.", suffix=".tmp", dir=part)
+    for col, values in columns.items():
+        np.save(os.path.join(tmp, f"{col}.npy"), values)
+    with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"resolucao": resolution, "pontos": len(df)}, f)
+    final = os.path.join(part, "segmento")
+    old = tmp + ".old"
+    if os.path.exists(final):
+        os.replace(final, old)
+    os.replace(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def compact(month: str, daily: bool | None = None) -> None:
+    """Incorpora os snapshots pendentes ao segmento do mês; `daily` reduz a um ponto por dia."""
+    with _month_lock(month):
+        seg = _Segment.open(month)
+        files = _pending_files(month)  # só estes são incorporados e apagados
+        if not files and not (daily and seg and seg.resolution != "diaria"):
+            return  # outra compactação já incorporou os pendentes
+        df = pd.concat([seg.frame() if seg else _empty(), _read_pending(files)], ignore_index=True)
+        resolution = "diaria" if daily or (seg and seg.resolution == "diaria") else "completa"
+        if resolution == "diaria" and len(df):
+            df = df.assign(_dia=(df["ts"] + _utc_offset()) // 86400).sort_values("ts", kind="stable").groupby(["ticker", "_dia"], sort=False).tail(1)
+            df = df.drop(columns="_dia")
+        _write_segment(month, df, resolution)
+        for path in files:
+            os.remove(path)
+    logger.info("Histórico %s compactado: %d pontos (%s)", month, len(df), resolution)
+
+
+def apply_retention(now: datetime | None = None) -> None:
+    """Apaga meses além da retenção e reduz a um ponto por dia os meses antigos."""
+    global _last_retention
+    now = now or datetime.now()
+    _last_retention = now.date()
+    try:
+        months = sorted(m for m in os.listdir(HISTORY_DIR) if len(m) == 7 and m[4] == "-")
+    except OSError:
+        return
+    for month in months:
+        end = (datetime.strptime(month, "%Y-%m") + timedelta(days=32)).replace(day=1)
+        age = (now - end).days
+        if age > HISTORY_RETENTION_DAYS:
+            shutil.rmtree(_partition(month), ignore_errors=True)
+            logger.info("Histórico %s removido (retenção de %d dias)", month, HISTORY_RETENTION_DAYS)
+        elif age > HISTORY_FULL_DAYS:
+            seg = _Segment.open(month)
+            if _pending_files(month) or (seg and seg.resolution != "diaria"):
+                compact(month, daily=True)
+    _touch_version()
+
+
+# ---- Leitura ----
+
+class _Segment:
+    """Colunas do segmento de um mês, por memory-map (só as fatias usadas são lidas do disco)."""
+
+    def __init__(self, path: str):
+        with _load_lock:
+            self.cols = {c: np.load(os.path.join(path, f"{c}.npy"), mmap_mode="r") for c in _SEGMENT_COLUMNS}
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.resolution = json.load(f).get("resolucao", "completa")
+
+    @classmethod
+    def open(cls, month: str) -> "_Segment | None":
+        path = os.path.join(_partition(month), "segmento")
+        return cls(path) if os.path.exists(os.path.join(path, "meta.json")) else None
+
+    def select(self, tickers: np.ndarray | None = None) -> pd.DataFrame:
+        """
+        Linhas de `tickers` (todos se None) em formato longo. Só as fatias
+        desses tickers são lidas; os instantes são reconstruídos a partir de
+        `t_first` e da soma acumulada de `dt` dentro de cada fatia.
+        """
+        names = self.cols["tickers"]
+        offsets = self.cols["offsets"]
+        if tickers is None:
+            i = np.arange(len(names))
+        else:
+            tickers = np.asarray(tickers, dtype=str)
+            i = np.searchsorted(names, tickers)
+            found = i < len(names)
+            found[found] = names[i[found]] == tickers[found]
+            i = np.unique(i[found])
+        if not len(i):
+            return _empty()
+        a = np.asarray(offsets[i], dtype=np.int64)
+        counts = np.asarray(offsets[i + 1], dtype=np.int64) - a
+        first = np.cumsum(counts) - counts                  # início de cada fatia no resultado
+        rows = np.repeat(a - first, counts) + np.arange(counts.sum())
+        dt = np.asarray(self.cols["dt"][rows], dtype=np.int64)
+        cum = np.cumsum(dt)
+        ts = np.repeat(np.asarray(self.cols["t_first"][i]) - (cum[first] - dt[first]), counts) + cum
+        return pd.DataFrame({"ticker": np.repeat(np.asarray(names[i]), counts), "ts": ts,
+                             "preco": np.asarray(self.cols["preco"][rows]), "dy": np.asarray(self.cols["dy"][rows])})
+
+    def frame(self) -> pd.DataFrame:
+        """Segmento inteiro em formato longo (usado na compactação)."""
+        return self.select()
+
+
+def query(tickers: list[str], start: datetime, end: datetime | None = None) -> pd.DataFrame:
+    """
+    Pontos de `tickers` entre `start` e `end` (padrão: agora), em formato
+    longo: ticker, data (horário local), preco, dy. Em cache pela versão do histórico.
+    """
+    t0 = start.timestamp()
+    t1 = (end or datetime.now()).timestamp()
+    key = (tuple(tickers), int(t0) // 60, int(t1) // 60, history_version())
+    result = _queries.get(key)
+    if result is not _MISSING:
+        return result
+
+    wanted = np.unique(np.asarray(tickers, dtype=str))
+    frames = []
+    for month in _months(t0, t1):
+        seg = _Segment.open(month)
+        if seg is not None:
+            frames.append(seg.select(wanted))
+        pending = _read_pending(_pending_files(month))
+        if len(pending):
+            frames.append(pending[pending["ticker"].isin(wanted)])
+    df = pd.concat(frames, ignore_index=True) if frames else _empty()
+    df = df[(df["ts"] >= t0) & (df["ts"] <= t1)].sort_values(["ticker", "ts"], kind="stable")
+    result = pd.DataFrame({
+        "ticker": df["ticker"].to_numpy(),
+        "data": pd.to_datetime(df["ts"].to_numpy() + _utc_offset(), unit="s"),
+        "preco": df["preco"].to_numpy(dtype=float),
+        "dy": df["dy"].to_numpy(dtype=float),
+    })
+    _queries.set(key, result, None)
+    return result
+
+
+def sparklines(tickers: list[str], field: str = "dy", days: int = 90, points: int = 30) -> list[list[float]]:
+    """
+    Série recente de `field` ("dy" ou "preco") de cada ticker, com no máximo
+    `points` pontos, na ordem de `tickers` (lista vazia sem histórico).
+    Formato da `st.column_config.LineChartColumn`.
+    """
+    start = datetime.now() - timedelta(days=days)
+    key = ("sparklines", tuple(tickers), field, points, int(start.timestamp()) // 60, history_version())
+    out = _queries.get(key)
+    if out is not _MISSING:
+        return out
+    df = query(list(tickers), start)
+    values = df[field].to_numpy()
+    names, first, counts = np.unique(df["ticker"].to_numpy(dtype=str), return_index=True, return_counts=True)
+    series = {}
+    for name, a, n in zip(names, first, counts):
+        idx = a + (np.linspace(0, n - 1, points).round().astype(int) if n > points else np.arange(n))
+        series[name] = np.round(values[idx], 4).tolist()
+    out = [series.get(t, []) for t in tickers]
+    _queries.set(key, out, None)
+    return out
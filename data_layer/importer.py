@@ -0,0 +1,248 @@
+"""Importação em lote de extratos de negociação (B3 / corretoras) em CSV ou XLSX.
+
+O arquivo é lido em blocos (`chunksize` linhas por vez; XLSX em modo
+read-only), cada bloco é validado de forma vetorizada e reduzido a colunas
+compactas (data, ticker, quantidade com sinal, preço). Só essas colunas
+compactas do extrato inteiro ficam em memória, porque a ordenação
+cronológica e a deduplicação precisam de todas as operações (algumas dezenas
+de bytes por linha). Compra e venda do mesmo ticker no mesmo dia são day
+trade. As operações já registradas são descartadas, as demais são aplicadas
+em ordem cronológica sobre um dicionário de posições, com a mesma semântica
+de preço médio de `upsert_position`, e a carteira é persistida uma única vez
+ao final (no SQLite, leitura, recálculo e escrita numa só transação).
+"""
+import csv
+import logging
+from datetime import date
+from typing import IO, Iterator
+
+import numpy as np
+import pandas as pd
+
+from config import DEFAULT_PORTFOLIO_ID, STORAGE_BACKEND
+from data_layer.portfolio import load_portfolio, save_portfolio
+from data_layer.storage import get_store
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalhos aceitos (normalizados para minúsculas, sem espaços nas pontas)
+_ALIASES = {
+    "data": ["data do negócio", "data do negocio", "data", "data pregão", "data pregao", "data da operação"],
+    "movimento": ["tipo de movimentação", "tipo de movimentacao", "c/v", "compra/venda", "operação", "operacao"],
+    "ticker": ["código de negociação", "codigo de negociacao", "ticker", "ativo", "código", "codigo"],
+    "quantidade": ["quantidade", "qtde", "qtd"],
+    "preco": ["preço", "preco", "preço unitário", "preco unitario", "preço médio", "preco medio"],
+}
+_VENDA = ("V", "VENDA", "S", "SELL")
+_TICKER_RE = r"^[A-Z]{4}\d{1,2}$"
+
+
+def _cell(value):
+    """Célula nativa do XLSX como texto inequívoco (datas em ISO, números com vírgula decimal)."""
+    if isinstance(value, date):  # datetime também é date
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, float):
+        return repr(value).replace(".", ",")  # 1.234 não pode virar milhar
+    return value
+
+
+def _read_chunks(source: str | IO, filename: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Gera blocos de linhas (todas as colunas como texto) do CSV ou XLSX."""
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        from openpyxl import load_workbook  # dependência opcional: só para XLSX
+
+        wb = load_workbook(source, read_only=True, data_only=True)
+        try:
+            rows = wb.active.iter_rows(values_only=True)
+            header = [str(h or "").strip() for h in next(rows, [])]
+            buf = []
+            for row in rows:
+                buf.append(tuple(_cell(v) for v in row))
+                if len(buf) >= chunksize:
+                    yield pd.DataFrame(buf, columns=header).astype(str)
+                    buf = []
+            if buf:
+                yield pd.DataFrame(buf, columns=header).astype(str)
+        finally:
+            wb.close()
+        return
+
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            sample = f.read(4096)
+    else:
+        sample = source.read(4096)
+        source.seek(0)
+    text = sample.decode("utf-8-sig", errors="ignore")
+    try:
+        sep = csv.Sniffer().sniff(text.splitlines()[0] if text else ",", delimiters=",;\t").delimiter
+    except csv.Error:
+        sep = ";" if text.count(";") > text.count(",") else ","
+    yield from pd.read_csv(source, sep=sep, dtype=str, chunksize=chunksize,
+                           encoding="utf-8-sig", skip_blank_lines=True)
+
+
+def _parse_date(s: pd.Series) -> pd.Series:
+    """
+    Datas ISO ('2026-01-12', '2026-01-12 00:00:00') ou brasileiras ('12/01/2026').
+    Cada formato é tentado explicitamente: `dayfirst` trocaria dia e mês das ISO.
+    """
+    s = s.str.strip().str.split(r"[ T]", n=1, regex=True).str[0]
+    iso = pd.to_datetime(s, format="%Y-%m-%d", errors="coerce")
+    return iso.fillna(pd.to_datetime(s, format="%d/%m/%Y", errors="coerce"))
+
+
+def _parse_number(s: pd.Series) -> pd.Series:
+    """
+    Números em formato brasileiro ou internacional ('1.234,56', '1.000',
+    '1,234.56', '1234.56', 'R$ 10,00'). O ponto é separador de milhar quando a
+    vírgula é o decimal ou quando agrupa os dígitos de três em três.
+    """
+    s = s.str.replace("R$", "", regex=False).str.strip()
+    comma, dot = s.str.rfind(","), s.str.rfind(".")
+    intl = (comma >= 0) & (dot > comma)  # '1,234.56': vírgula de milhar
+    br = ((comma >= 0) & ~intl) | s.str.fullmatch(r"-?[1-9]\d{0,2}(\.\d{3})+")
+    s = s.where(~intl, s.str.replace(",", "", regex=False))
+    s = s.where(~br, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    return pd.to_numeric(s, errors="coerce")
+
+
+def validate_chunk(chunk: pd.DataFrame) -> tuple[pd.DataFrame, int]:
+    """
+    Normaliza e valida um bloco de forma vetorizada.
+    Retorna (operações válidas [data, ticker, quantity, price], nº de linhas descartadas).
+    """
+    cols = {c.strip().lower(): c for c in chunk.columns}
+    found = {}
+    for field, aliases in _ALIASES.items():
+        found[field] = next((cols[a] for a in aliases if a in cols), None)
+    missing = [f for f in ("data", "ticker", "quantidade", "preco") if found[f] is None]
+    if missing:
+        raise ValueError(f"Colunas obrigatórias ausentes no extrato: {', '.join(missing)}")
+
+    data = _parse_date(chunk[found["data"]].fillna(""))
+    ticker = chunk[found["ticker"]].fillna("").str.strip().str.upper()
+    ticker = ticker.str.replace(r"^([A-Z]{4}\d{1,2})F$", r"\1", regex=True)  # mercado fracionário
+    qty = _parse_number(chunk[found["quantidade"]].fillna(""))
+    price = _parse_number(chunk[found["preco"]].fillna(""))
+    if found["movimento"] is not None:
+        venda = chunk[found["movimento"]].fillna("").str.strip().str.upper().isin(_VENDA)
+        qty = qty.abs().where(~venda, -qty.abs())
+
+    ok = (data.notna() & ticker.str.match(_TICKER_RE) & qty.notna() & (qty != 0)
+          & (qty == qty.round()) & price.notna() & (price > 0))
+    valid = pd.DataFrame({
+        "data": data[ok].to_numpy(dtype="datetime64[ns]"),
+        "ticker": ticker[ok].to_numpy(),
+        "quantity": qty[ok].to_numpy(dtype=np.int64),
+        "price": price[ok].to_numpy(dtype=float),
+    })
+    return valid, int((~ok).sum())
+
+
+def flag_day_trades(ops: pd.DataFrame) -> pd.Series:
+    """Operações de (data, ticker) com compra e venda no mesmo dia: day trade."""
+    lado = np.sign(ops["quantity"])
+    grupos = lado.groupby([ops["data"], ops["ticker"]])
+    return (grupos.transform("max") > 0) & (grupos.transform("min") < 0)
+
+
+def dedupe(ops: pd.DataFrame, existing: list[dict]) -> pd.DataFrame:
+    """
+    Remove do lote as operações já registradas (mesma data, ticker, quantidade
+    e preço), contando repetições: duas compras idênticas no mesmo dia seguem
+    valendo duas, mas reimportar o mesmo extrato não duplica as posições.
+    """
+    if ops.empty or not existing:
+        return ops
+    keys = ["data", "ticker", "quantity", "price"]
+    hist = pd.DataFrame(existing, columns=keys)
+    hist = hist.assign(data=hist["data"].astype(str).str[:10], quantity=hist["quantity"].astype(np.int64),
+                       price=hist["price"].astype(float).round(6))
+    vistas = hist.groupby(keys).size().rename("vistas")
+    lote = ops.assign(data=ops["data"].dt.strftime("%Y-%m-%d"), price=ops["price"].round(6))[keys]
+    ja_vistas = lote.join(vistas, on=keys)["vistas"].fillna(0)
+    return ops[(lote.groupby(keys).cumcount() >= ja_vistas).to_numpy()].reset_index(drop=True)
+
+
+def replay(ops: pd.DataFrame, positions: list[dict]) -> tuple[list[dict], list[dict]]:
+    """
+    Aplica as operações (em ordem cronológica) sobre as posições, com a mesma
+    semântica de preço médio de `upsert_position` (compra day trade fora do PM
+    de swing). Retorna (posições, operações com o PM vigente antes de cada uma).
+    """
+    state = {p["ticker"]: [p["quantity"], p["avg_price"]] for p in positions}
+    pm_antes = np.empty(len(ops))
+    tickers, qtys, prices = ops["ticker"].to_numpy(), ops["quantity"].to_numpy(), ops["price"].to_numpy()
+    day_trades = (ops["day_trade"] if "day_trade" in ops.columns else pd.Series(False, index=ops.index)).to_numpy()
+    for i in range(len(ops)):
+        pos = state.setdefault(tickers[i], [0, 0.0])
+        old_qty, old_pm = pos
+        pm_antes[i] = old_pm
+        new_qty = old_qty + int(qtys[i])
+        if new_qty <= 0:
+            pos[0], pos[1] = 0, 0
+        elif qtys[i] > 0 and not (day_trades[i] and old_qty > 0):
+            pos[0], pos[1] = new_qty, (old_qty * old_pm + qtys[i] * prices[i]) / new_qty
+        else:
+            pos[0] = new_qty
+
+    positions = [{"ticker": t, "quantity": int(q), "avg_price": float(pm)} for t, (q, pm) in state.items() if q > 0]
+    operations = pd.DataFrame({
+        "data": ops["data"].dt.strftime("%Y-%m-%d"),
+        "ticker": tickers,
+        "quantity": qtys.astype(int),
+        "price": prices,
+        "avg_price": pm_antes,
+        "day_trade": day_trades.astype(bool),
+    }).to_dict("records")
+    return positions, operations
+
+
+def import_statement(source: str | IO, filename: str | None = None,
+                     portfolio_id: str = DEFAULT_PORTFOLIO_ID, chunksize: int = 50_000) -> dict:
+    """
+    Importa um extrato para a carteira. Retorna um resumo com linhas
+    importadas, descartadas, já importadas antes (duplicadas), tickers
+    afetados e período coberto.
+    """
+    filename = filename or (source if isinstance(source, str) else "extrato.csv")
+    parts, descartadas = [], 0
+    for chunk in _read_chunks(source, filename, chunksize):
+        valid, bad = validate_chunk(chunk)
+        descartadas += bad
+        if not valid.empty:
+            valid["ticker"] = valid["ticker"].astype("category")
+            parts.append(valid)
+    if not parts:
+        return {"importadas": 0, "descartadas": descartadas, "duplicadas": 0, "tickers": 0, "periodo": None}
+
+    ops = pd.concat(parts, ignore_index=True)
+    ops["ticker"] = ops["ticker"].astype(str)
+    ops = ops.sort_values("data", kind="stable").reset_index(drop=True)
+    ops["day_trade"] = flag_day_trades(ops)  # no extrato inteiro, antes de descartar as já importadas
+    novas = ops
+
+    def merge(positions: list[dict], existing: list[dict]) -> tuple[list[dict], list[dict]]:
+        nonlocal novas
+        novas = dedupe(ops, existing)
+        return replay(novas, positions)
+
+    if STORAGE_BACKEND == "sqlite":
+        get_store().import_batch(portfolio_id, merge)  # leitura, recálculo e escrita numa transação
+    else:
+        portfolio = load_portfolio(portfolio_id)
+        portfolio["positions"], operations = merge(portfolio["positions"], portfolio.get("operations", []))
+        portfolio.setdefault("operations", []).extend(operations)
+        save_portfolio(portfolio, portfolio_id)
+
+    resumo = {
+        "importadas": len(novas),
+        "descartadas": descartadas,
+        "duplicadas": len(ops) - len(novas),
+        "tickers": int(novas["ticker"].nunique()),
+        "periodo": (novas["data"].iloc[0].strftime("%Y-%m-%d"),
+                    novas["data"].iloc[-1].strftime("%Y-%m-%d")) if len(novas) else None,
+    }
+    logger.info("Extrato importado em '%s': %s", portfolio_id, resumo)
+    return resumo
@@ -0,0 +1,133 @@
+"""Modelo incremental de métricas da carteira.
+
+`calc_portfolio_metrics` reavalia a carteira inteira (universo, preços e DY de
+cada posição). O `PortfolioMetrics` guarda as linhas por ticker e os totais
+correntes; uma operação ou nova cotação atualiza só a linha afetada e aplica a
+diferença aos totais, em O(1). `what_if` avalia operações hipotéticas numa
+cópia, sem persistir nada.
+"""
+import logging
+import time
+from typing import Callable, Iterable
+
+import pandas as pd
+
+from data_layer.assets import ATIVOS_CACHE_MIN, classify_ticker, get_universe, universe_version
+from data_layer.portfolio import calc_portfolio_metrics, market_quote, position_row, summarize
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = ["Ticker", "Tipo", "Qtde", "PM (R$)", "Preço Atual (R$)", "Variação (%)",
+            "DY/Yield 12m (%)", "Valor de Mercado (R$)", "Renda Mensal Est. (R$)"]
+
+
+def _default_quote(ticker: str, asset_type: str) -> tuple[float, float]:
+    return market_quote(get_universe(), ticker, asset_type)
+
+
+def portfolio_signature(portfolio: dict) -> int:
+    """Assinatura das posições (ticker, qtde, PM), independente da ordem."""
+    return hash(frozenset((p["ticker"], p["quantity"], p["avg_price"])
+                          for p in portfolio["positions"] if p["quantity"] > 0))
+
+
+class PortfolioMetrics:
+    """Linhas de métricas por ticker e totais correntes (patrimônio e renda mensal)."""
+
+    def __init__(self, rows: Iterable[dict] = (),
+                 quote: Callable[[str, str], tuple[float, float]] | None = None,
+                 universe: tuple | None = None):
+        self._rows = {r["Ticker"]: r for r in rows}
+        self._patrimonio = sum(r["Valor de Mercado (R$)"] for r in self._rows.values())
+        self._renda = sum(r["Renda Mensal Est. (R$)"] for r in self._rows.values())
+        self._quote = quote or _default_quote
+        self._frame: pd.DataFrame | None = None
+        self.universe = universe
+
+    @classmethod
+    def from_portfolio(cls, portfolio: dict) -> "PortfolioMetrics":
+        """Avaliação completa (uma vez); as próximas mudanças são incrementais."""
+        df, _ = calc_portfolio_metrics(portfolio)
+        return cls(df.to_dict("records"), universe=universe_version())
+
+    # ---- Leitura ----
+
+    def is_current(self, portfolio: dict) -> bool:
+        """Se o modelo ainda reflete a carteira persistida e um universo dentro do TTL."""
+        u = universe_version()
+        return (u is not None and u == self.universe and time.time() - u[0] < ATIVOS_CACHE_MIN * 60
+                and self.signature() == portfolio_signature(portfolio))
+
+    @property
+    def totals(self) -> dict:
+        return summarize(self._patrimonio, self._renda)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Tabela no formato de `calc_portfolio_metrics` (reconstruída só após mudanças)."""
+        if self._frame is None:
+            self._frame = pd.DataFrame(list(self._rows.values()), columns=_COLUMNS) if self._rows \
+                else pd.DataFrame()
+        return self._frame
+
+    def signature(self) -> int:
+        """Mesma assinatura de `portfolio_signature` para as posições do modelo."""
+        return hash(frozenset((t, r["Qtde"], r["PM (R$)"]) for t, r in self._rows.items()))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    # ---- Atualizações incrementais ----
+
+    def _replace(self, ticker: str, row: dict | None) -> None:
+        old = self._rows.pop(ticker, None)
+        if old is not None:
+            self._patrimonio -= old["Valor de Mercado (R$)"]
+            self._renda -= old["Renda Mensal Est. (R$)"]
+        if row is not None:
+            self._rows[ticker] = row
+            self._patrimonio += row["Valor de Mercado (R$)"]
+            self._renda += row["Renda Mensal Est. (R$)"]
+        self._frame = None
+
+    def apply(self, ticker: str, quantity: int, price: float, day_trade: bool = False) -> None:
+        """Compra (+) ou venda (-) com a semântica de PM de `upsert_position`."""
+        ticker = ticker.upper()
+        row = self._rows.get(ticker)
+        if row is None:
+            if quantity <= 0:
+                return
+            asset_type = classify_ticker(ticker)
+            market, dy = self._quote(ticker, asset_type)
+            self._replace(ticker, position_row(ticker, asset_type, quantity, price, market, dy))
+            return
+        old_qty, old_pm = row["Qtde"], row["PM (R$)"]
+        new_qty = old_qty + quantity
+        if new_qty <= 0:
+            self._replace(ticker, None)
+            return
+        swing_buy = quantity > 0 and not (day_trade and old_qty > 0)
+        pm = (old_qty * old_pm + quantity * price) / new_qty if swing_buy else old_pm
+        self._replace(ticker, position_row(ticker, row["Tipo"], new_qty, pm,
+                                           row["Preço Atual (R$)"], row["DY/Yield 12m (%)"]))
+
+    def apply_price(self, ticker: str, price: float, dy: float | None = None) -> bool:
+        """Nova cotação (e, opcionalmente, DY %) de um ticker da carteira. Retorna se mudou algo."""
+        row = self._rows.get(ticker.upper())
+        if row is None:
+            return False
+        dy = row["DY/Yield 12m (%)"] if dy is None else dy
+        if price == row["Preço Atual (R$)"] and dy == row["DY/Yield 12m (%)"]:
+            return False
+        self._replace(row["Ticker"], position_row(row["Ticker"], row["Tipo"], row["Qtde"],
+                                                  row["PM (R$)"], price, dy))
+        return True
+
+    def what_if(self, operations: Iterable[tuple[str, int, float]]) -> "PortfolioMetrics":
+        """Cópia com as operações (ticker, qtde, preço) aplicadas; o modelo original não muda."""
+        other = PortfolioMetrics.__new__(PortfolioMetrics)
+        other.__dict__.update(self.__dict__)
+        other._rows = dict(self._rows)  # as linhas são substituídas, nunca alteradas no lugar
+        other._frame = None
+        for ticker, quantity, price in operations:
+            other.apply(ticker, quantity, price)
+        return other
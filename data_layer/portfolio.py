@@ -2,59 +2,93 @@
 import json
 import logging
 import os
+import threading
+from datetime import datetime
 
 import pandas as pd
-import streamlit as st
 
-from config import DATA_DIR, PORTFOLIO_JSON, ASSET_CONFIG
+from config import DATA_DIR, DEFAULT_PORTFOLIO_ID, PORTFOLIO_JSON, STORAGE_BACKEND, ASSET_CONFIG
 from api.prices import get_last_price
 from api.scraping import get_dy_estimate
-from data_layer.assets import load_ativos_list, classify_ticker
+from data_layer.assets import AssetUniverse, classify_ticker, get_universe
+from data_layer.storage import get_store
 
 logger = logging.getLogger(__name__)
 
 
-def load_portfolio() -> dict:
+def read_portfolio(portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> dict:
+    """
+    Lê uma carteira sem efeitos colaterais: um portfolio.json corrompido gera
+    `json.JSONDecodeError` em vez de ser recriado. Para leitores que não devem
+    escrever (API, CLI).
+    """
+    if STORAGE_BACKEND == "sqlite":
+        return get_store().load_portfolio(portfolio_id)
     if not os.path.exists(PORTFOLIO_JSON):
         return {"positions": []}
+    with open(PORTFOLIO_JSON, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if not content:
+        return {"positions": []}
+    data = json.loads(content)
+    if not isinstance(data, dict):
+        return {"positions": []}
+    data.setdefault("positions", [])
+    return data
+
+
+def load_portfolio(portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> dict:
+    """
+    Carrega uma carteira. No backend JSON existe apenas a carteira única do
+    arquivo; um portfolio.json corrompido é renomeado para
+    `portfolio.json.<data>.corrompido` (nada é sobrescrito) e a carteira começa vazia.
+    """
     try:
-        with open(PORTFOLIO_JSON, "r", encoding="utf-8") as f:
-            content = f.read().strip()
-            if not content:
-                return {"positions": []}
-            data = json.loads(content)
-            if not isinstance(data, dict):
-                return {"positions": []}
-            data.setdefault("positions", [])
-            return data
+        return read_portfolio(portfolio_id)
     except json.JSONDecodeError as e:
-        logger.error("portfolio.json corrompido: %s", e)
-        st.error(f"⚠️ Erro ao ler portfolio.json: {e}")
-        st.info("🔄 Criando novo portfolio...")
-        new = {"positions": []}
-        save_portfolio(new)
-        return new
+        backup = f"{PORTFOLIO_JSON}.{datetime.now():%Y%m%d-%H%M%S}.corrompido"
+        try:
+            os.replace(PORTFOLIO_JSON, backup)
+        except OSError as err:
+            logger.error("portfolio.json corrompido e não preservado (%s): %s", err, e)
+        else:
+            logger.error("portfolio.json corrompido, preservado em %s: %s", backup, e)
+        return {"positions": []}
     except Exception as e:
         logger.error("Erro inesperado ao carregar portfolio: %s", e)
-        st.error(f"❌ Erro inesperado: {e}")
         return {"positions": []}
 
 
-def save_portfolio(data: dict) -> None:
+def save_portfolio(data: dict, portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> None:
+    """Persiste a carteira; no JSON grava um temporário e troca com `os.replace` (leitores nunca veem meio arquivo)."""
     try:
+        if STORAGE_BACKEND == "sqlite":
+            get_store().save_portfolio(portfolio_id, data if isinstance(data, dict) else {})
+            return
         os.makedirs(DATA_DIR, exist_ok=True)
         if not isinstance(data, dict):
             data = {"positions": []}
         data.setdefault("positions", [])
-        with open(PORTFOLIO_JSON, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        tmp = f"{PORTFOLIO_JSON}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, PORTFOLIO_JSON)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
     except Exception as e:
         logger.error("Erro ao salvar portfolio: %s", e)
-        st.error(f"❌ Erro ao salvar portfolio: {e}")
+        raise
 
 
-def upsert_position(portfolio: dict, ticker: str, quantity: int, buy_price: float) -> None:
-    """Insere ou atualiza posição. Compra recalcula PM; venda mantém PM."""
+def upsert_position(portfolio: dict, ticker: str, quantity: int, buy_price: float,
+                    day_trade: bool = False) -> None:
+    """
+    Insere ou atualiza posição. Compra recalcula PM; venda mantém PM. Compra
+    day trade não entra no PM de swing trade (só vale como PM se a posição
+    estava zerada).
+    """
     ticker = ticker.upper()
     for pos in portfolio["positions"]:
         if pos["ticker"] == ticker:
@@ -63,7 +97,7 @@ def upsert_position(portfolio: dict, ticker: str, quantity: int, buy_price: floa
             if new_qty <= 0:
                 pos["quantity"] = 0
                 pos["avg_price"] = 0
-            elif quantity > 0:
+            elif quantity > 0 and not (day_trade and old_qty > 0):
                 pos["avg_price"] = (old_qty * old_pm + quantity * buy_price) / new_qty
                 pos["quantity"] = new_qty
             else:
@@ -74,13 +108,62 @@ def upsert_position(portfolio: dict, ticker: str, quantity: int, buy_price: floa
     })
 
 
+def record_operation(portfolio: dict, ticker: str, quantity: int, price: float,
+                     data: str | None = None, day_trade: bool = False) -> None:
+    """Registra a operação no histórico da carteira com o PM vigente antes dela."""
+    ticker = ticker.upper()
+    pm = next((p["avg_price"] for p in portfolio["positions"] if p["ticker"] == ticker), 0.0)
+    portfolio.setdefault("operations", []).append({
+        "data": data or datetime.now().strftime("%Y-%m-%d"),
+        "ticker": ticker,
+        "quantity": quantity,
+        "price": price,
+        "avg_price": pm,
+        "day_trade": day_trade,
+    })
+
+
+def load_operations(portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> pd.DataFrame:
+    """Histórico de operações com a classe de cada ativo, em ordem cronológica."""
+    if STORAGE_BACKEND == "sqlite":
+        ops = get_store().load_operations(portfolio_id)
+    else:
+        ops = load_portfolio(portfolio_id).get("operations", [])
+    df = pd.DataFrame(ops, columns=["data", "ticker", "quantity", "price", "avg_price", "day_trade"])
+    tipos = {t: classify_ticker(t) for t in df["ticker"].unique()}
+    df["tipo"] = df["ticker"].map(tipos)
+    return df.sort_values("data", kind="stable").reset_index(drop=True)
+
+
+def apply_operation(ticker: str, quantity: int, price: float,
+                    portfolio_id: str = DEFAULT_PORTFOLIO_ID,
+                    data: str | None = None, day_trade: bool = False) -> None:
+    """
+    Aplica uma compra/venda, registra no histórico de operações e persiste.
+    No SQLite a operação é atômica por ticker, então sessões concorrentes na
+    mesma carteira não se sobrescrevem.
+    """
+    if STORAGE_BACKEND == "sqlite":
+        get_store().apply_operation(portfolio_id, ticker, quantity, price, data, day_trade)
+        return
+    portfolio = load_portfolio(portfolio_id)
+    record_operation(portfolio, ticker, quantity, price, data, day_trade)
+    upsert_position(portfolio, ticker, quantity, price, day_trade)
+    clean_positions(portfolio)
+    save_portfolio(portfolio, portfolio_id)
+
+
 def clean_positions(portfolio: dict) -> None:
     portfolio["positions"] = [p for p in portfolio["positions"] if p["quantity"] > 0]
 
 
-def calc_portfolio_metrics(portfolio: dict) -> tuple[pd.DataFrame, dict]:
-    """Calcula métricas de todas as posições. Usa CSV como cache, cai na API se necessário."""
-    df_ativos = load_ativos_list()
+def calc_portfolio_metrics(portfolio: dict, universe: AssetUniverse | None = None,
+                           fetch_missing: bool = True) -> tuple[pd.DataFrame, dict]:
+    """
+    Calcula métricas de todas as posições. Usa CSV como cache, cai na API se
+    necessário (`fetch_missing=False` nunca consulta as fontes externas).
+    """
+    universe = universe if universe is not None else get_universe()
     rows = []
 
     for p in portfolio["positions"]:
@@ -88,39 +171,49 @@ def calc_portfolio_metrics(portfolio: dict) -> tuple[pd.DataFrame, dict]:
         qty = p["quantity"]
         pm = p["avg_price"]
         asset_type = classify_ticker(ticker)
-
-        cached = df_ativos[df_ativos["ticker"] == ticker]
-        if not cached.empty and float(cached.iloc[0]["preco_atual"]) > 0:
-            price = float(cached.iloc[0]["preco_atual"])
-            dy = float(cached.iloc[0]["dy_12m"])  # já em %
-        else:
-            price = get_last_price(ticker) or 0.0
-            dy_raw = get_dy_estimate(ticker, asset_type)
-            dy = (dy_raw * 100) if dy_raw is not None else 0.0
-
-        market = qty * price
-        change = (price - pm) / pm * 100 if pm > 0 else 0.0
-        monthly_income = (dy / 100 * price / 12.0) * qty
-
-        rows.append({
-            "Ticker": ticker,
-            "Tipo": asset_type,
-            "Qtde": qty,
-            "PM (R$)": pm,
-            "Preço Atual (R$)": price,
-            "Variação (%)": change,
-            "DY/Yield 12m (%)": dy,
-            "Valor de Mercado (R$)": market,
-            "Renda Mensal Est. (R$)": monthly_income,
-        })
+        price, dy = market_quote(universe, ticker, asset_type, fetch_missing)
+        rows.append(position_row(ticker, asset_type, qty, pm, price, dy))
 
     df = pd.DataFrame(rows)
     if not df.empty:
         pat = df["Valor de Mercado (R$)"].sum()
         renda = df["Renda Mensal Est. (R$)"].sum()
-        dy_medio = (renda * 12) / pat * 100 if pat > 0 else 0.0
-        totals = {"Patrimônio (R$)": pat, "Renda Mensal (R$)": renda, "DY Médio (%)": dy_medio}
+        totals = summarize(pat, renda)
     else:
-        totals = {"Patrimônio (R$)": 0.0, "Renda Mensal (R$)": 0.0, "DY Médio (%)": 0.0}
+        totals = summarize(0.0, 0.0)
 
     return df, totals
+
+
+def market_quote(universe: AssetUniverse, ticker: str, asset_type: str,
+                 fetch_missing: bool = True) -> tuple[float, float]:
+    """(preço, DY %) do ativo: universo em cache (busca O(1) pelo ticker); na falta de preço, API e scraping."""
+    row = universe.get(ticker)
+    if row is not None and float(row["preco_atual"]) > 0:
+        return float(row["preco_atual"]), float(row["dy_12m"])  # DY já em %
+    if not fetch_missing:
+        return 0.0, float(row["dy_12m"]) if row is not None else 0.0
+    price = get_last_price(ticker) or 0.0
+    dy_raw = get_dy_estimate(ticker, asset_type)
+    return price, (dy_raw * 100) if dy_raw is not None else 0.0
+
+
+def position_row(ticker: str, asset_type: str, qty: int, pm: float, price: float, dy: float) -> dict:
+    """Linha de métricas de uma posição (colunas da tabela da carteira)."""
+    return {
+        "Ticker": ticker,
+        "Tipo": asset_type,
+        "Qtde": qty,
+        "PM (R$)": pm,
+        "Preço Atual (R$)": price,
+        "Variação (%)": (price - pm) / pm * 100 if pm > 0 else 0.0,
+        "DY/Yield 12m (%)": dy,
+        "Valor de Mercado (R$)": qty * price,
+        "Renda Mensal Est. (R$)": (dy / 100 * price / 12.0) * qty,
+    }
+
+
+def summarize(patrimonio: float, renda: float) -> dict:
+    """Totais da carteira a partir do patrimônio e da renda mensal estimada."""
+    dy_medio = (renda * 12) / patrimonio * 100 if patrimonio > 0 else 0.0
+    return {"Patrimônio (R$)": patrimonio, "Renda Mensal (R$)": renda, "DY Médio (%)": dy_medio}
@@ -3,14 +3,15 @@ import json
 import logging
 import os
 
-import streamlit as st
-
-from config import DATA_DIR, PROVENTOS_JSON
+from config import DATA_DIR, DEFAULT_PORTFOLIO_ID, PROVENTOS_JSON, STORAGE_BACKEND
+from data_layer.storage import get_store
 
 logger = logging.getLogger(__name__)
 
 
-def load_proventos() -> list[dict]:
+def load_proventos(portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> list[dict]:
+    if STORAGE_BACKEND == "sqlite":
+        return get_store().load_proventos(portfolio_id)
     if not os.path.exists(PROVENTOS_JSON):
         return []
     try:
@@ -22,24 +23,37 @@ def load_proventos() -> list[dict]:
         return []
 
 
-def save_proventos(proventos: list[dict]) -> None:
+def save_proventos(proventos: list[dict], portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> None:
     try:
+        if STORAGE_BACKEND == "sqlite":
+            get_store().save_proventos(portfolio_id, proventos)
+            return
         os.makedirs(DATA_DIR, exist_ok=True)
         with open(PROVENTOS_JSON, "w", encoding="utf-8") as f:
             json.dump(proventos, f, ensure_ascii=False, indent=2)
     except Exception as e:
         logger.error("Erro ao salvar proventos: %s", e)
-        st.error(f"❌ Erro ao salvar proventos: {e}")
+        raise
 
 
-def add_provento(ticker: str, data_pagamento: str, valor_por_cota: float, quantidade: int) -> None:
-    proventos = load_proventos()
-    proventos.append({
+def add_provento(ticker: str, data_pagamento: str, valor_por_cota: float, quantidade: int,
+                 portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> None:
+    provento = {
         "ticker": ticker.upper(),
         "data": data_pagamento,
         "valor_por_cota": valor_por_cota,
         "quantidade": quantidade,
         "total": round(valor_por_cota * quantidade, 2),
-    })
+    }
+    if STORAGE_BACKEND == "sqlite":
+        # Inserção de uma linha; não relê nem regrava o histórico
+        try:
+            get_store().add_provento(portfolio_id, provento)
+        except Exception as e:
+            logger.error("Erro ao salvar provento: %s", e)
+            raise
+        return
+    proventos = load_proventos()
+    proventos.append(provento)
     proventos.sort(key=lambda x: x["data"], reverse=True)
     save_proventos(proventos)
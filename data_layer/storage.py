@@ -0,0 +1,290 @@
+"""Armazenamento SQLite de múltiplas carteiras (posições e proventos por carteira).
+
+Cada operação toca apenas as linhas da carteira pedida: o custo por requisição
+não depende do número total de usuários. Escritas usam `BEGIN IMMEDIATE` em
+modo WAL, então escritores concorrentes (várias sessões/réplicas) são
+serializados pelo próprio SQLite sem perder atualizações.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Iterator
+
+from config import DEFAULT_PORTFOLIO_ID, PORTFOLIO_JSON, PROVENTOS_JSON, STORAGE_DB
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS portfolios (
+    id         TEXT PRIMARY KEY,
+    user_id    TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS positions (
+    portfolio_id TEXT NOT NULL REFERENCES portfolios(id),
+    ticker       TEXT NOT NULL,
+    quantity     INTEGER NOT NULL,
+    avg_price    REAL NOT NULL,
+    PRIMARY KEY (portfolio_id, ticker)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_positions_ticker ON positions(ticker);
+CREATE TABLE IF NOT EXISTS proventos (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    portfolio_id   TEXT NOT NULL REFERENCES portfolios(id),
+    ticker         TEXT NOT NULL,
+    data           TEXT NOT NULL,
+    valor_por_cota REAL NOT NULL,
+    quantidade     INTEGER NOT NULL,
+    total          REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_proventos_portfolio_data ON proventos(portfolio_id, data DESC);
+CREATE TABLE IF NOT EXISTS operations (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    portfolio_id TEXT NOT NULL REFERENCES portfolios(id),
+    data         TEXT NOT NULL,
+    ticker       TEXT NOT NULL,
+    quantity     INTEGER NOT NULL,
+    price        REAL NOT NULL,
+    avg_price    REAL NOT NULL,
+    day_trade    INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_operations_portfolio_data ON operations(portfolio_id, data);
+"""
+
+
+class PortfolioStore:
+    """Carteiras em SQLite, indexadas por id de carteira e por ticker."""
+
+    def __init__(self, path: str = STORAGE_DB):
+        self.path = path
+        self._local = threading.local()
+        dirname = os.path.dirname(path)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Transação de escrita exclusiva (`BEGIN IMMEDIATE`)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @contextmanager
+    def _write(self, portfolio_id: str) -> Iterator[sqlite3.Connection]:
+        """Transação de escrita exclusiva; garante que a carteira exista."""
+        with self._transaction() as conn:
+            now = datetime.now().isoformat(timespec="microseconds")
+            conn.execute(
+                "INSERT INTO portfolios (id, created_at, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at",
+                (portfolio_id, now, now),
+            )
+            yield conn
+
+    # ---- Carteiras ----
+
+    def exists(self, portfolio_id: str) -> bool:
+        row = self._conn().execute("SELECT 1 FROM portfolios WHERE id = ?", (portfolio_id,)).fetchone()
+        return row is not None
+
+    def list_portfolios(self) -> list[str]:
+        return [r[0] for r in self._conn().execute("SELECT id FROM portfolios ORDER BY id")]
+
+    def portfolio_versions(self) -> dict[str, str]:
+        """{id: updated_at}; muda a cada escrita na carteira (posições, operações ou proventos)."""
+        return dict(self._conn().execute("SELECT id, updated_at FROM portfolios"))
+
+    def load_portfolio(self, portfolio_id: str) -> dict:
+        rows = self._conn().execute(
+            "SELECT ticker, quantity, avg_price FROM positions WHERE portfolio_id = ? ORDER BY ticker",
+            (portfolio_id,),
+        ).fetchall()
+        return {"positions": [{"ticker": t, "quantity": q, "avg_price": pm} for t, q, pm in rows]}
+
+    def save_portfolio(self, portfolio_id: str, data: dict) -> None:
+        """Substitui as posições da carteira (somente as linhas desta carteira)."""
+        with self._write(portfolio_id) as conn:
+            self._replace_positions(conn, portfolio_id, data.get("positions", []))
+
+    def import_batch(self, portfolio_id: str,
+                     merge: Callable[[list[dict], list[dict]], tuple[list[dict], list[dict]]]) -> None:
+        """
+        Importação em uma única transação: `merge(posições, operações)` recebe o
+        estado atual, lido já sob o `BEGIN IMMEDIATE`, e retorna (posições novas,
+        operações a acrescentar). Escritas concorrentes esperam e não se perdem.
+        """
+        with self._write(portfolio_id) as conn:
+            positions, operations = merge(self.load_portfolio(portfolio_id)["positions"],
+                                          self.load_operations(portfolio_id))
+            self._replace_positions(conn, portfolio_id, positions)
+            self._insert_operations(conn, portfolio_id, operations)
+
+    @staticmethod
+    def _replace_positions(conn: sqlite3.Connection, portfolio_id: str, positions: list[dict]) -> None:
+        conn.execute("DELETE FROM positions WHERE portfolio_id = ?", (portfolio_id,))
+        conn.executemany(
+            "INSERT INTO positions (portfolio_id, ticker, quantity, avg_price) VALUES (?, ?, ?, ?)",
+            [(portfolio_id, p["ticker"].upper(), int(p["quantity"]), float(p["avg_price"]))
+             for p in positions if p.get("quantity", 0) > 0],
+        )
+
+    def apply_operation(self, portfolio_id: str, ticker: str, quantity: int, price: float,
+                        data: str | None = None, day_trade: bool = False) -> None:
+        """
+        Compra/venda atômica de um ticker, com a mesma semântica de PM de
+        `upsert_position` (inclusive para day trade). A operação é registrada no histórico com o PM vigente.
+        """
+        ticker = ticker.upper()
+        with self._write(portfolio_id) as conn:
+            row = conn.execute(
+                "SELECT quantity, avg_price FROM positions WHERE portfolio_id = ? AND ticker = ?",
+                (portfolio_id, ticker),
+            ).fetchone()
+            old_qty, old_pm = row if row else (0, 0.0)
+            self._insert_operations(conn, portfolio_id, [{
+                "data": data or datetime.now().strftime("%Y-%m-%d"), "ticker": ticker,
+                "quantity": quantity, "price": price, "avg_price": old_pm, "day_trade": day_trade,
+            }])
+            new_qty = old_qty + quantity
+            if new_qty <= 0:
+                conn.execute("DELETE FROM positions WHERE portfolio_id = ? AND ticker = ?",
+                             (portfolio_id, ticker))
+                return
+            swing_buy = quantity > 0 and not (day_trade and old_qty > 0)  # day trade fora do PM de swing
+            new_pm = (old_qty * old_pm + quantity * price) / new_qty if swing_buy else old_pm
+            conn.execute(
+                "INSERT INTO positions (portfolio_id, ticker, quantity, avg_price) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(portfolio_id, ticker) DO UPDATE SET "
+                "quantity = excluded.quantity, avg_price = excluded.avg_price",
+                (portfolio_id, ticker, new_qty, new_pm),
+            )
+
+    # ---- Proventos ----
+
+    def load_proventos(self, portfolio_id: str) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT ticker, data, valor_por_cota, quantidade, total FROM proventos "
+            "WHERE portfolio_id = ? ORDER BY data DESC, id DESC",
+            (portfolio_id,),
+        ).fetchall()
+        return [{"ticker": t, "data": d, "valor_por_cota": v, "quantidade": q, "total": tot}
+                for t, d, v, q, tot in rows]
+
+    def save_proventos(self, portfolio_id: str, proventos: list[dict]) -> None:
+        with self._write(portfolio_id) as conn:
+            conn.execute("DELETE FROM proventos WHERE portfolio_id = ?", (portfolio_id,))
+            self._insert_proventos(conn, portfolio_id, proventos)
+
+    def add_provento(self, portfolio_id: str, provento: dict) -> None:
+        with self._write(portfolio_id) as conn:
+            self._insert_proventos(conn, portfolio_id, [provento])
+
+    @staticmethod
+    def _insert_proventos(conn: sqlite3.Connection, portfolio_id: str, proventos: list[dict]) -> None:
+        conn.executemany(
+            "INSERT INTO proventos (portfolio_id, ticker, data, valor_por_cota, quantidade, total) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(portfolio_id, p["ticker"], p["data"], p["valor_por_cota"], p["quantidade"], p["total"])
+             for p in proventos],
+        )
+
+    # ---- Operações ----
+
+    def load_operations(self, portfolio_id: str) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT data, ticker, quantity, price, avg_price, day_trade FROM operations "
+            "WHERE portfolio_id = ? ORDER BY data, id",
+            (portfolio_id,),
+        ).fetchall()
+        return [{"data": d, "ticker": t, "quantity": q, "price": p, "avg_price": pm, "day_trade": bool(dt)}
+                for d, t, q, p, pm, dt in rows]
+
+    def add_operations(self, portfolio_id: str, operations: list[dict]) -> None:
+        with self._write(portfolio_id) as conn:
+            self._insert_operations(conn, portfolio_id, operations)
+
+    @staticmethod
+    def _insert_operations(conn: sqlite3.Connection, portfolio_id: str, operations: list[dict]) -> None:
+        conn.executemany(
+            "INSERT INTO operations (portfolio_id, data, ticker, quantity, price, avg_price, day_trade) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(portfolio_id, o["data"], o["ticker"], int(o["quantity"]), float(o["price"]),
+              float(o.get("avg_price", 0.0)), int(bool(o.get("day_trade", False))))
+             for o in operations],
+        )
+
+    # ---- Migração ----
+
+    def import_json_files(self, portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> bool:
+        """
+        Importa portfolio.json/proventos.json legados para a carteira, se ela
+        ainda não existir. A checagem e as inserções são uma só transação:
+        processos que abrem o store ao mesmo tempo importam uma única vez, e
+        uma falha no meio não deixa a carteira migrada pela metade.
+        """
+        portfolio, proventos = _read_json(PORTFOLIO_JSON), _read_json(PROVENTOS_JSON)
+        portfolio = portfolio if isinstance(portfolio, dict) else None
+        proventos = proventos if isinstance(proventos, list) else None
+        if portfolio is None and proventos is None:
+            return False
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM portfolios WHERE id = ?", (portfolio_id,)).fetchone():
+                return False
+            now = datetime.now().isoformat(timespec="microseconds")
+            conn.execute("INSERT INTO portfolios (id, created_at, updated_at) VALUES (?, ?, ?)",
+                         (portfolio_id, now, now))
+            if portfolio is not None:
+                self._replace_positions(conn, portfolio_id, portfolio.get("positions", []))
+                self._insert_operations(conn, portfolio_id, portfolio.get("operations", []))
+            if proventos is not None:
+                self._insert_proventos(conn, portfolio_id, proventos)
+        logger.info("Arquivos JSON legados importados para a carteira '%s'", portfolio_id)
+        return True
+
+
+def _read_json(path: str):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.loads(f.read().strip() or "null")
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning("Ignorando %s na migração: %s", path, e)
+        return None
+
+
+_store: PortfolioStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> PortfolioStore:
+    """Store padrão do processo; na primeira abertura migra os JSON legados."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = PortfolioStore()
+                store.import_json_files()
+                _store = store
+    return _store
@@ -0,0 +1,341 @@
+"""Teste de carga: N sessões simultâneas do `app.py` num único processo.
+
+    python loadtest.py --sessoes 1 2 4 8 --acoes 20 --latencia-ms 20
+
+Cada sessão é um `AppTest` (API de testes do Streamlit) rodando numa thread,
+como as sessões de um servidor Streamlit, e executa uma sequência aleatória
+(semente por sessão) de navegação entre as três páginas, operações na
+carteira da sessão e atualizações de DY. Cada ação é um rerun cronometrado.
+
+Nenhuma fonte real é consultada: Brapi, FundsExplorer e StatusInvest apontam
+para um servidor HTTP local (`BRAPI_BASE_URL`, `FUNDSEXPLORER_BASE_URL`,
+`STATUSINVEST_BASE_URL`) com latência configurável; o yfinance, que não tem
+URL configurável, é trocado por um stub com a mesma latência. Os dados ficam
+num diretório temporário (carteiras em SQLite, uma por sessão).
+
+Para cada número de sessões o relatório traz vazão (reruns/s), latência
+p50/p95/p99 dos reruns e o crescimento de memória (RSS) por sessão.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+
+PAGES = ["🔍 Explorar Ativos", "💼 Minha Carteira", "🎯 Projeções"]
+ACTIONS = {"navegar": 0.6, "operacao": 0.25, "dy": 0.15}  # pesos do sorteio de cada ação
+
+
+# ---- Fontes externas simuladas ----
+
+def stub_tickers(n_fiis: int = 300, n_acoes: int = 300) -> dict[str, tuple[str, float, float]]:
+    """{ticker: (tipo, preço, DY %)} determinístico."""
+    rng = random.Random(0)
+    out = {}
+    for i in range(n_fiis):
+        out[f"F{i:03d}11"] = ("FII", round(rng.uniform(8, 160), 2), round(rng.uniform(4, 14), 2))
+    for i in range(n_acoes):
+        out[f"A{i:03d}3"] = ("Ação", round(rng.uniform(5, 80), 2), round(rng.uniform(0, 12), 2))
+    return out
+
+
+class StubUpstream:
+    """
+    Servidor HTTP local com as rotas usadas pelo app: lista e cotação da
+    Brapi, buscador em lote do StatusInvest (sem ~5% dos tickers, para
+    exercitar o scraping por ticker) e páginas de DY por ticker.
+    """
+
+    def __init__(self, latency: float = 0.0, tickers: dict | None = None):
+        self.latency = latency
+        self.tickers = tickers or stub_tickers()
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, ctype, body = stub.respond(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self) -> "StubUpstream":
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, path: str) -> tuple[int, str, bytes]:
+        url = urlsplit(path)
+        query = parse_qs(url.query)
+        parts = [p for p in url.path.split("/") if p]
+        if parts[:3] == ["api", "quote", "list"]:
+            tipo = "FII" if query.get("type", ["fund"])[0] == "fund" else "Ação"
+            stocks = [{"stock": t, "name": f"Ativo {t}", "close": p}
+                      for t, (k, p, _) in self.tickers.items() if k == tipo]
+            return 200, "application/json", json.dumps({"stocks": stocks}).encode()
+        if parts[:2] == ["api", "quote"] and len(parts) == 3:
+            results = [{"symbol": t, "regularMarketPrice": self.tickers[t][1]}
+                       for t in parts[2].upper().split(",") if t in self.tickers]
+            return 200, "application/json", json.dumps({"results": results}).encode()
+        if parts[:2] == ["category", "advancedsearchresult"]:
+            tipo = {"1": "Ação", "2": "FII"}.get(query.get("CategoryType", [""])[0])
+            items = [{"ticker": t, "dy": dy} for i, (t, (k, _, dy)) in enumerate(self.tickers.items())
+                     if k == tipo and i % 20]
+            return 200, "application/json", json.dumps({"list": items}).encode()
+        if len(parts) == 2 and parts[1].upper() in self.tickers:
+            dy = f"{self.tickers[parts[1].upper()][2]:.2f}".replace(".", ",")
+            if parts[0] == "funds":
+                html = f'<span class="indicator-value">{dy}%</span>'
+            else:
+                html = f'<div><div><h3>Dividend Yield</h3></div><strong class="value">{dy}</strong></div>'
+            return 200, "text/html; charset=utf-8", f"<html><body>{html}</body></html>".encode()
+        return 404, "text/plain", b"not found"
+
+
+class StubYFinance:
+    """Substitui o módulo yfinance em `api.prices` (não há URL configurável), com a mesma latência."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def _frame(self, symbols: list[str], days: int, fields: dict):
+        import numpy as np
+        import pandas as pd
+        if self.latency:
+            time.sleep(self.latency)
+        idx = pd.bdate_range(end=pd.Timestamp.today().normalize(), periods=days, name="Date")
+        rng = np.random.default_rng(len(symbols))
+        cols = {}
+        for s in symbols:
+            close = 100 * np.cumprod(1 + rng.normal(0, 0.01, days))
+            for field, fn in fields.items():
+                cols[(s, field)] = fn(close, idx)
+        return pd.DataFrame(cols, index=idx)
+
+    def download(self, symbols, **kwargs):
+        return self._frame(list(symbols), 500, {
+            "Close": lambda close, idx: close,
+            "Dividends": lambda close, idx: [0.8 if d.day <= 1 else 0.0 for d in idx],
+        })
+
+    def Ticker(self, symbol: str):
+        stub = self
+
+        class _Ticker:
+            def history(self, period: str = "1y"):
+                return stub._frame([symbol], 250, {"Close": lambda close, idx: close})[symbol]
+
+        return _Ticker()
+
+
+# ---- Sessões ----
+
+def _rss_mb() -> float:
+    """Memória residente do processo (MB); pico, onde /proc não existe."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def _share_server_state() -> None:
+    """
+    O `AppTest` cria, a cada rerun, um Runtime simulado (removido ao final, o
+    que derruba os reruns simultâneos das outras sessões) e um cache próprio
+    de bytecode (compilar em paralelo quebra o `ast` do Python 3.11). Como
+    num servidor real, as sessões passam a compartilhar um único Runtime (o
+    primeiro criado) e um único cache de bytecode do script.
+    """
+    from streamlit.runtime.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    shared = {}
+
+    def instance(cls):
+        runtime = shared.setdefault("runtime", cls._instance) if "runtime" not in shared else shared["runtime"]
+        if runtime is None:
+            shared.clear()
+            raise RuntimeError("Runtime hasn't been created!")
+        return runtime
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(shared.get("runtime")))
+
+    compile_bytecode = ScriptCache.get_bytecode
+    lock = threading.Lock()
+    bytecode = {}
+
+    def get_bytecode(self, script_path: str):
+        with lock:
+            if script_path not in bytecode:
+                bytecode[script_path] = compile_bytecode(self, script_path)
+            return bytecode[script_path]
+
+    ScriptCache.get_bytecode = get_bytecode
+
+
+class Session:
+    """Uma sessão simulada: um `AppTest` com a sua carteira e a sua sequência de ações."""
+
+    def __init__(self, index: int, tickers: list[str], timeout: float = 120):
+        from streamlit.testing.v1 import AppTest
+        self.portfolio_id = f"sessao-{index}"
+        self.rng = random.Random(index)
+        self.tickers = tickers
+        self.at = AppTest.from_file(APP, default_timeout=timeout)
+        self.page = PAGES[0]
+        self.latencies: list[float] = []
+        self.errors = 0
+
+    def _run(self, element=None) -> None:
+        start = time.perf_counter()
+        try:
+            (element or self.at).run()
+            if self.at.exception:
+                self.errors += 1
+        except Exception:
+            self.errors += 1
+        self.latencies.append(time.perf_counter() - start)
+
+    def _goto(self, page: str) -> None:
+        self._run(self.at.sidebar.radio[0].set_value(page))
+        self.page = page
+
+    def start(self) -> None:
+        self._run()
+        carteira = [w for w in self.at.sidebar.text_input if "Carteira" in w.label]
+        if carteira:
+            self._run(carteira[0].set_value(self.portfolio_id))
+
+    def step(self) -> None:
+        action = self.rng.choices(list(ACTIONS), weights=list(ACTIONS.values()))[0]
+        if action == "navegar":
+            self._goto(self.rng.choice([p for p in PAGES if p != self.page]))
+            return
+        if self.page != PAGES[0]:
+            self._goto(PAGES[0])
+        ticker = next((w for w in self.at.text_input if w.label.startswith("Ticker (ex")), None)
+        label = "Adicionar à carteira" if action == "operacao" else "Atualizar DY dos ativos"
+        button = next((b for b in self.at.button if label in b.label), None)
+        if ticker is None or button is None:  # a página não chegou a renderizar
+            self.errors += 1
+            return
+        if action == "operacao":
+            ticker.set_value(self.rng.choice(self.tickers))
+        self._run(button.click())
+
+
+def run_level(n_sessions: int, actions: int, tickers: list[str]) -> dict:
+    """Roda `n_sessions` sessões simultâneas com `actions` ações cada; métricas do nível."""
+    import numpy as np
+
+    rss_before = _rss_mb()
+    sessions = [Session(i, tickers) for i in range(n_sessions)]
+
+    def drive(session: Session) -> None:
+        session.start()
+        for _ in range(actions):
+            session.step()
+
+    threads = [threading.Thread(target=drive, args=(s,), name=s.portfolio_id) for s in sessions]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    rss_after = _rss_mb()
+
+    lat = np.array([x for s in sessions for x in s.latencies]) * 1000
+    return {
+        "sessoes": n_sessions,
+        "reruns": int(lat.size),
+        "erros": sum(s.errors for s in sessions),
+        "duracao_s": round(elapsed, 2),
+        "vazao_rps": round(lat.size / elapsed, 2),
+        "p50_ms": round(float(np.percentile(lat, 50)), 1),
+        "p95_ms": round(float(np.percentile(lat, 95)), 1),
+        "p99_ms": round(float(np.percentile(lat, 99)), 1),
+        "rss_mb": round(rss_after, 1),
+        "mb_por_sessao": round((rss_after - rss_before) / n_sessions, 2),
+    }
+
+
+def _print_table(rows: list[dict]) -> None:
+    cols = ["sessoes", "reruns", "erros", "vazao_rps", "p50_ms", "p95_ms", "p99_ms", "rss_mb", "mb_por_sessao"]
+    print(" ".join(f"{c:>13}" for c in cols))
+    for row in rows:
+        print(" ".join(f"{row[c]:>13}" for c in cols))
+
+
+def main(argv: list[str] | None = None) -> list[dict]:
+    parser = argparse.ArgumentParser(prog="loadtest.py", description="Teste de carga de sessões simultâneas")
+    parser.add_argument("--sessoes", type=int, nargs="+", default=[1, 2, 4, 8],
+                        help="Níveis de concorrência (sessões simultâneas)")
+    parser.add_argument("--acoes", type=int, default=20, help="Ações (reruns) por sessão")
+    parser.add_argument("--latencia-ms", type=float, default=20.0, help="Latência das fontes simuladas")
+    parser.add_argument("--dados", default=None, help="Diretório de trabalho (padrão: temporário)")
+    parser.add_argument("--json", default=None, help="Grava os resultados neste arquivo")
+    args = parser.parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json else None
+
+    stub = StubUpstream(args.latencia_ms / 1000).start()
+    workdir = args.dados or tempfile.mkdtemp(prefix="loadtest-")
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)  # config usa caminhos relativos (data/...)
+    os.environ.update({
+        "BRAPI_API_KEY": os.environ.get("BRAPI_API_KEY") or "stub",
+        "BRAPI_BASE_URL": stub.url, "FUNDSEXPLORER_BASE_URL": stub.url, "STATUSINVEST_BASE_URL": stub.url,
+        "STORAGE_BACKEND": "sqlite", "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    })
+    sys.path.insert(0, os.path.dirname(APP))
+    import api.prices  # só depois das variáveis de ambiente (config é lido na importação)
+    api.prices.yf = StubYFinance(args.latencia_ms / 1000)
+
+    _share_server_state()
+    print(f"Fontes simuladas em {stub.url}; dados em {workdir}")
+    tickers = list(stub.tickers)
+    Session(-1, tickers).start()  # aquecimento: importações e construção do universo
+    results = []
+    for n in args.sessoes:
+        results.append(run_level(n, args.acoes, tickers))
+        print(f"  {n} sessões: {results[-1]['vazao_rps']} reruns/s, p95 {results[-1]['p95_ms']} ms")
+    print()
+    _print_table(results)
+    print(f"\nRequisições às fontes simuladas: {stub.requests}")
+    stub.stop()
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
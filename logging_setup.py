@@ -0,0 +1,145 @@
+"""Logging não bloqueante, rotativo e estruturado.
+
+A thread da página só enfileira o registro (`QueueHandler`); uma thread de
+fundo (`QueueListener`) formata e grava. O arquivo é rotacionado por tamanho
+e os arquivos antigos são comprimidos com gzip. Cada linha do arquivo é um
+JSON com os campos `ticker`, `source` e `latency_ms` quando a chamada os
+informa via `extra=`. Avisos repetidos (mesmo logger e mesma mensagem-modelo,
+como durante uma queda da Brapi) são limitados a uma rajada por intervalo; o
+próximo registro liberado informa quantos foram suprimidos.
+"""
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+from config import LOG_BACKUPS, LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES
+
+STRUCTURED_FIELDS = ("ticker", "source", "latency_ms")
+
+_listener: logging.handlers.QueueListener | None = None
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por registro, com os campos estruturados presentes."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS + ("suppressed",):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Deixa passar no máximo `burst` registros por (logger, mensagem-modelo) a
+    cada `interval` segundos, a partir de `level`. Registros abaixo do nível
+    não são limitados.
+    """
+
+    def __init__(self, burst: int = 5, interval: float = 60.0, level: int = logging.WARNING):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.level = level
+        self._windows: dict[tuple, list] = {}  # chave → [início da janela, emitidos, suprimidos]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                self._windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def rotating_file_handler(path: str = LOG_FILE, max_bytes: int = LOG_MAX_BYTES,
+                          backups: int = LOG_BACKUPS) -> logging.handlers.RotatingFileHandler:
+    """Arquivo JSON rotacionado por tamanho; backups como `<arquivo>.N.gz`."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                   encoding="utf-8")
+    handler.namer = lambda name: name + ".gz"
+    handler.rotator = _gzip_rotator
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def setup_logging(path: str = LOG_FILE, level: str | int = LOG_LEVEL,
+                  rate_limit: RateLimitFilter | None = None) -> logging.handlers.QueueListener:
+    """
+    Instala o pipeline no logger raiz (idempotente: o Streamlit reexecuta
+    `app.py` a cada interação). Retorna o listener em execução.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return _listener
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+        q: queue.SimpleQueue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(q, rotating_file_handler(path), console,
+                                                  respect_handler_level=True)
+        queue_handler = logging.handlers.QueueHandler(q)
+        queue_handler.addFilter(rate_limit or RateLimitFilter())
+
+        root = logging.getLogger()
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+        listener.start()
+        atexit.register(stop_logging)
+        _listener = listener
+        return listener
+
+
+def stop_logging() -> None:
+    """Esvazia a fila e encerra a thread de gravação."""
+    global _listener
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for h in _listener.handlers:
+            h.close()
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            if isinstance(h, logging.handlers.QueueHandler):
+                root.removeHandler(h)
+        _listener = None
@@ -1,17 +1,66 @@
 """Página: Explorar Ativos Brasileiros."""
+import sqlite3
 from datetime import datetime
 
+import pandas as pd
 import streamlit as st
 
-from api.scraping import get_dy_estimate
-from data_layer.assets import classify_ticker, load_ativos_list, save_ativos_list
-from data_layer.portfolio import clean_positions, load_portfolio, save_portfolio, upsert_position
+from data_layer.alerts import RULE_KINDS, get_alert_store, sweep_stale
+from data_layer.assets import AssetUniverse, classify_ticker, get_universe, refresh_dy
+from data_layer.dividends import local_dy, update_dividend_history
+from data_layer.history import sparklines
+from config import DEFAULT_PORTFOLIO_ID
+from data_layer.portfolio import apply_operation
 from utils import brl
 
 
-def render() -> None:
+def _alerts_section(universe: AssetUniverse) -> None:
+    """Regras de alerta persistidas e eventos gerados nas atualizações do universo."""
+    store = get_alert_store(create=False)
+    novos = 0
+    if store is not None:
+        sweep_stale(universe.screener())
+        novos = store.unseen_count()
+    with st.expander(f"🔔 Alertas do universo ({novos} novos)", expanded=novos > 0):
+        st.caption("Avaliados a cada atualização de preço/DY, só para os ativos que mudaram.")
+        with st.form("nova_regra", clear_on_submit=True):
+            c1, c2, c3, c4 = st.columns([3, 1, 1, 1])
+            kind = c1.selectbox("Regra", list(RULE_KINDS), format_func=RULE_KINDS.get)
+            limiar = c2.number_input("Limiar", min_value=0.0, value=6.0, step=0.5)
+            ticker = c3.text_input("Ticker (vazio = todos)").strip().upper()
+            tipo = c4.selectbox("Tipo", ["Todos", "FII", "Ação", "ETF"])
+            if st.form_submit_button("➕ Criar regra"):
+                get_alert_store().add_rule(kind, limiar, ticker or None, None if tipo == "Todos" else tipo)
+                st.rerun()
+        if store is None:
+            return
+
+        regras = store.rules()
+        if regras:
+            st.dataframe(pd.DataFrame([{
+                "Id": r["id"], "Regra": RULE_KINDS[r["kind"]], "Limiar": r["threshold"],
+                "Ticker": r["ticker"] or "Todos", "Tipo": r["tipo"] or "Todos",
+            } for r in regras]), use_container_width=True, hide_index=True)
+            c1, c2 = st.columns([1, 3])
+            remover = c1.selectbox("Regra a remover", [r["id"] for r in regras], key="regra_remover")
+            if c2.button("🗑️ Remover regra"):
+                store.delete_rule(remover)
+                st.rerun()
+
+        eventos = store.events(limit=100)
+        if eventos.empty:
+            st.info("Nenhum alerta disparado ainda.")
+            return
+        st.dataframe(eventos.drop(columns=["id", "kind", "value"]).set_axis(
+            ["Quando", "Ticker", "Alerta", "Visto"], axis=1), use_container_width=True, hide_index=True)
+        if novos and st.button("✔️ Marcar alertas como vistos"):
+            store.mark_seen()
+            st.rerun()
+
+
+def render(portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> None:
     st.header("🔍 Explorar Ativos Brasileiros")
-    df_ativos = load_ativos_list()
+    universe = get_universe()
 
     col_f1, col_f2 = st.columns([3, 1])
     with col_f1:
@@ -19,41 +68,74 @@ def render() -> None:
     with col_f2:
         tipo_filtro = st.selectbox("Tipo", ["Todos", "FII", "Ação", "ETF"])
 
-    df_view = df_ativos.copy()
+    with st.expander("🎯 Filtros avançados", expanded=False):
+        col_s1, col_s2, col_s3 = st.columns(3)
+        with col_s1:
+            preco_min = st.number_input("Preço mínimo (R$)", min_value=0.0, value=0.0, step=1.0)
+            preco_max = st.number_input("Preço máximo (R$, 0 = sem limite)", min_value=0.0, value=0.0, step=1.0)
+        with col_s2:
+            dy_min_f = st.number_input("DY mínimo (%)", min_value=0.0, value=0.0, step=0.5)
+            dy_max_f = st.number_input("DY máximo (%, 0 = sem limite)", min_value=0.0, value=0.0, step=0.5)
+        with col_s3:
+            max_age = st.number_input("Atualizado nas últimas (h, 0 = qualquer)", min_value=0, value=0, step=1)
+            ordem = st.selectbox("Ordenar por", ["Tipo/Ticker", "DY ↓", "DY ↑", "Preço ↓", "Preço ↑"])
+            top_k = st.number_input("Mostrar os N primeiros (0 = todos)", min_value=0, value=0, step=10)
+
+    sort_col, ascending = {
+        "Tipo/Ticker": (None, True),
+        "DY ↓": ("dy_12m", False), "DY ↑": ("dy_12m", True),
+        "Preço ↓": ("preco_atual", False), "Preço ↑": ("preco_atual", True),
+    }[ordem]
+    df_view = universe.screener().query(
+        preco_min=preco_min or None,
+        preco_max=preco_max or None,
+        dy_min=dy_min_f or None,
+        dy_max=dy_max_f or None,
+        tipos=None if tipo_filtro == "Todos" else [tipo_filtro],
+        max_age_hours=max_age or None,
+        sort_by=sort_col,
+        ascending=ascending,
+        top_k=None if search else (top_k or None),
+    )
     if search:
         df_view = df_view[
             df_view["ticker"].str.contains(search, na=False) |
             df_view["nome"].str.upper().str.contains(search, na=False)
         ]
-    if tipo_filtro != "Todos":
-        df_view = df_view[df_view["tipo"] == tipo_filtro]
+        if top_k:
+            df_view = df_view.head(top_k)
 
-    df_display = df_view[["ticker", "nome", "tipo", "preco_atual", "dy_12m", "data_atualizacao"]].copy()
-    df_display.columns = ["Ticker", "Nome", "Tipo", "Preço Atual (R$)", "DY/Yield 12m (%)", "Última Atualização"]
+    df_display = df_view[["ticker", "nome", "tipo", "preco_atual", "dy_12m", "data_atualizacao"]].set_axis(
+        ["Ticker", "Nome", "Tipo", "Preço Atual (R$)", "DY/Yield 12m (%)", "Última Atualização"], axis=1
+    ).assign(**{"Tendência DY (90d)": sparklines(df_view["ticker"].tolist())})
 
     st.caption(f"📋 {len(df_view)} ativos | 💡 Preços atualizados a cada 30 min via Brapi")
-    st.info("📊 **DY/Yield:** FIIs → FundsExplorer + StatusInvest | Ações/ETFs → StatusInvest")
+    st.info("📊 **DY/Yield:** em lote via StatusInvest (FIIs e Ações); lacunas → FundsExplorer/StatusInvest por ativo")
 
-    if st.button("🔄 Atualizar DY dos ativos visíveis"):
-        with st.spinner("Buscando DY via web scraping..."):
-            total = len(df_view)
+    col_b1, col_b2 = st.columns(2)
+    if col_b1.button("🔄 Atualizar DY dos ativos visíveis"):
+        with st.spinner("Buscando DY em lote (e via web scraping para lacunas)..."):
             progress_bar = st.progress(0.0)
             data_att = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-            for i, (_, row) in enumerate(df_view.iterrows()):
-                ticker = row["ticker"]
-                asset_type = row.get("tipo", classify_ticker(ticker))
-                dy = get_dy_estimate(ticker, asset_type)
-                df_ativos.loc[df_ativos["ticker"] == ticker, "dy_12m"] = (dy * 100) if dy is not None else 0.0
-                df_ativos.loc[df_ativos["ticker"] == ticker, "data_atualizacao"] = data_att
-                progress_bar.progress((i + 1) / total)
-
-            save_ativos_list(df_ativos)
+            novos_dy = refresh_dy(df_view, progress=lambda i, n: progress_bar.progress(i / n))
+            universe.update_fields({t: {"dy_12m": v, "data_atualizacao": data_att} for t, v in novos_dy.items()})
             progress_bar.empty()
-            st.success(f"✅ DY atualizado para {total} ativos em {data_att}!")
+            st.success(f"✅ DY atualizado para {len(novos_dy)} ativos em {data_att}!")
             st.rerun()
 
-    st.dataframe(df_display, use_container_width=True)
+    if col_b2.button("📥 Atualizar histórico de dividendos (visíveis)",
+                     help="Busca proventos em lote e recalcula o DY 12m localmente sobre o preço atual"):
+        with st.spinner("Buscando histórico de dividendos em lote..."):
+            novos = update_dividend_history(df_view["ticker"].tolist())
+            universe.update_fields({t: {"dy_12m": v} for t, v in local_dy(universe.df).items()})
+        st.success(f"✅ {novos} pagamentos novos; DY recalculado localmente.")
+        st.rerun()
+
+    st.dataframe(df_display, use_container_width=True, column_config={
+        "Tendência DY (90d)": st.column_config.LineChartColumn("Tendência DY (90d)", width="small"),
+    })
+
+    _alerts_section(universe)
 
     st.subheader("➕ Adicionar posição à carteira")
     col1, col2, col3 = st.columns(3)
@@ -66,13 +148,14 @@ def render() -> None:
 
     if st.button("✅ Adicionar à carteira"):
         if ticker_input:
-            portfolio = load_portfolio()
-            upsert_position(portfolio, ticker_input.upper(), qty, buy_price)
-            clean_positions(portfolio)
-            save_portfolio(portfolio)
-            tipo_det = classify_ticker(ticker_input)
-            st.success(f"✅ {qty}x {ticker_input.upper()} ({tipo_det}) adicionado à carteira!")
-            st.balloons()
-            st.rerun()
+            try:
+                apply_operation(ticker_input.upper(), qty, buy_price, portfolio_id)
+            except (OSError, sqlite3.Error) as e:
+                st.error(f"❌ Não foi possível salvar a carteira: {e}")
+            else:
+                tipo_det = classify_ticker(ticker_input)
+                st.success(f"✅ {qty}x {ticker_input.upper()} ({tipo_det}) adicionado à carteira!")
+                st.balloons()
+                st.rerun()
         else:
             st.error("❌ Informe um ticker válido.")
@@ -1,102 +1,193 @@
 """Página: Minha Carteira."""
+import sqlite3
 from datetime import datetime
 
+import numpy as np
 import pandas as pd
-import plotly.graph_objects as go
 import streamlit as st
 
-from api.prices import get_benchmark_performance
-from config import ASSET_CONFIG
-from data_layer.portfolio import (
-    calc_portfolio_metrics,
-    clean_positions,
-    load_portfolio,
-    save_portfolio,
-    upsert_position,
-)
+import charts
+from api.prices import get_benchmark_performance, get_price_history, get_quotes_batch
+from config import ASSET_CONFIG, DEFAULT_PORTFOLIO_ID, LIVE_INTERVAL_SECONDS
+from analytics.fiscal import darf_table, monthly_tax
+from analytics.optimizer import efficient_frontier, estimate, expected_returns
+from analytics.rebalance import rebalance
+from analytics.risk import risk_report
+from data_layer.exports import FORMATS, available_formats, data_version, export_bytes
+from data_layer.importer import import_statement
+from data_layer.history import sparklines
+from data_layer.metrics import PortfolioMetrics
+from data_layer.portfolio import apply_operation, load_operations, load_portfolio
 from data_layer.proventos import add_provento, load_proventos
-from utils import brl, highlight_dy, pct
+from utils import BRT, brl, highlight_dy, is_b3_open, pct
 
 
-def render(dy_min: float = 6.0, dy_max: float = 15.0) -> None:
-    st.header("💼 Minha Carteira")
-    portfolio = load_portfolio()
+def _export_widget(df: pd.DataFrame, nome: str, key: str, carimbo: bool = False) -> None:
+    """Gera o arquivo só quando pedido; o botão de download aparece no rerun do clique."""
+    col_fmt, col_btn = st.columns([1, 3])
+    fmt = col_fmt.selectbox("Formato", available_formats(), key=f"fmt_{key}", label_visibility="collapsed")
+    if col_btn.button(f"⚙️ Gerar arquivo de {nome}", key=f"gerar_{key}"):
+        agora = datetime.now()
+        df_out = df.assign(**{"Data exportação": agora.strftime("%Y-%m-%d %H:%M")}) if carimbo else df
+        ext, mime, _ = FORMATS[fmt]
+        st.download_button(
+            label=f"📥 Baixar {nome} ({fmt})",
+            data=export_bytes(df_out, fmt, version=data_version(df_out)),  # inclui o carimbo
+            file_name=f"{nome}_{agora.strftime('%Y%m%d_%H%M')}{ext}",
+            mime=mime, key=f"dl_{key}",
+        )
 
-    with st.spinner("Carregando dados da carteira..."):
-        df, totals = calc_portfolio_metrics(portfolio)
+
+def _frontier_section(df: pd.DataFrame, precos: pd.DataFrame) -> None:
+    """Fronteira eficiente com limites por classe e a melhor carteira no risco atual."""
+    st.markdown("##### 🧭 Fronteira eficiente")
+    classes = df.set_index("Ticker")["Tipo"].reindex(precos.columns).fillna("Ação")
+    df_limites = st.data_editor(
+        pd.DataFrame({"Tipo": sorted(classes.unique()), "Mín (%)": 0.0, "Máx (%)": 100.0}),
+        disabled=["Tipo"], hide_index=True, key="fr_limites",
+    )
+    if not st.button("🧭 Calcular fronteira"):
+        return
+    limites = {r["Tipo"]: (r["Mín (%)"] / 100, r["Máx (%)"] / 100) for r in df_limites.to_dict("records")}
+    est = estimate(precos)
+    dy = df.set_index("Ticker")["DY/Yield 12m (%)"]
+    mu = expected_returns(est, dy)
+    try:
+        frontier, pesos = efficient_frontier(mu, est["cov"], classes.to_numpy(), limites,
+                                             dy=dy.reindex(est["tickers"]).fillna(0.0).to_numpy() / 100,
+                                             chol=est["chol"])
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    w_atual = df.set_index("Ticker")["Valor de Mercado (R$)"].reindex(est["tickers"]).fillna(0.0).to_numpy()
+    w_atual = w_atual / w_atual.sum()
+    atual = (float(np.linalg.norm(w_atual @ est["chol"])) * 100, float(w_atual @ mu) * 100)
+    no_risco = frontier[frontier["Volatilidade (%)"] <= atual[0] + 1e-9]
+    melhor = int(no_risco["Retorno esperado (%)"].idxmax()) if not no_risco.empty else None
+    escolhida = None if melhor is None else (frontier.at[melhor, "Volatilidade (%)"],
+                                             frontier.at[melhor, "Retorno esperado (%)"])
+    st.plotly_chart(charts.frontier_line(frontier, atual, escolhida), use_container_width=True)
+    st.caption(f"Covariância com encolhimento de Ledoit-Wolf (intensidade {est['shrinkage']:.0%}).")
+    if melhor is not None:
+        st.dataframe(pd.DataFrame({
+            "Ticker": est["tickers"], "Tipo": classes.to_numpy(),
+            "Peso atual (%)": w_atual * 100, "Peso sugerido (%)": pesos[melhor] * 100,
+        }).sort_values("Peso sugerido (%)", ascending=False).style.format({
+            "Peso atual (%)": "{:.1f}%", "Peso sugerido (%)": "{:.1f}%",
+        }), hide_index=True, use_container_width=True)
+
+
+def _positions_view(model: PortfolioMetrics, dy_min: float, dy_max: float, live: bool, polling: bool) -> None:
+    """
+    Métricas, alertas de DY e tabela de posições. Com cotações ao vivo roda
+    como fragmento a cada ciclo: só os preços que mudaram são aplicados ao
+    modelo (`apply_price`), sem reexecutar a página.
+    """
+    if polling:
+        if not is_b3_open():
+            st.rerun()  # o pregão encerrou: a página é refeita já sem o polling
+        quotes = get_quotes_batch(tuple(model.to_frame()["Ticker"]))
+        changed = [t for t, price in quotes.items() if model.apply_price(t, price)]
+        st.caption(f"📡 Cotações ao vivo às {datetime.now(BRT):%H:%M:%S}: "
+                   f"{len(changed)} de {len(model)} preços alterados")
+    elif live:
+        st.caption("🌙 B3 fora do pregão (dias úteis, 10h–17h): cotações ao vivo pausadas.")
+    df, totals = model.to_frame(), model.totals
 
     col1, col2, col3 = st.columns(3)
     col1.metric("💰 Patrimônio Total", brl(totals["Patrimônio (R$)"]))
     col2.metric("📈 Renda Mensal Est.", brl(totals["Renda Mensal (R$)"]))
     col3.metric("📊 DY/Yield Médio", pct(totals["DY Médio (%)"]))
+    if df.empty:
+        return
+
+    # Alertas de DY
+    alertas_baixo = df[(df["DY/Yield 12m (%)"] > 0) & (df["DY/Yield 12m (%)"] < dy_min)]
+    alertas_alto = df[df["DY/Yield 12m (%)"] >= dy_max]
+    if not alertas_baixo.empty:
+        st.warning(f"⚠️ DY/Yield abaixo de {dy_min:.1f}%: **{', '.join(alertas_baixo['Ticker'].tolist())}**")
+    if not alertas_alto.empty:
+        st.info(f"🟡 DY/Yield acima de {dy_max:.1f}% (verifique risco): **{', '.join(alertas_alto['Ticker'].tolist())}**")
+
+    df_tabela = df.assign(**{"Tendência DY (90d)": sparklines(df["Ticker"].tolist())})
+    styled = df_tabela.style.format({
+        "PM (R$)": "R$ {:.2f}",
+        "Preço Atual (R$)": "R$ {:.2f}",
+        "Variação (%)": "{:+.2f}%",
+        "DY/Yield 12m (%)": "{:.2f}%",
+        "Valor de Mercado (R$)": "R$ {:.2f}",
+        "Renda Mensal Est. (R$)": "R$ {:.2f}",
+    }).apply(highlight_dy, dy_min=dy_min, dy_max=dy_max, axis=1)
+    st.dataframe(styled, use_container_width=True, column_config={
+        "Tendência DY (90d)": st.column_config.LineChartColumn("Tendência DY (90d)", width="small"),
+    })
+    st.caption(f"🔴 DY < {dy_min:.1f}%  |  🟡 DY ≥ {dy_max:.1f}%  (ajuste na barra lateral)")
+
+
+def render(dy_min: float = 6.0, dy_max: float = 15.0, portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> None:
+    st.header("💼 Minha Carteira")
+    portfolio = load_portfolio(portfolio_id)
+
+    # Modelo incremental por carteira: só reavalia tudo se a carteira ou o universo mudaram
+    model_key = f"metrics_{portfolio_id}"
+    model = st.session_state.get(model_key)
+    if model is None or not model.is_current(portfolio):
+        with st.spinner("Carregando dados da carteira..."):
+            model = PortfolioMetrics.from_portfolio(portfolio)
+        st.session_state[model_key] = model
+
+    live = len(model) > 0 and st.toggle(
+        "📡 Cotações ao vivo", key=f"live_{portfolio_id}",
+        help=f"Durante o pregão da B3, busca a cada {LIVE_INTERVAL_SECONDS}s só os preços das posições "
+             "(uma requisição em lote) e atualiza métricas e tabela sem recarregar a página.",
+    )
+    polling = live and is_b3_open()
+    st.fragment(run_every=LIVE_INTERVAL_SECONDS if polling else None)(_positions_view)(
+        model, dy_min, dy_max, live, polling)
+    df, totals = model.to_frame(), model.totals
 
     if df.empty:
         st.info("📭 Sua carteira está vazia. Adicione ativos na aba 'Explorar'.")
     else:
-        # Alertas de DY
-        alertas_baixo = df[(df["DY/Yield 12m (%)"] > 0) & (df["DY/Yield 12m (%)"] < dy_min)]
-        alertas_alto = df[df["DY/Yield 12m (%)"] >= dy_max]
-        if not alertas_baixo.empty:
-            st.warning(f"⚠️ DY/Yield abaixo de {dy_min:.1f}%: **{', '.join(alertas_baixo['Ticker'].tolist())}**")
-        if not alertas_alto.empty:
-            st.info(f"🟡 DY/Yield acima de {dy_max:.1f}% (verifique risco): **{', '.join(alertas_alto['Ticker'].tolist())}**")
-
-        styled = df.style.format({
-            "PM (R$)": "R$ {:.2f}",
-            "Preço Atual (R$)": "R$ {:.2f}",
-            "Variação (%)": "{:+.2f}%",
-            "DY/Yield 12m (%)": "{:.2f}%",
-            "Valor de Mercado (R$)": "R$ {:.2f}",
-            "Renda Mensal Est. (R$)": "R$ {:.2f}",
-        }).apply(highlight_dy, dy_min=dy_min, dy_max=dy_max, axis=1)
-        st.dataframe(styled, use_container_width=True)
-        st.caption(f"🔴 DY < {dy_min:.1f}%  |  🟡 DY ≥ {dy_max:.1f}%  (ajuste na barra lateral)")
-
         # ---- Alocação ----
         st.markdown("---")
         st.subheader("📊 Alocação da Carteira")
         col_pie, col_bar = st.columns(2)
 
         with col_pie:
-            fig_pie = go.Figure(go.Pie(
-                labels=df["Ticker"],
-                values=df["Valor de Mercado (R$)"],
-                hole=0.4,
-                textinfo="label+percent",
-                hovertemplate="<b>%{label}</b><br>R$ %{value:,.2f}<br>%{percent}<extra></extra>",
-            ))
-            fig_pie.update_layout(title="Participação por ativo (%)", showlegend=False, height=380,
-                                  margin=dict(t=40, b=0, l=0, r=0))
-            st.plotly_chart(fig_pie, use_container_width=True)
+            st.plotly_chart(charts.allocation_pie(df), use_container_width=True)
 
         with col_bar:
-            df_sorted = df.sort_values("Valor de Mercado (R$)", ascending=True)
-            fig_bar = go.Figure(go.Bar(
-                x=df_sorted["Valor de Mercado (R$)"],
-                y=df_sorted["Ticker"],
-                orientation="h",
-                text=df_sorted["Valor de Mercado (R$)"].apply(lambda v: f"R$ {v:,.0f}"),
-                textposition="outside",
-                marker_color="royalblue",
-                hovertemplate="<b>%{y}</b><br>R$ %{x:,.2f}<extra></extra>",
-            ))
-            fig_bar.update_layout(title="Valor de Mercado por ativo (R$)", height=380,
-                                  xaxis=dict(title="R$"), yaxis=dict(title=""),
-                                  margin=dict(t=40, b=0, l=0, r=10))
-            st.plotly_chart(fig_bar, use_container_width=True)
+            st.plotly_chart(charts.market_value_bar(df), use_container_width=True)
 
         if df["Tipo"].nunique() > 1:
             df_tipo = df.groupby("Tipo")["Valor de Mercado (R$)"].sum().reset_index()
-            fig_tipo = go.Figure(go.Pie(
-                labels=df_tipo["Tipo"],
-                values=df_tipo["Valor de Mercado (R$)"],
-                hole=0.4,
-                textinfo="label+percent",
-                hovertemplate="<b>%{label}</b><br>R$ %{value:,.2f}<br>%{percent}<extra></extra>",
-            ))
-            fig_tipo.update_layout(title="Alocação por tipo de ativo", height=300,
-                                   margin=dict(t=40, b=0, l=0, r=0))
-            st.plotly_chart(fig_tipo, use_container_width=True)
+            st.plotly_chart(charts.type_pie(df_tipo), use_container_width=True)
+
+        # ---- Aporte / rebalanceamento ----
+        st.markdown("---")
+        st.subheader("⚖️ Aporte e Rebalanceamento")
+        col_r1, col_r2 = st.columns([1, 2])
+        with col_r1:
+            aporte = st.number_input("Valor do aporte (R$)", min_value=0.0, value=1000.0,
+                                     step=100.0, format="%.2f", key="rb_aporte")
+            modo = st.radio("Alvos por", ["Tipo", "Ticker"], horizontal=True, key="rb_modo")
+        pesos_atuais = (df.groupby(modo)["Valor de Mercado (R$)"].sum()
+                        / max(df["Valor de Mercado (R$)"].sum(), 1e-9) * 100).round(1)
+        with col_r2:
+            df_alvos = st.data_editor(
+                pd.DataFrame({modo: pesos_atuais.index, "Alvo (%)": pesos_atuais.values}),
+                hide_index=True, use_container_width=True, disabled=[modo], key=f"rb_alvos_{modo}",
+            )
+        if st.button("🧮 Calcular ordens de compra"):
+            alvos = dict(zip(df_alvos[modo], df_alvos["Alvo (%)"]))
+            df_ordens, sobra = rebalance(df, alvos, aporte, by=modo)
+            df_ordens = df_ordens[df_ordens["Comprar (qtde)"] > 0]
+            st.dataframe(df_ordens.style.format({
+                "Preço Atual (R$)": "R$ {:.2f}", "Peso atual (%)": "{:.2f}%", "Peso alvo (%)": "{:.2f}%",
+                "Valor da compra (R$)": "R$ {:.2f}", "Peso final (%)": "{:.2f}%",
+            }), use_container_width=True)
+            st.caption(f"💵 Sobra de caixa: {brl(sobra)}")
 
         # ---- Comparativo vs benchmark ----
         st.markdown("---")
@@ -133,39 +224,50 @@ def render(dy_min: float = 6.0, dy_max: float = 15.0) -> None:
             col_c3.metric("⚖️ Alpha", "—")
 
         if hist_bench is not None and not hist_bench.empty:
-            hist_norm = hist_bench.copy()
-            hist_norm["Base 100"] = hist_norm["Close"] / hist_norm["Close"].iloc[0] * 100
-            fig_comp = go.Figure()
-            fig_comp.add_trace(go.Scatter(
-                x=hist_norm["Date"], y=hist_norm["Base 100"],
-                name=benchmark_opt, line=dict(color="darkorange", width=2),
-                hovertemplate=f"<b>{benchmark_opt}</b><br>%{{x}}<br>Base 100: %{{y:.1f}}<extra></extra>",
-            ))
-            fig_comp.add_hline(
-                y=100 + carteira_pct, line_dash="dash", line_color="royalblue",
-                annotation_text=f"Sua carteira: {100 + carteira_pct:.1f}",
-                annotation_position="right",
-            )
-            fig_comp.update_layout(
-                title=f"{benchmark_opt} — {period_label} (base 100)",
-                xaxis=dict(title="Data"), yaxis=dict(title="Base 100"),
-                height=350, margin=dict(t=40, b=0, l=0, r=10),
-            )
+            fig_comp = charts.benchmark_line(hist_bench, benchmark_opt, period_label, carteira_pct)
             st.plotly_chart(fig_comp, use_container_width=True)
             st.caption("⚠️ Rentabilidade da carteira calculada vs PM de compra.")
 
+        # ---- Risco ----
+        st.markdown("---")
+        st.subheader("📉 Risco da Carteira")
+        col_rk1, col_rk2 = st.columns([1, 3])
+        with col_rk1:
+            risco_periodo = st.selectbox("Histórico", ["1 ano", "2 anos", "5 anos"], key="risk_period")
+        with col_rk2:
+            st.write("")
+            calcular_risco = st.checkbox("Calcular volatilidade, correlação, drawdown e VaR", key="risk_on")
+        if calcular_risco:
+            with st.spinner("Buscando histórico de preços..."):
+                periodo = {"1 ano": "1y", "2 anos": "2y", "5 anos": "5y"}[risco_periodo]
+                precos = get_price_history(tuple(sorted(df["Ticker"])), periodo)
+            if precos.empty:
+                st.warning("⚠️ Histórico de preços indisponível no momento.")
+            else:
+                pesos = df.set_index("Ticker")["Valor de Mercado (R$)"]
+                risco = risk_report(precos, pesos, period=periodo)
+                cart = risco["carteira"]
+                pat = totals["Patrimônio (R$)"]
+                c1, c2, c3, c4 = st.columns(4)
+                c1.metric("📊 Volatilidade anual", pct(cart["Volatilidade anual (%)"]))
+                c2.metric("📉 Max drawdown", pct(cart["Max drawdown (%)"]))
+                c3.metric("⚠️ VaR 95% 1d (histórico)", brl(cart["VaR histórico 1d (%)"] / 100 * pat),
+                          help=f"{cart['VaR histórico 1d (%)']:.2f}% do patrimônio")
+                c4.metric("⚠️ VaR 95% 1d (paramétrico)", brl(cart["VaR paramétrico 1d (%)"] / 100 * pat),
+                          help=f"{cart['VaR paramétrico 1d (%)']:.2f}% do patrimônio")
+                st.caption(f"Base: {cart['Pregões']} pregões de fechamentos ajustados (yfinance).")
+                st.dataframe(risco["ativos"].style.format({
+                    "Volatilidade anual (%)": "{:.2f}%", "Retorno anual (%)": "{:+.2f}%",
+                    "Max drawdown (%)": "{:.2f}%", "Peso (%)": "{:.2f}%",
+                }, na_rep="—"), hide_index=True, use_container_width=True)
+                if len(risco["correlacao"]) > 1:
+                    st.plotly_chart(charts.correlation_heatmap(risco["correlacao"]), use_container_width=True)
+                    _frontier_section(df, precos)
+
         # ---- Exportação ----
         st.markdown("---")
         st.subheader("⬇️ Exportar Carteira")
-        df_export = df.copy()
-        df_export["Data exportação"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-        csv_bytes = df_export.to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-        st.download_button(
-            label="📥 Baixar carteira em CSV",
-            data=csv_bytes,
-            file_name=f"carteira_{datetime.now().strftime('%Y%m%d_%H%M')}.csv",
-            mime="text/csv",
-        )
+        _export_widget(df, "carteira", key="carteira", carimbo=True)
 
         # ---- Resumo Fiscal ----
         st.markdown("---")
@@ -178,15 +280,11 @@ def render(dy_min: float = 6.0, dy_max: float = 15.0) -> None:
             df_fiscal["Ganho de Capital (R$)"] / df_fiscal["Custo Total (R$)"]
         ).where(df_fiscal["Custo Total (R$)"] > 0, 0) * 100
 
-        def _ir_estimado(row: pd.Series) -> float:
-            cfg = ASSET_CONFIG.get(row["Tipo"], ASSET_CONFIG["Ação"])
-            ganho = row["Ganho de Capital (R$)"]
-            return ganho * cfg["ir_ganho"] if ganho > 0 else 0.0
-
-        df_fiscal["Alíquota IR"] = df_fiscal["Tipo"].map(
-            lambda t: f"{ASSET_CONFIG.get(t, ASSET_CONFIG['Ação'])['ir_ganho'] * 100:.0f}%"
+        aliquotas = df_fiscal["Tipo"].map(
+            lambda t: ASSET_CONFIG.get(t, ASSET_CONFIG["Ação"])["ir_ganho"]
         )
-        df_fiscal["IR estimado (R$)"] = df_fiscal.apply(_ir_estimado, axis=1)
+        df_fiscal["Alíquota IR"] = (aliquotas * 100).map(lambda v: f"{v:.0f}%")
+        df_fiscal["IR estimado (R$)"] = df_fiscal["Ganho de Capital (R$)"].clip(lower=0) * aliquotas
 
         col_f1, col_f2, col_f3 = st.columns(3)
         col_f1.metric("💸 Custo total", brl(df_fiscal["Custo Total (R$)"].sum()))
@@ -199,7 +297,8 @@ def render(dy_min: float = 6.0, dy_max: float = 15.0) -> None:
             - **FIIs:** 20% sobre ganho de capital na venda. Dividendos **isentos** para pessoa física.
             - **Ações:** 15% (swing trade) ou 20% (day trade) sobre ganho de capital. Dividendos **isentos** (Lei 9.249/95).
             - **ETFs:** 15% sobre ganho de capital. Sem isenção mensal.
-            - Isenção de IR para vendas de ações ≤ R$ 20.000/mês não está calculada aqui.
+            - O IR latente acima ignora a isenção mensal; a apuração abaixo (operações realizadas)
+              aplica a isenção de vendas de ações ≤ R$ 20.000/mês e a compensação de prejuízos.
             """)
 
         st.dataframe(
@@ -212,10 +311,24 @@ def render(dy_min: float = 6.0, dy_max: float = 15.0) -> None:
             use_container_width=True,
         )
 
+        st.markdown("##### 🧮 Apuração mensal (operações realizadas)")
+        df_tax = monthly_tax(load_operations(portfolio_id))
+        df_darf = darf_table(df_tax)
+        if df_darf.empty:
+            st.caption("Nenhum imposto devido sobre as vendas registradas.")
+        else:
+            st.dataframe(df_darf.style.format({
+                "Swing trade (R$)": "R$ {:.2f}", "Day trade (R$)": "R$ {:.2f}",
+                "FII (R$)": "R$ {:.2f}", "Meses anteriores (R$)": "R$ {:.2f}", "Total DARF (R$)": "R$ {:.2f}",
+            }), use_container_width=True)
+            st.caption("DARF abaixo de R$ 10 não é recolhido: o valor entra em 'Meses anteriores' do próximo DARF.")
+        with st.expander("📒 Detalhe da apuração por categoria"):
+            st.dataframe(df_tax.astype({"mes": str}), use_container_width=True)
+
         # ---- Proventos ----
         st.markdown("---")
         st.subheader("💰 Histórico de Proventos / Dividendos")
-        proventos = load_proventos()
+        proventos = load_proventos(portfolio_id)
 
         with st.expander("➕ Registrar novo provento", expanded=False):
             tickers_carteira = df["Ticker"].tolist()
@@ -232,9 +345,13 @@ def render(dy_min: float = 6.0, dy_max: float = 15.0) -> None:
                 p_qtd = st.number_input("Qtde de cotas", min_value=1, value=qtd_default, step=1, key="p_qtd")
             if st.button("💾 Salvar provento"):
                 if p_valor > 0:
-                    add_provento(p_ticker, str(p_data), p_valor, p_qtd)
-                    st.success(f"✅ Provento de {brl(p_valor * p_qtd)} registrado para {p_ticker}!")
-                    st.rerun()
+                    try:
+                        add_provento(p_ticker, str(p_data), p_valor, p_qtd, portfolio_id)
+                    except (OSError, sqlite3.Error) as e:
+                        st.error(f"❌ Não foi possível salvar o provento: {e}")
+                    else:
+                        st.success(f"✅ Provento de {brl(p_valor * p_qtd)} registrado para {p_ticker}!")
+                        st.rerun()
                 else:
                     st.error("❌ Informe um valor por cota maior que zero.")
 
@@ -246,51 +363,75 @@ def render(dy_min: float = 6.0, dy_max: float = 15.0) -> None:
             st.metric("💵 Total recebido em proventos", brl(df_prov["Total (R$)"].sum()))
             df_prov["Mês"] = pd.to_datetime(df_prov["Data"]).dt.to_period("M").astype(str)
             df_mensal = df_prov.groupby("Mês")["Total (R$)"].sum().reset_index().sort_values("Mês")
-            fig_prov = go.Figure(go.Bar(
-                x=df_mensal["Mês"], y=df_mensal["Total (R$)"],
-                marker_color="seagreen",
-                text=df_mensal["Total (R$)"].apply(lambda v: f"R$ {v:,.2f}"),
-                textposition="outside",
-                hovertemplate="<b>%{x}</b><br>R$ %{y:,.2f}<extra></extra>",
-            ))
-            fig_prov.update_layout(title="Proventos por mês (R$)", height=300,
-                                   xaxis=dict(title="Mês"), yaxis=dict(title="R$"),
-                                   margin=dict(t=40, b=0, l=0, r=0))
+            fig_prov = charts.proventos_bar(df_mensal)
             st.plotly_chart(fig_prov, use_container_width=True)
             st.dataframe(df_prov.drop(columns=["Mês"]).style.format({
                 "R$/Cota": "R$ {:.4f}", "Total (R$)": "R$ {:.2f}",
             }), use_container_width=True)
-            csv_prov = df_prov.drop(columns=["Mês"]).to_csv(index=False, encoding="utf-8-sig").encode("utf-8-sig")
-            st.download_button(
-                "📥 Baixar proventos em CSV", data=csv_prov,
-                file_name=f"proventos_{datetime.now().strftime('%Y%m%d')}.csv",
-                mime="text/csv", key="dl_proventos",
-            )
+            _export_widget(df_prov.drop(columns=["Mês"]), "proventos", key="proventos")
         else:
             st.info("📭 Nenhum provento registrado ainda. Use o formulário acima.")
 
     # ---- Operações ----
     st.markdown("---")
     st.subheader("✏️ Registrar Operação")
+    with st.expander("📥 Importar extrato de negociação (B3 / corretora)", expanded=df.empty):
+        st.caption("CSV ou XLSX com as colunas Data do Negócio, Tipo de Movimentação (Compra/Venda), "
+                   "Código de Negociação, Quantidade e Preço — o formato exportado pela Área do Investidor da B3.")
+        arquivo = st.file_uploader("Extrato", type=["csv", "xlsx"], key="import_extrato")
+        if arquivo is not None and st.button("📥 Importar operações", key="btn_importar"):
+            try:
+                with st.spinner("Importando extrato..."):
+                    resumo = import_statement(arquivo, filename=arquivo.name, portfolio_id=portfolio_id)
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                if resumo["importadas"]:
+                    st.success(f"✅ {resumo['importadas']} operações importadas ({resumo['tickers']} ativos, "
+                               f"{resumo['periodo'][0]} a {resumo['periodo'][1]}). "
+                               f"Linhas descartadas: {resumo['descartadas']}; já importadas: {resumo['duplicadas']}.")
+                    st.rerun()
+                elif resumo["duplicadas"]:
+                    st.info(f"ℹ️ As {resumo['duplicadas']} operações do extrato já tinham sido importadas.")
+                else:
+                    st.warning(f"⚠️ Nenhuma operação válida encontrada ({resumo['descartadas']} linhas descartadas).")
     if df.empty:
         return
 
     tickers = df["Ticker"].tolist()
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
     with col1:
         t_sel = st.selectbox("Ticker", tickers)
     with col2:
         qty_add = st.number_input("Quantidade (+ compra / - venda)", value=0, step=1)
     with col3:
         price_op = st.number_input("Preço da operação (R$)", value=0.0, step=0.1, format="%.2f")
-
-    if st.button("🔄 Aplicar operação"):
-        if t_sel and qty_add != 0 and price_op > 0:
-            p = load_portfolio()
-            upsert_position(p, t_sel, int(qty_add), float(price_op))
-            clean_positions(p)
-            save_portfolio(p)
-            st.success("✅ Operação aplicada!")
-            st.rerun()
-        else:
+    with col4:
+        data_op = st.date_input("Data da operação", key="op_data")
+        day_trade = st.checkbox("Day trade", key="op_day_trade")
+
+    col_ap, col_sim = st.columns(2)
+    aplicar = col_ap.button("🔄 Aplicar operação")
+    simular = col_sim.button("🔮 Simular (sem salvar)")
+    if aplicar or simular:
+        if not (t_sel and qty_add != 0 and price_op > 0):
             st.error("❌ Informe quantidade diferente de zero e preço válido.")
+        elif simular:
+            sim = model.what_if([(t_sel, int(qty_add), float(price_op))]).totals
+            c1, c2, c3 = st.columns(3)
+            c1.metric("💰 Patrimônio simulado", brl(sim["Patrimônio (R$)"]),
+                      delta=brl(sim["Patrimônio (R$)"] - totals["Patrimônio (R$)"]))
+            c2.metric("📈 Renda mensal simulada", brl(sim["Renda Mensal (R$)"]),
+                      delta=brl(sim["Renda Mensal (R$)"] - totals["Renda Mensal (R$)"]))
+            c3.metric("📊 DY/Yield médio simulado", pct(sim["DY Médio (%)"]),
+                      delta=f"{sim['DY Médio (%)'] - totals['DY Médio (%)']:+.2f} p.p.")
+        else:
+            try:
+                apply_operation(t_sel, int(qty_add), float(price_op), portfolio_id,
+                                data=str(data_op), day_trade=day_trade)
+            except (OSError, sqlite3.Error) as e:
+                st.error(f"❌ Não foi possível salvar a operação: {e}")
+            else:
+                model.apply(t_sel, int(qty_add), float(price_op), day_trade)
+                st.success("✅ Operação aplicada!")
+                st.rerun()
@@ -1,12 +1,15 @@
 """Página: Projeções para Independência Financeira."""
+import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
 
+from analytics.projection import ALLOCATION_POLICIES, simulate_asset_projection
+from config import DEFAULT_PORTFOLIO_ID
 from data_layer.portfolio import calc_portfolio_metrics, load_portfolio
 from utils import brl, simulate_projection
 
 
-def render() -> None:
+def render(portfolio_id: str = DEFAULT_PORTFOLIO_ID) -> None:
     st.header("🎯 Projeções para Independência Financeira")
 
     with st.expander("ℹ️ Como funciona o cálculo?", expanded=False):
@@ -21,9 +24,13 @@ def render() -> None:
         - **Valorização anual** — crescimento esperado dos ativos (histórico IFIX/IBOV: ~6-8%)
         - **Crescimento dos dividendos** — crescimento anual dos rendimentos (média: 2-4%)
         - **Crescimento do aporte** — se você vai aumentar aportes anualmente (ex: reajuste salarial)
+
+        No modelo **Por ativo**, cada posição é projetada com o próprio DY, com valorização e
+        crescimento de dividendos definidos por classe, e os aportes são distribuídos pela
+        política escolhida.
         """)
 
-    portfolio = load_portfolio()
+    portfolio = load_portfolio(portfolio_id)
     df_pf, totals = calc_portfolio_metrics(portfolio)
 
     start_capital = totals["Patrimônio (R$)"]
@@ -56,18 +63,52 @@ def render() -> None:
         ) / 100.0
         max_years = st.slider("Horizonte (anos)", min_value=1, max_value=50, value=30)
 
+    modos = ["Carteira agregada"] + (["Por ativo"] if not df_pf.empty else [])
+    modo = st.radio("Modelo de simulação", modos, horizontal=True, key="proj_modo",
+                    help="'Por ativo' projeta cada posição com o seu próprio DY e premissas por classe.")
+    if modo == "Por ativo":
+        st.markdown("##### 🧩 Premissas por classe e alocação dos aportes")
+        tipos = sorted(df_pf["Tipo"].unique())
+        peso_atual = df_pf.groupby("Tipo")["Valor de Mercado (R$)"].sum()
+        peso_atual = (peso_atual / peso_atual.sum() * 100 if peso_atual.sum() > 0 else peso_atual * 0).round(1)
+        df_premissas = st.data_editor(
+            pd.DataFrame({
+                "Tipo": tipos,
+                "Valorização anual (%)": yearly_return * 100,
+                "Crescimento dos dividendos (%)": yearly_div_growth * 100,
+                "Alvo do aporte (%)": [float(peso_atual.get(t, 0.0)) for t in tipos],
+            }),
+            disabled=["Tipo"], hide_index=True, use_container_width=True, key="proj_premissas",
+        )
+        policy = st.selectbox("Alocação dos aportes", ALLOCATION_POLICIES, key="proj_policy")
+
     if st.button("🚀 Simular", type="primary"):
+        df_assets = None
         with st.spinner("Calculando projeções..."):
-            df_sim, months_to_goal = simulate_projection(
-                start_capital=start_capital,
-                current_monthly_income=current_monthly_income,
-                monthly_contribution=monthly_contribution,
-                target_monthly_income=target_income,
-                yearly_return=yearly_return,
-                yearly_dividend_growth=yearly_div_growth,
-                yearly_contrib_growth=yearly_contrib_growth,
-                max_years=max_years,
-            )
+            if modo == "Por ativo":
+                premissas = df_premissas.set_index("Tipo")
+                df_sim, months_to_goal, df_assets = simulate_asset_projection(
+                    df_pf,
+                    monthly_contribution=monthly_contribution,
+                    target_monthly_income=target_income,
+                    class_return=(premissas["Valorização anual (%)"] / 100).to_dict(),
+                    class_dividend_growth=(premissas["Crescimento dos dividendos (%)"] / 100).to_dict(),
+                    yearly_contrib_growth=yearly_contrib_growth,
+                    max_years=max_years,
+                    policy=policy,
+                    targets=premissas["Alvo do aporte (%)"].to_dict(),
+                )
+            else:
+                df_sim, months_to_goal = simulate_projection(
+                    start_capital=start_capital,
+                    current_monthly_income=current_monthly_income,
+                    monthly_contribution=monthly_contribution,
+                    target_monthly_income=target_income,
+                    yearly_return=yearly_return,
+                    yearly_dividend_growth=yearly_div_growth,
+                    yearly_contrib_growth=yearly_contrib_growth,
+                    max_years=max_years,
+                )
 
         fig = go.Figure()
         fig.add_trace(go.Scatter(
@@ -109,3 +150,21 @@ def render() -> None:
             col1, col2 = st.columns(2)
             col1.metric(f"💰 Patrimônio em {max_years} anos", brl(df_sim["Patrimônio (R$)"].iloc[-1]))
             col2.metric(f"📈 Renda em {max_years} anos", brl(df_sim["Renda Mensal (R$)"].iloc[-1]))
+
+        if df_assets is not None:
+            st.markdown("---")
+            st.subheader("🧩 Renda por classe")
+            cols_classe = [c for c in df_sim.columns if c.startswith("Renda ") and c != "Renda Mensal (R$)"]
+            fig_classes = go.Figure()
+            for c in cols_classe:
+                fig_classes.add_trace(go.Scatter(
+                    x=df_sim["Data"], y=df_sim[c], name=c[len("Renda "):-len(" (R$)")], stackgroup="renda",
+                    hovertemplate="%{x}<br>R$ %{y:,.2f}<extra></extra>",
+                ))
+            fig_classes.update_layout(title="Renda mensal projetada por classe (R$)", height=400,
+                                      hovermode="x unified", margin=dict(t=40, b=0, l=0, r=0))
+            st.plotly_chart(fig_classes, use_container_width=True)
+            st.dataframe(df_assets.sort_values("Valor final (R$)", ascending=False).style.format({
+                "Valor atual (R$)": "R$ {:,.2f}", "Valor final (R$)": "R$ {:,.2f}",
+                "Renda mensal final (R$)": "R$ {:,.2f}", "Total aportado (R$)": "R$ {:,.2f}",
+            }), hide_index=True, use_container_width=True)
@@ -0,0 +1,110 @@
+"""Perfil (cProfile) de uma execução do script, sob demanda.
+
+Só é usado quando um administrador liga o perfil (ver `app.py`); desligado,
+nenhum profiler é instalado e o roteamento chama a página diretamente. Cada
+execução perfilada é gravada em `PROFILES_DIR` como `.prof` (abre no pstats
+ou no snakeviz), e o relatório resume as funções mais custosas.
+
+O cProfile é por thread e o Streamlit roda cada sessão numa thread própria;
+para não misturar perfis (e porque o Python 3.12+ só admite um profiler
+ativo), uma execução por vez é perfilada e as demais seguem sem perfil.
+"""
+import cProfile
+import logging
+import os
+import pstats
+import re
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Iterator
+
+import pandas as pd
+
+from config import PROFILES_DIR, PROFILES_KEEP
+
+logger = logging.getLogger(__name__)
+
+_busy = threading.Lock()
+
+
+class ProfileReport:
+    """Perfil gravado de uma execução, com o ranking das funções."""
+
+    def __init__(self, label: str, path: str, seconds: float, stats: pstats.Stats):
+        self.label = label
+        self.path = path
+        self.seconds = seconds
+        self._stats = stats
+
+    def top(self, n: int = 25, by: str = "proprio") -> pd.DataFrame:
+        """As `n` funções com maior tempo próprio (`by="proprio"`) ou acumulado (`by="acumulado"`)."""
+        rows = [{
+            "Função": f"{func} ({os.path.basename(file)}:{line})",
+            "Chamadas": nc,
+            "Tempo próprio (ms)": tt * 1000,
+            "Tempo acumulado (ms)": ct * 1000,
+        } for (file, line, func), (_, nc, tt, ct, _) in self._stats.stats.items()]
+        col = "Tempo próprio (ms)" if by == "proprio" else "Tempo acumulado (ms)"
+        df = pd.DataFrame(rows, columns=["Função", "Chamadas", "Tempo próprio (ms)", "Tempo acumulado (ms)"])
+        return df.sort_values(col, ascending=False, kind="stable").head(n).reset_index(drop=True)
+
+
+class ProfileRun:
+    """Preenchido ao sair do bloco `profile_rerun` (None se a execução não foi perfilada)."""
+
+    report: ProfileReport | None = None
+
+
+def _slug(label: str) -> str:
+    ascii_label = unicodedata.normalize("NFKD", label).encode("ascii", "ignore").decode()
+    return re.sub(r"[^a-z0-9]+", "-", ascii_label.lower()).strip("-") or "execucao"
+
+
+def _prune(directory: str, keep: int) -> None:
+    files = sorted(f for f in os.listdir(directory) if f.endswith(".prof"))
+    for name in files[:max(0, len(files) - keep)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def _save(profiler: cProfile.Profile, label: str, seconds: float, directory: str, keep: int) -> ProfileReport:
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{_slug(label)}.prof")
+    profiler.dump_stats(path)
+    _prune(directory, keep)
+    logger.info("Perfil de '%s' gravado em %s (%.0f ms)", label, path, seconds * 1000)
+    return ProfileReport(label, path, seconds, pstats.Stats(profiler))
+
+
+@contextmanager
+def profile_rerun(label: str, directory: str = PROFILES_DIR, keep: int = PROFILES_KEEP) -> Iterator[ProfileRun]:
+    """
+    Perfila o bloco e grava o resultado mesmo quando ele termina com exceção
+    (o `st.rerun()` do Streamlit interrompe a página com uma exceção).
+    """
+    run = ProfileRun()
+    if not _busy.acquire(blocking=False):
+        logger.info("Perfil de '%s' ignorado: outra execução já está sendo perfilada", label)
+        yield run
+        return
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:  # outro profiler ativo no processo
+            logger.warning("Perfil de '%s' indisponível: %s", label, e)
+            yield run
+            return
+        start = time.perf_counter()
+        try:
+            yield run
+        finally:
+            profiler.disable()
+            run.report = _save(profiler, label, time.perf_counter() - start, directory, keep)
+    finally:
+        _busy.release()
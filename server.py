@@ -0,0 +1,353 @@
+"""API JSON somente leitura, ao lado do `app.py`.
+
+    python server.py [--host 127.0.0.1] [--port 8502]
+
+Rotas (GET):
+    /saude
+    /carteiras                      ids das carteiras e versão de cada uma
+    /carteiras/<id>                 posições e totais (`calc_portfolio_metrics`)
+    /carteiras/<id>/projecao        ?aporte=&meta=&valorizacao=&crescimento_dividendos=&crescimento_aporte=&anos=
+    /universo                       ?tipo=FII,ETF&q=&preco_min=&preco_max=&dy_min=&dy_max=&ordem=-dy&pagina=&por_pagina=
+
+As requisições nunca consultam as fontes externas nem recalculam o que não
+mudou. Uma thread de fundo verifica a cada SERVER_REFRESH_SECONDS as versões
+em disco (mtime do CSV/delta do universo, `updated_at` das carteiras) e
+reconstrói só os snapshots alterados. Cada resposta é serializada uma vez por
+versão e guardada com o seu ETag (304 para `If-None-Match`) e a versão gzip.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()  # antes do `config`: o .env define STORAGE_BACKEND, SERVER_PORT...
+
+from cache import _MISSING, MemoryLRUCache  # noqa: E402
+from config import (DEFAULT_PORTFOLIO_ID, PORTFOLIO_JSON, SERVER_HOST, SERVER_PORT,  # noqa: E402
+                    SERVER_REFRESH_SECONDS, STORAGE_BACKEND)
+from data_layer.assets import AssetUniverse, get_universe, universe_version  # noqa: E402
+from data_layer.portfolio import calc_portfolio_metrics, read_portfolio  # noqa: E402
+from data_layer.storage import get_store  # noqa: E402
+from utils import simulate_projection  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 500
+GZIP_MIN_BYTES = 1024
+
+_UNIVERSE_COLUMNS = ["ticker", "nome", "tipo", "preco_atual", "dy_12m", "data_atualizacao"]
+_ORDERS = {"dy": "dy_12m", "preco": "preco_atual"}
+_PROJECTION_PARAMS = {  # parâmetro → (argumento de simulate_projection, padrão, escala)
+    "aporte": ("monthly_contribution", 1000.0, 1),
+    "meta": ("target_monthly_income", 5000.0, 1),
+    "valorizacao": ("yearly_return", 6.0, 100),
+    "crescimento_dividendos": ("yearly_dividend_growth", 2.0, 100),
+    "crescimento_aporte": ("yearly_contrib_growth", 0.0, 100),
+    "anos": ("max_years", 30, 1),
+}
+
+
+class ApiError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Payload:
+    """Corpo JSON pronto para envio: serializado (e comprimido) uma única vez, com ETag do conteúdo."""
+
+    __slots__ = ("body", "etag", "_gzip")
+
+    def __init__(self, data):
+        self.body = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=12).hexdigest() + '"'
+        self._gzip: bytes | None = None
+
+    def gzipped(self) -> bytes:
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.body, compresslevel=6)
+        return self._gzip
+
+
+def _records(df: pd.DataFrame) -> list[dict]:
+    """Linhas do DataFrame como JSON nativo (NaN → null, datas ISO)."""
+    return json.loads(df.to_json(orient="records", date_format="iso", force_ascii=False))
+
+
+def _portfolio_versions() -> dict[str, str]:
+    if STORAGE_BACKEND == "sqlite":
+        return get_store().portfolio_versions()
+    try:
+        return {DEFAULT_PORTFOLIO_ID: str(os.stat(PORTFOLIO_JSON).st_mtime_ns)}
+    except FileNotFoundError:
+        return {DEFAULT_PORTFOLIO_ID: ""}
+
+
+class SnapshotStore:
+    """
+    Snapshots versionados do universo e das carteiras. `refresh` compara as
+    versões em disco com as dos snapshots e refaz só o que mudou; as
+    respostas derivadas (filtros, páginas, projeções) ficam num LRU cuja
+    chave inclui a versão, então entradas antigas apenas deixam de ser usadas.
+    """
+
+    def __init__(self, refresh_seconds: float = SERVER_REFRESH_SECONDS, max_responses: int = 2048):
+        self.refresh_seconds = refresh_seconds
+        self.universe: AssetUniverse | None = None
+        self.universe_version: tuple | None = None
+        self._portfolios: dict[str, tuple[str, dict, Payload]] = {}  # id → (versão, métricas, payload)
+        self._index = Payload({"carteiras": []})
+        self._responses = MemoryLRUCache(max_responses)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ---- Atualização ----
+
+    def refresh(self) -> bool:
+        """Reconstrói os snapshots cujas versões mudaram. Retorna se algo mudou."""
+        with self._lock:
+            changed = False
+            version = universe_version()
+            if version != self.universe_version:
+                try:
+                    self.universe = get_universe(refresh=False)
+                except FileNotFoundError:
+                    self.universe = AssetUniverse(pd.DataFrame(columns=_UNIVERSE_COLUMNS))
+                self.universe_version = version
+                changed = True
+                logger.info("Snapshot do universo: %d ativos (versão %s)", len(self.universe), version)
+
+            u = self._universe_tag()
+            versions = {pid: f"{u}:{v}" for pid, v in _portfolio_versions().items()}
+            portfolios = {}
+            for pid, v in versions.items():
+                current = self._portfolios.get(pid)
+                if current and current[0] == v:
+                    portfolios[pid] = current
+                    continue
+                try:
+                    portfolios[pid] = self._build_portfolio(pid, v)
+                except ValueError as e:  # JSON pela metade: mantém o snapshot anterior e tenta no próximo ciclo
+                    logger.warning("Carteira '%s' ilegível, snapshot anterior mantido: %s", pid, e)
+                    if current is None:
+                        continue
+                    portfolios[pid] = current
+                changed |= portfolios[pid] is not current
+            changed |= portfolios.keys() != self._portfolios.keys()
+            if changed:
+                self._portfolios = portfolios
+                self._index = Payload({"carteiras": [{"id": pid, "versao": v}
+                                                     for pid, (v, _, _) in sorted(portfolios.items())]})
+            return changed
+
+    def _universe_tag(self) -> str:
+        return "-".join(str(x) for x in self.universe_version) if self.universe_version else "0"
+
+    def _build_portfolio(self, portfolio_id: str, version: str) -> tuple[str, dict, Payload]:
+        df, totals = calc_portfolio_metrics(read_portfolio(portfolio_id), self.universe, fetch_missing=False)
+        metrics = {"carteira": portfolio_id, "versao": version, "totais": totals, "posicoes": _records(df)}
+        return version, metrics, Payload(metrics)
+
+    def start(self) -> None:
+        def loop():
+            while not self._stop.wait(self.refresh_seconds):
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("Falha ao atualizar os snapshots")
+
+        self._thread = threading.Thread(target=loop, name="snapshots", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    # ---- Rotas ----
+
+    def route(self, path: str, query: dict[str, str]) -> Payload:
+        parts = [unquote(p) for p in path.strip("/").split("/") if p]
+        if parts == ["saude"]:
+            return Payload({"status": "ok", "universo": self._universe_tag(), "carteiras": len(self._portfolios)})
+        if parts == ["universo"]:
+            return self._cached(("universo", self._universe_tag(), tuple(sorted(query.items()))),
+                                lambda: self._universe_page(query))
+        if parts == ["carteiras"]:
+            return self._index
+        if len(parts) in (2, 3) and parts[0] == "carteiras":
+            snapshot = self._portfolios.get(parts[1])
+            if snapshot is None:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"Carteira não encontrada: {parts[1]}")
+            version, metrics, payload = snapshot
+            if len(parts) == 2:
+                return payload
+            if parts[2] == "projecao":
+                params = self._projection_params(query)
+                return self._cached(("projecao", parts[1], version, tuple(sorted(params.items()))),
+                                    lambda: self._projection(metrics, params))
+        raise ApiError(HTTPStatus.NOT_FOUND, f"Rota inexistente: {path}")
+
+    def _cached(self, key: tuple, build) -> Payload:
+        key = repr(key)
+        payload = self._responses.get(key)
+        if payload is _MISSING:
+            payload = Payload(build())
+            self._responses.set(key, payload, None)
+        return payload
+
+    def _universe_page(self, query: dict[str, str]) -> dict:
+        pagina = _int(query, "pagina", 1, lo=1)
+        por_pagina = _int(query, "por_pagina", 50, lo=1, hi=MAX_PAGE_SIZE)
+        ordem = query.get("ordem", "")
+        sort_by = _ORDERS.get(ordem.lstrip("-"))
+        if ordem and sort_by is None:
+            raise ApiError(HTTPStatus.BAD_REQUEST, f"ordem inválida: {ordem} (use dy, -dy, preco ou -preco)")
+        df = self.universe.screener().query(
+            preco_min=_float(query, "preco_min"), preco_max=_float(query, "preco_max"),
+            dy_min=_float(query, "dy_min"), dy_max=_float(query, "dy_max"),
+            tipos=query["tipo"].split(",") if query.get("tipo") else None,
+            sort_by=sort_by, ascending=not ordem.startswith("-"),
+        ) if len(self.universe) else self.universe.df
+        busca = query.get("q", "").strip().upper()
+        if busca:
+            df = df[df["ticker"].str.contains(busca, regex=False, na=False) |
+                    df["nome"].astype(str).str.upper().str.contains(busca, regex=False, na=False)]
+        inicio = (pagina - 1) * por_pagina
+        return {
+            "versao": self._universe_tag(), "total": len(df), "pagina": pagina, "por_pagina": por_pagina,
+            "itens": _records(df[_UNIVERSE_COLUMNS].iloc[inicio:inicio + por_pagina]),
+        }
+
+    @staticmethod
+    def _projection_params(query: dict[str, str]) -> dict:
+        params = {}
+        for name, (arg, default, scale) in _PROJECTION_PARAMS.items():
+            if isinstance(default, int):
+                params[arg] = _int(query, name, default, lo=1, hi=50)
+            else:
+                value = _float(query, name)
+                params[arg] = (default if value is None else value) / scale
+        return params
+
+    @staticmethod
+    def _projection(metrics: dict, params: dict) -> dict:
+        totals = metrics["totais"]
+        df, months = simulate_projection(start_capital=totals["Patrimônio (R$)"],
+                                         current_monthly_income=totals["Renda Mensal (R$)"], **params)
+        df["Data"] = df["Data"].dt.strftime("%Y-%m")
+        return {
+            "carteira": metrics["carteira"], "versao": metrics["versao"], "premissas": params,
+            "meses_ate_meta": months, "data_meta": df["Data"].iloc[months] if months is not None else None,
+            "serie": _records(df),
+        }
+
+
+def _float(query: dict[str, str], name: str) -> float | None:
+    if name not in query or query[name] == "":
+        return None
+    try:
+        return float(query[name])
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} deve ser numérico") from None
+
+
+def _int(query: dict[str, str], name: str, default: int, lo: int, hi: int | None = None) -> int:
+    try:
+        value = int(query.get(name) or default)
+    except ValueError:
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} deve ser inteiro") from None
+    if value < lo or (hi is not None and value > hi):
+        raise ApiError(HTTPStatus.BAD_REQUEST, f"{name} fora do intervalo [{lo}, {hi or '∞'}]")
+    return value
+
+
+# ---- HTTP ----
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: sempre com Content-Length
+    disable_nagle_algorithm = True  # cabeçalhos e corpo saem em escritas separadas
+    server_version = "DashboardInvestBR"
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            payload = self.server.snapshots.route(url.path, query)
+            status = HTTPStatus.OK
+        except ApiError as e:
+            payload, status = Payload({"erro": str(e)}), e.status
+        except Exception:
+            logger.exception("Erro em %s", self.path)
+            payload, status = Payload({"erro": "erro interno"}), HTTPStatus.INTERNAL_SERVER_ERROR
+
+        if status == HTTPStatus.OK and payload.etag in self.headers.get("If-None-Match", ""):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", payload.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = payload.body
+        gzipped = len(body) >= GZIP_MIN_BYTES and "gzip" in self.headers.get("Accept-Encoding", "")
+        if gzipped:
+            body = payload.gzipped()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Vary", "Accept-Encoding")
+        if status == HTTPStatus.OK:
+            self.send_header("ETag", payload.etag)
+            self.send_header("Cache-Control", "no-cache")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("%s %s", self.address_string(), format % args)
+
+
+def make_server(host: str = SERVER_HOST, port: int = SERVER_PORT,
+                snapshots: SnapshotStore | None = None) -> ThreadingHTTPServer:
+    """Servidor pronto para `serve_forever`, com os snapshots já carregados."""
+    if snapshots is None:
+        snapshots = SnapshotStore()
+        snapshots.refresh()
+    server = ThreadingHTTPServer((host, port), ApiHandler)
+    server.daemon_threads = True
+    server.snapshots = snapshots
+    return server
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog="server.py", description="API JSON somente leitura do Dashboard Invest BR")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args(argv)
+
+    from logging_setup import setup_logging
+    setup_logging()
+    server = make_server(args.host, args.port)
+    server.snapshots.start()
+    logger.info("API em http://%s:%d", args.host, args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.snapshots.stop()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
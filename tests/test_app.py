@@ -2,17 +2,58 @@
 Testes unitários — Dashboard Investimentos BR.
 Execute com: pytest tests/
 """
+import io
 import json
 import os
 import pytest
 import sys
+import threading
+import time
+from datetime import datetime
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from data_layer.portfolio import upsert_position, clean_positions, save_portfolio, load_portfolio
-from data_layer.assets import classify_ticker
+from data_layer.portfolio import (
+    apply_operation, clean_positions, load_operations, load_portfolio, save_portfolio, upsert_position,
+)
+from data_layer.assets import AssetScreener, classify_ticker, fill_dy_bulk, refresh_dy
+import data_layer.assets as _assets_mod
+import api.scraping as _scraping_mod
+import data_layer.dividends as _dividends_mod
+import data_layer.importer as _importer_mod
+import data_layer.exports as _exports_mod
+from data_layer.metrics import PortfolioMetrics, portfolio_signature
 from data_layer.proventos import add_provento, load_proventos
 from utils import simulate_projection
+import utils as _utils_mod
+from cache import MemoryLRUCache, SQLiteCache, cached, _MISSING as _CACHE_MISSING
+import cache as _cache_mod
+from api.singleflight import SingleFlight
+from data_layer.storage import PortfolioStore
+import data_layer.storage as _storage_mod
+import charts
+from analytics.fiscal import darf_table, monthly_tax
+import analytics.fiscal as _fiscal_mod
+from analytics.rebalance import rebalance
+import analytics.risk as _risk_mod
+import analytics.optimizer as _optimizer_mod
+import logging
+import logging_setup as _logging_mod
+import data_layer.history as _history_mod
+import data_layer.alerts as _alerts_mod
+import cli as _cli_mod
+import server as _server_mod
+import profiling as _profiling_mod
+import loadtest as _loadtest_mod
+import api.prices as _prices_mod
+from brapi import Brapi
+import inspect
+import gzip
+import http.client
+import subprocess
+from analytics.projection import allocation_vector, simulate_asset_projection
+import numpy as np
+import pandas as pd
 import data_layer.portfolio as _portfolio_mod
 import data_layer.proventos as _proventos_mod
 
@@ -193,6 +234,8 @@ class TestPortfolioIO:
         monkeypatch.setattr(_portfolio_mod, "DATA_DIR", str(tmp_path))
         loaded = load_portfolio()
         assert loaded == {"positions": []}
+        backups = list(tmp_path.glob("portfolio.json.*.corrompido"))
+        assert len(backups) == 1 and backups[0].read_text(encoding="utf-8") == "INVALID JSON {{{"
 
 
 # ============= Proventos I/O =============
@@ -218,3 +261,1496 @@ class TestProventosIO:
     def test_carrega_proventos_inexistente_retorna_vazio(self, tmp_path, monkeypatch):
         monkeypatch.setattr(_proventos_mod, "PROVENTOS_JSON", str(tmp_path / "nao_existe.json"))
         assert load_proventos() == []
+
+
+# ============= Cache =============
+
+class TestCache:
+    def test_lru_descarta_menos_usado(self):
+        c = MemoryLRUCache(max_entries=2)
+        c.set("a", 1, None)
+        c.set("b", 2, None)
+        c.get("a")
+        c.set("c", 3, None)
+        assert c.get("a") == 1
+        assert c.get("b") is _CACHE_MISSING
+        assert len(c) == 2
+
+    def test_ttl_expira_entrada(self, monkeypatch):
+        c = MemoryLRUCache()
+        monkeypatch.setattr(_cache_mod.time, "time", lambda: 1000.0)
+        c.set("k", "v", ttl=10)
+        assert c.get("k") == "v"
+        monkeypatch.setattr(_cache_mod.time, "time", lambda: 1011.0)
+        assert c.get("k") is _CACHE_MISSING
+
+    def test_sqlite_compartilhado_entre_instancias(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite3")
+        SQLiteCache(path).set("PETR4", 38.5, ttl=60)
+        assert SQLiteCache(path).get("PETR4") == 38.5
+
+    def test_sqlite_respeita_limite(self, tmp_path):
+        c = SQLiteCache(str(tmp_path / "cache.sqlite3"), max_entries=3)
+        for i in range(5):
+            c.set(f"k{i}", i, ttl=60)
+        assert len(c) == 3
+        assert c.get("k4") == 4
+
+    def test_decorator_memoiza_e_limpa(self):
+        calls = []
+
+        @cached(ttl=60, backend=MemoryLRUCache())
+        def dobro(x):
+            calls.append(x)
+            return x * 2
+
+        assert dobro(2) == 4 and dobro(2) == 4
+        assert calls == [2]
+        dobro.clear()
+        dobro(2)
+        assert calls == [2, 2]
+
+    def test_replicas_buscam_cada_chave_uma_vez(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite3")
+        calls, results = [], []
+
+        def upstream(ticker):
+            calls.append(ticker)
+            time.sleep(0.2)
+            return 0.085
+
+        # Cada réplica com o próprio backend (conexão própria) sobre o mesmo arquivo
+        replicas = [cached(ttl=60, backend=SQLiteCache(path))(upstream) for _ in range(4)]
+        threads = [threading.Thread(target=lambda f=f: results.append(f("MXRF11"))) for f in replicas]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert calls == ["MXRF11"] and results == [0.085] * 4
+
+    def test_falha_ou_morte_de_quem_reivindicou_nao_prende_os_demais(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite3")
+        calls, erros = [], []
+
+        def upstream(ticker):
+            calls.append(ticker)
+            if len(calls) == 1:
+                time.sleep(0.1)
+                raise RuntimeError("upstream fora do ar")
+            return 0.085
+
+        a, b = (cached(ttl=60, backend=SQLiteCache(path))(upstream) for _ in range(2))
+
+        def primeira():
+            try:
+                a("MXRF11")
+            except RuntimeError as e:
+                erros.append(e)
+
+        t = threading.Thread(target=primeira)
+        t.start()
+        while not calls:
+            time.sleep(0.001)
+        assert b("MXRF11") == 0.085  # a reivindicação foi liberada com a falha: busca por conta própria
+        t.join()
+        assert len(erros) == 1 and calls == ["MXRF11", "MXRF11"]
+
+        # Dono que morreu sem liberar: a reivindicação vence e outro processo assume
+        key = f"{upstream.__module__}.{upstream.__qualname__}:" + repr((("PETR4",), []))
+        assert SQLiteCache(path).claim(key, 0.1)
+        assert b("PETR4") == 0.085 and not SQLiteCache(path).claimed(key)
+
+
+# ============= Single-flight =============
+
+class TestSingleFlight:
+    def test_chamadas_concorrentes_compartilham_resultado(self):
+        sf = SingleFlight()
+        calls = []
+        gate = threading.Event()
+
+        def upstream():
+            calls.append(1)
+            gate.wait(2)
+            return 42
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(sf.do(("preco", "HGLG11"), upstream)))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        while sf.stats["suprimidas"] < 7:
+            time.sleep(0.001)
+        gate.set()
+        for t in threads:
+            t.join()
+        assert calls == [1]
+        assert results == [42] * 8
+        assert sf.stats["executadas"] == 1
+        assert sf.in_flight() == 0
+
+    def test_excecao_propagada_e_chave_liberada(self):
+        sf = SingleFlight()
+
+        def falha():
+            raise RuntimeError("upstream fora do ar")
+
+        with pytest.raises(RuntimeError):
+            sf.do("k", falha)
+        assert sf.do("k", lambda: "ok") == "ok"
+
+
+# ============= Armazenamento SQLite =============
+
+class TestPortfolioStore:
+    def test_carteiras_isoladas_por_id(self, tmp_path):
+        store = PortfolioStore(str(tmp_path / "carteiras.sqlite3"))
+        store.save_portfolio("ana", {"positions": [_pos("HGLG11", 10, 100.0)]})
+        store.save_portfolio("bruno", {"positions": [_pos("ITUB4", 5, 30.0)]})
+        assert [p["ticker"] for p in store.load_portfolio("ana")["positions"]] == ["HGLG11"]
+        assert [p["ticker"] for p in store.load_portfolio("bruno")["positions"]] == ["ITUB4"]
+        assert store.list_portfolios() == ["ana", "bruno"]
+
+    def test_apply_operation_segue_semantica_de_pm(self, tmp_path):
+        store = PortfolioStore(str(tmp_path / "carteiras.sqlite3"))
+        store.apply_operation("ana", "knri11", 100, 200.0)
+        store.apply_operation("ana", "KNRI11", 100, 220.0)
+        store.apply_operation("ana", "KNRI11", -50, 250.0)
+        pos = store.load_portfolio("ana")["positions"][0]
+        assert pos["quantity"] == 150
+        assert pos["avg_price"] == pytest.approx(210.0)
+        store.apply_operation("ana", "KNRI11", -500, 250.0)
+        assert store.load_portfolio("ana")["positions"] == []
+
+    def test_migracao_dos_json_concorrente_importa_uma_vez(self, tmp_path, monkeypatch):
+        pf = {"positions": [_pos("MXRF11", 10, 10.0)],
+              "operations": [{"data": "2026-01-02", "ticker": "MXRF11", "quantity": 10, "price": 10.0}]}
+        (tmp_path / "portfolio.json").write_text(json.dumps(pf), encoding="utf-8")
+        (tmp_path / "proventos.json").write_text(json.dumps([{"ticker": "MXRF11", "data": "2026-02-15",
+                                                               "valor_por_cota": 0.1, "quantidade": 10,
+                                                               "total": 1.0}]), encoding="utf-8")
+        monkeypatch.setattr(_storage_mod, "PORTFOLIO_JSON", str(tmp_path / "portfolio.json"))
+        monkeypatch.setattr(_storage_mod, "PROVENTOS_JSON", str(tmp_path / "proventos.json"))
+        path = str(tmp_path / "carteiras.sqlite3")
+        PortfolioStore(path)
+        juntos = threading.Barrier(2)
+        ler = _storage_mod._read_json
+
+        def read_json(p):  # os dois processos leem os JSON antes de qualquer um gravar
+            juntos.wait(5)
+            return ler(p)
+
+        monkeypatch.setattr(_storage_mod, "_read_json", read_json)
+        resultados = []
+        threads = [threading.Thread(target=lambda: resultados.append(PortfolioStore(path).import_json_files()))
+                   for _ in range(2)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(resultados) == [False, True]
+        store = PortfolioStore(path)
+        assert len(store.load_operations("default")) == 1 and len(store.load_proventos("default")) == 1
+        assert store.load_portfolio("default")["positions"] == [_pos("MXRF11", 10, 10.0)]
+
+    def test_escritores_concorrentes_nao_perdem_operacoes(self, tmp_path):
+        path = str(tmp_path / "carteiras.sqlite3")
+        PortfolioStore(path)
+
+        def compra():
+            store = PortfolioStore(path)
+            for _ in range(10):
+                store.apply_operation("ana", "MXRF11", 1, 10.0)
+
+        threads = [threading.Thread(target=compra) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert PortfolioStore(path).load_portfolio("ana")["positions"][0]["quantity"] == 40
+
+    def test_backend_sqlite_nas_funcoes_de_carteira(self, tmp_path, monkeypatch):
+        store = PortfolioStore(str(tmp_path / "carteiras.sqlite3"))
+        monkeypatch.setattr(_portfolio_mod, "STORAGE_BACKEND", "sqlite")
+        monkeypatch.setattr(_portfolio_mod, "get_store", lambda: store)
+        monkeypatch.setattr(_proventos_mod, "STORAGE_BACKEND", "sqlite")
+        monkeypatch.setattr(_proventos_mod, "get_store", lambda: store)
+        save_portfolio({"positions": [_pos("HGLG11", 10, 100.0)]}, "ana")
+        add_provento("HGLG11", "2026-03-01", 0.85, 10, portfolio_id="ana")
+        assert load_portfolio("ana")["positions"][0]["quantity"] == 10
+        assert load_portfolio("bruno") == {"positions": []}
+        assert load_proventos("ana")[0]["total"] == pytest.approx(8.5)
+        assert load_proventos("bruno") == []
+
+
+# ============= Figuras =============
+
+class TestCharts:
+    def test_lttb_preserva_extremos_e_pico(self):
+        y = np.sin(np.linspace(0, 6, 5_000))
+        y[2_500] = 10.0
+        idx = charts.lttb(np.arange(5_000), y, 200)
+        assert len(idx) == 200
+        assert idx[0] == 0 and idx[-1] == 4_999
+        assert 2_500 in idx
+        assert (np.diff(idx) > 0).all()
+
+    def test_downsample_serie_curta_inalterada(self):
+        df = pd.DataFrame({"Date": pd.date_range("2026-01-01", periods=50), "Close": range(50)})
+        assert charts.downsample(df, "Date", "Close") is df
+
+    def test_figura_memoizada_pelo_conteudo(self):
+        df = pd.DataFrame({"Ticker": ["HGLG11", "ITUB4"], "Valor de Mercado (R$)": [1000.0, 500.0]})
+        fig = charts.allocation_pie(df)
+        assert charts.allocation_pie(df.copy()) is fig
+        df2 = df.assign(**{"Valor de Mercado (R$)": [1000.0, 600.0]})
+        assert charts.allocation_pie(df2) is not fig
+
+    def test_benchmark_reduzido_no_payload(self):
+        hist = pd.DataFrame({
+            "Date": pd.date_range("2021-01-01", periods=1_500, tz="America/Sao_Paulo"),
+            "Close": np.linspace(100, 150, 1_500),
+        })
+        fig = charts.benchmark_line(hist, "IFIX", "5 anos", 3.0)
+        assert len(fig.data[0].x) == charts.MAX_SERIES_POINTS
+
+
+# ============= Apuração fiscal =============
+
+def _op(data, ticker, tipo, quantity, price, avg_price, day_trade=False):
+    return {"data": data, "ticker": ticker, "tipo": tipo, "quantity": quantity,
+            "price": price, "avg_price": avg_price, "day_trade": day_trade}
+
+
+class TestFiscal:
+    def test_vendas_de_acoes_ate_20k_isentas(self):
+        ops = pd.DataFrame([_op("2026-01-10", "PETR4", "Ação", -100, 40.0, 30.0)])
+        tax = monthly_tax(ops)
+        assert bool(tax.loc[0, "isento"])
+        assert tax.loc[0, "imposto"] == 0.0
+
+    def test_etf_nao_tem_isencao(self):
+        ops = pd.DataFrame([_op("2026-01-10", "BOVA11", "ETF", -10, 120.0, 100.0)])
+        assert monthly_tax(ops).loc[0, "imposto"] == pytest.approx(30.0)
+
+    def test_prejuizo_compensado_em_meses_seguintes(self):
+        ops = pd.DataFrame([
+            _op("2026-02-10", "VALE3", "Ação", -1000, 50.0, 60.0),
+            _op("2026-03-10", "ITUB4", "Ação", -1000, 35.0, 20.0),
+            _op("2026-04-10", "ITUB4", "Ação", -1000, 35.0, 20.0),
+        ])
+        tax = monthly_tax(ops)
+        assert tax["prejuizo_compensado"].tolist() == pytest.approx([0.0, 10_000.0, 0.0])
+        assert tax["imposto"].tolist() == pytest.approx([0.0, 750.0, 2_250.0])
+
+    def test_categorias_apuradas_separadamente(self):
+        ops = pd.DataFrame([
+            _op("2026-03-11", "HGLG11", "FII", -10, 150.0, 170.0),
+            _op("2026-03-12", "BBAS3", "Ação", 100, 20.0, 0.0, day_trade=True),
+            _op("2026-03-12", "BBAS3", "Ação", -100, 21.0, 0.0, day_trade=True),
+        ])
+        darf = darf_table(monthly_tax(ops))
+        assert darf.loc[0, "Day trade (R$)"] == pytest.approx(20.0)
+        assert darf.loc[0, "FII (R$)"] == 0.0
+        assert darf.loc[0, "Vencimento"] == "2026-04-30"
+
+    def test_venda_day_trade_maior_que_as_compras_do_dia(self):
+        ops = pd.DataFrame([
+            _op("2026-03-12", "BBAS3", "Ação", 50, 20.0, 10.0, day_trade=True),
+            _op("2026-03-12", "BBAS3", "Ação", -30, 21.0, 10.0, day_trade=True),
+            _op("2026-03-12", "BBAS3", "Ação", -50, 21.0, 10.0, day_trade=True),
+        ])
+        res = _fiscal_mod.realized_results(ops)
+        assert res[["categoria", "quantity", "resultado"]].values.tolist() == [
+            ["Day trade", -30, pytest.approx(30.0)], ["Day trade", -20, pytest.approx(20.0)],
+            ["Swing trade", -30, pytest.approx(330.0)]]
+
+    def test_darf_abaixo_de_10_reais_vai_para_o_mes_seguinte(self):
+        ops = pd.DataFrame([
+            _op("2026-01-12", "BOVA11", "ETF", -10, 104.0, 100.0),  # R$ 6,00
+            _op("2026-02-12", "BOVA11", "ETF", -10, 103.0, 100.0),  # R$ 4,50
+            _op("2026-03-12", "BOVA11", "ETF", -10, 102.0, 100.0),  # R$ 3,00: fica para depois
+        ])
+        darf = darf_table(monthly_tax(ops))
+        assert darf["Mês"].tolist() == ["2026-02"]
+        assert darf.loc[0, "Meses anteriores (R$)"] == pytest.approx(6.0)
+        assert darf.loc[0, "Total DARF (R$)"] == pytest.approx(10.5)
+
+    def test_compra_day_trade_nao_altera_pm_de_swing(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_portfolio_mod, "PORTFOLIO_JSON", str(tmp_path / "portfolio.json"))
+        monkeypatch.setattr(_portfolio_mod, "DATA_DIR", str(tmp_path))
+        store = PortfolioStore(str(tmp_path / "carteiras.sqlite3"))
+        for t, q, p, dt in [("BBAS3", 100, 10.0, False), ("BBAS3", 50, 20.0, True), ("BBAS3", -50, 21.0, True)]:
+            apply_operation(t, q, p, data="2026-03-12", day_trade=dt)
+            store.apply_operation("ana", t, q, p, data="2026-03-12", day_trade=dt)
+        assert load_portfolio()["positions"] == [{"ticker": "BBAS3", "quantity": 100, "avg_price": 10.0}]
+        assert store.load_portfolio("ana")["positions"] == [{"ticker": "BBAS3", "quantity": 100, "avg_price": 10.0}]
+
+    def test_operacoes_registradas_com_pm_vigente(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_portfolio_mod, "PORTFOLIO_JSON", str(tmp_path / "portfolio.json"))
+        monkeypatch.setattr(_portfolio_mod, "DATA_DIR", str(tmp_path))
+        apply_operation("HGLG11", 10, 100.0, data="2026-01-05")
+        apply_operation("HGLG11", -5, 120.0, data="2026-02-05")
+        ops = load_operations()
+        assert ops["avg_price"].tolist() == pytest.approx([0.0, 100.0])
+        assert ops["tipo"].tolist() == ["FII", "FII"]
+        assert load_portfolio()["positions"][0]["quantity"] == 5
+
+
+# ============= Rebalanceamento =============
+
+def _metrics(*rows):
+    return pd.DataFrame([
+        {"Ticker": t, "Tipo": tipo, "Qtde": q, "Preço Atual (R$)": p, "Valor de Mercado (R$)": q * p}
+        for t, tipo, q, p in rows
+    ])
+
+
+class TestRebalance:
+    def test_aporte_vai_para_ativo_abaixo_do_alvo(self):
+        df = _metrics(("HGLG11", "FII", 10, 100.0), ("ITUB4", "Ação", 0, 25.0))
+        orders, sobra = rebalance(df, {"HGLG11": 50, "ITUB4": 50}, 1_000.0)
+        assert orders.set_index("Ticker").loc["ITUB4", "Comprar (qtde)"] == 40
+        assert orders["Comprar (qtde)"].dtype.kind == "i"
+        assert sobra == pytest.approx(0.0)
+
+    def test_nunca_gasta_mais_que_o_aporte(self):
+        df = _metrics(("A11", "FII", 3, 97.3), ("B3", "Ação", 7, 13.1), ("C11", "ETF", 1, 101.0))
+        orders, sobra = rebalance(df, {"FII": 40, "Ação": 40, "ETF": 20}, 777.0, by="Tipo")
+        assert orders["Valor da compra (R$)"].sum() <= 777.0 + 1e-9
+        assert sobra >= 0
+        assert sobra < orders["Preço Atual (R$)"].min()
+
+    def test_alvo_por_tipo_dividido_entre_ativos(self):
+        df = _metrics(("A11", "FII", 10, 10.0), ("B11", "FII", 30, 10.0), ("C3", "Ação", 0, 10.0))
+        orders, _ = rebalance(df, {"FII": 50, "Ação": 50}, 400.0, by="Tipo")
+        assert orders["Peso alvo (%)"].tolist() == pytest.approx([12.5, 37.5, 50.0])
+        assert orders.set_index("Ticker").loc["C3", "Comprar (qtde)"] == 40
+
+
+# ============= Screener =============
+
+def _universo():
+    return pd.DataFrame([
+        {"ticker": "HGLG11", "nome": "CSHG Log", "tipo": "FII", "preco_atual": 160.0, "dy_12m": 8.5,
+         "data_atualizacao": "2026-10-19 10:00"},
+        {"ticker": "MXRF11", "nome": "Maxi Renda", "tipo": "FII", "preco_atual": 9.8, "dy_12m": 12.1,
+         "data_atualizacao": "2026-10-19 10:00"},
+        {"ticker": "KNCR11", "nome": "Kinea RI", "tipo": "FII", "preco_atual": 98.0, "dy_12m": 11.0,
+         "data_atualizacao": "2026-09-01 10:00"},
+        {"ticker": "ITUB4", "nome": "Itaú", "tipo": "Ação", "preco_atual": 35.0, "dy_12m": 9.5,
+         "data_atualizacao": ""},
+        {"ticker": "BOVA11", "nome": "iShares Ibov", "tipo": "ETF", "preco_atual": 120.0, "dy_12m": 0.0,
+         "data_atualizacao": "2026-10-19 10:00"},
+    ])
+
+
+class TestAssetScreener:
+    def test_faixas_tipo_e_frescor(self):
+        sc = AssetScreener(_universo())
+        r = sc.query(preco_max=100, dy_min=9, tipos=["FII"], max_age_hours=24,
+                     now=datetime(2026, 10, 19, 12, 0))
+        assert r["ticker"].tolist() == ["MXRF11"]
+
+    def test_ordenacao_e_top_k(self):
+        sc = AssetScreener(_universo())
+        r = sc.query(dy_min=9, sort_by="dy_12m", top_k=2)
+        assert r["ticker"].tolist() == ["MXRF11", "KNCR11"]
+
+    def test_sem_filtros_mantem_ordem_do_universo(self):
+        df = _universo()
+        assert AssetScreener(df).query()["ticker"].tolist() == df["ticker"].tolist()
+
+    def test_sem_data_nunca_e_fresco(self):
+        sc = AssetScreener(_universo())
+        r = sc.query(tipos=["Ação"], max_age_hours=10_000, now=datetime(2026, 10, 19))
+        assert r.empty
+
+
+# ============= DY em lote =============
+
+class _FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self._payload = payload
+
+    def json(self):
+        return self._payload
+
+
+class TestDyBulk:
+    def test_parse_do_buscador_statusinvest(self, monkeypatch):
+        monkeypatch.setattr(_cache_mod, "_backend", MemoryLRUCache())
+        payload = [{"ticker": "mxrf11", "dy": 12.1}, {"ticker": "HGLG11", "dy": None}, {"ticker": "", "dy": 5}]
+        monkeypatch.setattr(_scraping_mod, "_scrape_with_retry", lambda url, label: _FakeResponse(payload))
+        assert _scraping_mod.get_dy_bulk_from_statusinvest("FII") == {"MXRF11": pytest.approx(0.121)}
+        assert _scraping_mod.get_dy_bulk_from_statusinvest("ETF") == {}
+
+    def test_fill_dy_bulk_preenche_universo(self):
+        df = fill_dy_bulk(_universo(), {"ITUB4": 0.08, "BOVA11": 0.01})
+        assert df.set_index("ticker").loc["ITUB4", "dy_12m"] == pytest.approx(8.0)
+        assert df.set_index("ticker").loc["HGLG11", "dy_12m"] == pytest.approx(8.5)
+        assert df.set_index("ticker").loc["ITUB4", "data_atualizacao"] != ""
+
+    def test_scraping_apenas_para_lacunas(self, monkeypatch):
+        scraped = []
+        monkeypatch.setattr(_assets_mod, "get_dy_bulk", lambda: {"HGLG11": 0.09, "MXRF11": 0.12})
+        monkeypatch.setattr(_assets_mod, "get_dy_estimate",
+                            lambda t, tipo: scraped.append(t) or 0.05)
+        result = refresh_dy(_universo())
+        assert sorted(scraped) == ["BOVA11", "ITUB4", "KNCR11"]
+        assert result["HGLG11"] == pytest.approx(9.0)
+        assert result["ITUB4"] == pytest.approx(5.0)
+
+
+# ============= Histórico de dividendos / DY local =============
+
+class TestDividendHistory:
+    def _setup(self, tmp_path, monkeypatch, fetched):
+        monkeypatch.setattr(_dividends_mod, "DIVIDENDOS_CSV", str(tmp_path / "dividendos.csv"))
+        monkeypatch.setattr(_dividends_mod, "DATA_DIR", str(tmp_path))
+        monkeypatch.setattr(_dividends_mod, "_ttm_cache", {})
+        calls = []
+
+        def fake_fetch(tickers, start=None):
+            calls.append((tuple(tickers), start))
+            return fetched[fetched["ticker"].isin(tickers)]
+
+        monkeypatch.setattr(_dividends_mod, "fetch_dividend_history", fake_fetch)
+        return calls
+
+    def test_atualizacao_incremental(self, tmp_path, monkeypatch):
+        fetched = pd.DataFrame({"ticker": ["MXRF11", "MXRF11"], "data": ["2026-08-15", "2026-09-15"],
+                                "valor": [0.10, 0.10]})
+        calls = self._setup(tmp_path, monkeypatch, fetched)
+        assert _dividends_mod.update_dividend_history(["MXRF11"]) == 2
+        assert _dividends_mod.update_dividend_history(["mxrf11"]) == 0
+        assert calls[-1] == (("MXRF11",), "2026-09-15")
+        assert len(_dividends_mod.load_dividend_history()) == 2
+
+    def test_dy_ttm_recalculado_sem_rede(self, tmp_path, monkeypatch):
+        fetched = pd.DataFrame({
+            "ticker": ["MXRF11"] * 13,
+            "data": [f"{2025 + (m + 8) // 12}-{(m + 8) % 12 + 1:02d}-15" for m in range(13)],
+            "valor": [0.10] * 13,
+        })
+        self._setup(tmp_path, monkeypatch, fetched)
+        _dividends_mod.update_dividend_history(["MXRF11"])
+        ttm = _dividends_mod.ttm_dividends(datetime(2026, 10, 1))
+        assert ttm["MXRF11"] == pytest.approx(1.2)
+        precos = pd.Series({"MXRF11": 10.0, "HGLG11": 160.0})
+        dy = _dividends_mod.compute_dy(precos, ttm)
+        assert dy["MXRF11"] == pytest.approx(12.0)
+        assert pd.isna(dy["HGLG11"])
+
+
+# ============= Importação de extratos =============
+
+_EXTRATO_B3 = (
+    "Data do Negócio;Tipo de Movimentação;Mercado;Código de Negociação;Quantidade;Preço;Valor\n"
+    "05/02/2026;Compra;Mercado à Vista;KNRI11;100;220,00;22.000,00\n"
+    "03/01/2026;Compra;Mercado à Vista;KNRI11;100;200,00;20.000,00\n"
+    "10/03/2026;Venda;Mercado à Vista;KNRI11;50;250,00;12.500,00\n"
+    "12/03/2026;Compra;Mercado Fracionário;ITUB4F;7;1.030,50;7.213,50\n"
+    "xx/03/2026;Compra;Mercado à Vista;ITUB4;7;30,00;210,00\n"
+    "15/03/2026;Compra;Mercado à Vista;ITUB4;0;30,00;0,00\n"
+)
+
+
+class TestImporter:
+    def _json(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_portfolio_mod, "PORTFOLIO_JSON", str(tmp_path / "portfolio.json"))
+        monkeypatch.setattr(_portfolio_mod, "DATA_DIR", str(tmp_path))
+
+    def test_extrato_b3_csv_segue_semantica_de_upsert(self, tmp_path, monkeypatch):
+        self._json(tmp_path, monkeypatch)
+        path = tmp_path / "extrato.csv"
+        path.write_text(_EXTRATO_B3, encoding="utf-8")
+        resumo = _importer_mod.import_statement(str(path))
+        assert resumo["importadas"] == 4
+        assert resumo["descartadas"] == 2
+        assert resumo["periodo"] == ("2026-01-03", "2026-03-12")
+
+        esperado = _make_portfolio()
+        for t, q, p in [("KNRI11", 100, 200.0), ("KNRI11", 100, 220.0), ("KNRI11", -50, 250.0), ("ITUB4", 7, 1030.5)]:
+            upsert_position(esperado, t, q, p)
+        posicoes = {p["ticker"]: p for p in load_portfolio()["positions"]}
+        for p in esperado["positions"]:
+            assert posicoes[p["ticker"]]["quantity"] == p["quantity"]
+            assert posicoes[p["ticker"]]["avg_price"] == pytest.approx(p["avg_price"])
+
+        ops = load_operations()
+        venda = ops[ops["quantity"] < 0].iloc[0]
+        assert venda["avg_price"] == pytest.approx(210.0)
+
+    def test_blocos_pequenos_e_xlsx_dao_o_mesmo_resultado(self, tmp_path, monkeypatch):
+        openpyxl = pytest.importorskip("openpyxl")
+        self._json(tmp_path, monkeypatch)
+        csv_path = tmp_path / "extrato.csv"
+        csv_path.write_text(_EXTRATO_B3, encoding="utf-8")
+        _importer_mod.import_statement(str(csv_path), chunksize=2)
+        via_csv = load_portfolio()["positions"]
+
+        (tmp_path / "portfolio.json").unlink()
+        wb = openpyxl.Workbook()
+        for linha in _EXTRATO_B3.strip().split("\n"):
+            wb.active.append(linha.split(";"))
+        wb.save(tmp_path / "extrato.xlsx")
+        _importer_mod.import_statement(str(tmp_path / "extrato.xlsx"), chunksize=3)
+        assert load_portfolio()["positions"] == via_csv
+
+    def test_datas_iso_e_brasileiras_sem_trocar_dia_e_mes(self, tmp_path, monkeypatch):
+        self._json(tmp_path, monkeypatch)
+        datas = pd.Series(["2026-01-12", "2026-02-05 00:00:00", "12/01/2026", "5/2/2026", "2026-13-01", ""])
+        assert _importer_mod._parse_date(datas).dt.strftime("%Y-%m-%d").tolist()[:4] == [
+            "2026-01-12", "2026-02-05", "2026-01-12", "2026-02-05"]
+        assert _importer_mod._parse_date(datas).iloc[4:].isna().all()
+
+        path = tmp_path / "extrato.csv"
+        path.write_text("data,ticker,quantidade,preco\n2026-02-01,MXRF11,-10,11.0\n2026-01-12,MXRF11,10,10.0\n",
+                        encoding="utf-8")
+        resumo = _importer_mod.import_statement(str(path))
+        assert resumo["periodo"] == ("2026-01-12", "2026-02-01")
+        assert load_portfolio()["positions"] == []
+        assert load_operations()["quantity"].tolist() == [10, -10]
+
+    def test_numeros_com_separador_de_milhar(self):
+        valores = pd.Series(["1.000", "1.234.567", "1.234,56", "1,234.56", "1234.56", "10,5", "R$ 10,00",
+                             "-1.000", "1.5", "0.125", "abc"])
+        assert _importer_mod._parse_number(valores).tolist()[:10] == [
+            1000.0, 1234567.0, 1234.56, 1234.56, 1234.56, 10.5, 10.0, -1000.0, 1.5, 0.125]
+        assert np.isnan(_importer_mod._parse_number(valores).iloc[-1])
+        assert _importer_mod._cell(1.234) == "1,234" and _importer_mod._cell(1000) == 1000
+
+    def test_xlsx_com_celulas_de_data_nativas(self, tmp_path, monkeypatch):
+        openpyxl = pytest.importorskip("openpyxl")
+        self._json(tmp_path, monkeypatch)
+        wb = openpyxl.Workbook()
+        wb.active.append(["Data do Negócio", "Código de Negociação", "Quantidade", "Preço"])
+        wb.active.append([datetime(2026, 2, 1), "MXRF11", -10, "11,00"])
+        wb.active.append([datetime(2026, 1, 12), "MXRF11", 10, "10,00"])
+        wb.save(tmp_path / "extrato.xlsx")
+        resumo = _importer_mod.import_statement(str(tmp_path / "extrato.xlsx"))
+        assert resumo["periodo"] == ("2026-01-12", "2026-02-01")
+        assert load_portfolio()["positions"] == []
+        assert load_operations()[["data", "quantity"]].values.tolist() == [["2026-01-12", 10], ["2026-02-01", -10]]
+
+    def test_colunas_obrigatorias_ausentes(self, tmp_path):
+        path = tmp_path / "extrato.csv"
+        path.write_text("data,ticker,quantidade\n2026-01-02,MXRF11,10\n", encoding="utf-8")
+        with pytest.raises(ValueError, match="preco"):
+            _importer_mod.import_statement(str(path))
+
+    def test_backend_sqlite_persiste_em_uma_transacao(self, tmp_path, monkeypatch):
+        store = PortfolioStore(str(tmp_path / "carteiras.sqlite3"))
+        store.apply_operation("ana", "MXRF11", 10, 10.0, data="2025-12-01")
+        for mod in (_portfolio_mod, _importer_mod):
+            monkeypatch.setattr(mod, "STORAGE_BACKEND", "sqlite")
+            monkeypatch.setattr(mod, "get_store", lambda: store)
+        path = tmp_path / "extrato.csv"
+        path.write_text("data,ticker,quantidade,preco\n2026-01-02,MXRF11,10,12.0\n2026-01-03,MXRF11,-20,13.0\n",
+                        encoding="utf-8")
+        _importer_mod.import_statement(str(path), portfolio_id="ana")
+        assert store.load_portfolio("ana")["positions"] == []
+        ops = store.load_operations("ana")
+        assert [o["quantity"] for o in ops] == [10, 10, -20]
+        assert ops[-1]["avg_price"] == pytest.approx(11.0)
+
+    def test_compra_e_venda_no_mesmo_dia_sao_day_trade(self, tmp_path, monkeypatch):
+        self._json(tmp_path, monkeypatch)
+        path = tmp_path / "extrato.csv"
+        path.write_text("data,ticker,quantidade,preco\n2026-01-02,PETR4,100,10.0\n"
+                        "2026-02-10,PETR4,50,12.0\n2026-02-10,PETR4,-50,13.0\n2026-02-11,PETR4,10,14.0\n",
+                        encoding="utf-8")
+        _importer_mod.import_statement(str(path))
+        esperado = _make_portfolio()
+        for q, p, dt in [(100, 10.0, False), (50, 12.0, True), (-50, 13.0, True), (10, 14.0, False)]:
+            upsert_position(esperado, "PETR4", q, p, day_trade=dt)
+        assert load_portfolio()["positions"] == esperado["positions"]
+        ops = load_operations()
+        assert ops["day_trade"].tolist() == [False, True, True, False]
+        apuracao = monthly_tax(ops).set_index("categoria")
+        assert apuracao.loc["Day trade", "resultado"] == pytest.approx(50.0)
+        assert "Swing trade" not in apuracao.index
+
+    def test_reimportar_o_mesmo_extrato_nao_duplica(self, tmp_path, monkeypatch):
+        store = PortfolioStore(str(tmp_path / "carteiras.sqlite3"))
+        for mod in (_portfolio_mod, _importer_mod):
+            monkeypatch.setattr(mod, "STORAGE_BACKEND", "sqlite")
+            monkeypatch.setattr(mod, "get_store", lambda: store)
+        path = tmp_path / "extrato.csv"
+        # duas compras idênticas no mesmo dia são duas operações
+        path.write_text("data,ticker,quantidade,preco\n2026-01-02,MXRF11,10,10.0\n2026-01-02,MXRF11,10,10.0\n",
+                        encoding="utf-8")
+        assert _importer_mod.import_statement(str(path), portfolio_id="ana")["importadas"] == 2
+        resumo = _importer_mod.import_statement(str(path), portfolio_id="ana")
+        assert (resumo["importadas"], resumo["duplicadas"], resumo["periodo"]) == (0, 2, None)
+        path.write_text(path.read_text() + "2026-01-03,MXRF11,-5,11.0\n", encoding="utf-8")
+        assert _importer_mod.import_statement(str(path), portfolio_id="ana")["importadas"] == 1
+        assert store.load_portfolio("ana")["positions"] == [{"ticker": "MXRF11", "quantity": 15, "avg_price": 10.0}]
+        assert len(store.load_operations("ana")) == 3
+
+    def test_operacao_concorrente_durante_importacao_nao_se_perde(self, tmp_path):
+        store = PortfolioStore(str(tmp_path / "carteiras.sqlite3"))
+        concorrente = threading.Thread(target=store.apply_operation, args=("ana", "HGLG11", 5, 160.0))
+
+        def merge(positions, existing):
+            concorrente.start()  # espera o BEGIN IMMEDIATE da importação terminar
+            time.sleep(0.2)
+            return positions + [{"ticker": "MXRF11", "quantity": 10, "avg_price": 10.0}], []
+
+        store.import_batch("ana", merge)
+        concorrente.join()
+        assert {p["ticker"] for p in store.load_portfolio("ana")["positions"]} == {"HGLG11", "MXRF11"}
+
+# ============= Exportação =============
+
+class TestExports:
+    def test_csv_em_blocos_igual_ao_csv_direto(self):
+        df = pd.DataFrame({"Ticker": [f"T{i}" for i in range(25)], "Valor": np.arange(25) * 1.5})
+        streamed = b"".join(_exports_mod.iter_csv(df, chunk_rows=7))
+        assert streamed == df.to_csv(index=False).encode("utf-8-sig")
+
+    def test_cache_pela_versao_dos_dados(self, monkeypatch):
+        monkeypatch.setattr(_exports_mod, "_exports", MemoryLRUCache())
+        chamadas = []
+        original = _exports_mod.write_export
+        monkeypatch.setattr(_exports_mod, "write_export",
+                            lambda df, fmt, target: (chamadas.append(fmt), original(df, fmt, target)))
+        df = pd.DataFrame({"Ticker": ["MXRF11"], "Qtde": [10]})
+        a = _exports_mod.export_bytes(df, "CSV")
+        b = _exports_mod.export_bytes(df.copy(), "CSV")
+        assert a == b and chamadas == ["CSV"]
+        _exports_mod.export_bytes(df.assign(Qtde=[11]), "CSV")
+        assert chamadas == ["CSV", "CSV"]
+
+    def test_formatos_compactos_fazem_ida_e_volta(self):
+        df = pd.DataFrame({"Ticker": ["MXRF11", "ITUB4"], "Valor": [10.5, 30.25]})
+        for fmt, ler in (("Parquet", pd.read_parquet), ("XLSX", pd.read_excel)):
+            if fmt not in _exports_mod.available_formats():
+                continue
+            back = ler(io.BytesIO(_exports_mod.export_bytes(df, fmt)))
+            pd.testing.assert_frame_equal(back, df)
+        with pytest.raises(ValueError):
+            _exports_mod.export_bytes(df, "PDF")
+
+
+# ============= Índice de classificação =============
+
+class TestClassificationIndex:
+    def _isolado(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_assets_mod, "ATIVOS_CSV", str(tmp_path / "ativos.csv"))
+        monkeypatch.setattr(_assets_mod, "_tipo_index", {})
+        monkeypatch.setattr(_assets_mod, "_tipo_index_mtime", None)
+        monkeypatch.setattr(_assets_mod, "CLASSIFICATION_STATS", _assets_mod.Counter())
+
+    def test_listagens_classificam_units_como_acao(self, tmp_path, monkeypatch):
+        self._isolado(tmp_path, monkeypatch)
+        listagens = {
+            "fund": [{"stock": "HGLG11", "close": 160.0}, {"stock": "BOVA11", "close": 120.0}],
+            "stock": [{"stock": "TAEE11", "close": 35.0}, {"stock": "PETR4", "close": 38.0},
+                      {"stock": "AAPL34", "close": 60.0}, {"stock": "HGLG11", "close": 160.0}],
+        }
+        monkeypatch.setattr(_assets_mod, "fetch_ativos_from_brapi", lambda tipo: listagens[tipo])
+        df = pd.DataFrame(_assets_mod._build_ativos_list())
+        assert dict(zip(df["ticker"], df["tipo"])) == {
+            "HGLG11": "FII", "BOVA11": "ETF", "TAEE11": "Ação", "PETR4": "Ação",
+        }
+        _assets_mod.set_classification_index(df)
+        assert classify_ticker("taee11") == "Ação"
+        assert classify_ticker("SANB11") == "FII"  # fora do índice: heurística
+        assert _assets_mod.CLASSIFICATION_STATS == {"indice": 1, "heuristica": 1}
+
+    def test_indice_recarregado_do_csv_quando_muda(self, tmp_path, monkeypatch):
+        self._isolado(tmp_path, monkeypatch)
+        assert classify_ticker("KLBN11") == "FII"
+        pd.DataFrame({"ticker": ["KLBN11"], "tipo": ["Ação"]}).to_csv(tmp_path / "ativos.csv", index=False)
+        assert classify_ticker("KLBN11") == "Ação"
+
+    def test_contadores_de_fallback_do_scraping(self, monkeypatch):
+        monkeypatch.setattr(_scraping_mod, "SCRAPE_STATS", _scraping_mod.Counter())
+        monkeypatch.setattr(_scraping_mod, "get_dy_from_fundsexplorer", lambda t: None)
+        monkeypatch.setattr(_scraping_mod, "get_dy_from_statusinvest", lambda t, tipo: 0.08 if tipo == "Ação" else None)
+        assert _scraping_mod.get_dy_estimate("SANB11", "FII") is None
+        assert _scraping_mod.get_dy_estimate("SANB11", "Ação") == pytest.approx(0.08)
+        assert _scraping_mod.SCRAPE_STATS == {"rota:FII": 1, "rota:Ação": 1, "fallback": 1, "sem_dy": 1}
+
+
+# ============= Métricas incrementais =============
+
+class TestPortfolioMetrics:
+    _UNIVERSO = {"HGLG11": (160.0, 8.0), "ITUB4": (35.0, 6.0), "MXRF11": (10.0, 12.0)}
+
+    def _full(self, portfolio, monkeypatch):
+        df_ativos = pd.DataFrame([{"ticker": t, "preco_atual": p, "dy_12m": dy}
+                                  for t, (p, dy) in self._UNIVERSO.items()])
+        monkeypatch.setattr(_portfolio_mod, "get_universe", lambda: _assets_mod.AssetUniverse(df_ativos))
+        return _portfolio_mod.calc_portfolio_metrics(portfolio)
+
+    def _model(self, portfolio, monkeypatch):
+        df, _ = self._full(portfolio, monkeypatch)
+        return PortfolioMetrics(df.to_dict("records"), quote=lambda t, tipo: self._UNIVERSO[t])
+
+    def test_operacoes_incrementais_igualam_recalculo_completo(self, monkeypatch):
+        pf = _make_portfolio(_pos("HGLG11", 10, 150.0), _pos("ITUB4", 100, 30.0))
+        model = self._model(pf, monkeypatch)
+        for t, q, p in [("HGLG11", 10, 170.0), ("ITUB4", -100, 36.0), ("MXRF11", 50, 9.5)]:
+            model.apply(t, q, p)
+            upsert_position(pf, t, q, p)
+        clean_positions(pf)
+        df, totals = self._full(pf, monkeypatch)
+        for k, v in totals.items():
+            assert model.totals[k] == pytest.approx(v)
+        pd.testing.assert_frame_equal(model.to_frame().sort_values("Ticker").reset_index(drop=True),
+                                      df.sort_values("Ticker").reset_index(drop=True), check_dtype=False)
+        assert model.signature() == portfolio_signature(pf)
+
+    def test_what_if_nao_altera_o_modelo(self, monkeypatch):
+        model = self._model(_make_portfolio(_pos("MXRF11", 100, 10.0)), monkeypatch)
+        antes = model.totals
+        sim = model.what_if([("MXRF11", 100, 10.0), ("HGLG11", 5, 160.0)])
+        assert sim.totals["Patrimônio (R$)"] == pytest.approx(2000.0 + 800.0)
+        assert model.totals == antes and len(model) == 1
+
+    def test_nova_cotacao_atualiza_totais(self, monkeypatch):
+        model = self._model(_make_portfolio(_pos("MXRF11", 100, 10.0)), monkeypatch)
+        assert model.apply_price("MXRF11", 11.0)
+        assert not model.apply_price("MXRF11", 11.0)
+        assert not model.apply_price("HGLG11", 150.0)
+        assert model.totals["Patrimônio (R$)"] == pytest.approx(1100.0)
+        assert model.totals["Renda Mensal (R$)"] == pytest.approx(100 * 11.0 * 0.12 / 12)
+
+
+# ============= Projeção por ativo =============
+
+class TestAssetProjection:
+    _PREMISSAS = dict(class_return={"FII": 0.06, "Ação": 0.10}, class_dividend_growth={"FII": 0.02, "Ação": 0.0})
+
+    def _carteira(self):
+        return _metrics(("HGLG11", "FII", 10, 100.0), ("ITUB4", "Ação", 100, 30.0)).assign(
+            **{"Renda Mensal Est. (R$)": [8.0, 15.0]})
+
+    def test_forma_fechada_igual_ao_laco_mes_a_mes(self):
+        df = self._carteira()
+        df_sim, _, df_assets = simulate_asset_projection(df, 1000.0, 1e9, max_years=5,
+                                                         yearly_contrib_growth=0.05, **self._PREMISSAS)
+        a = allocation_vector(df, "Proporcional à carteira")
+        v = df["Valor de Mercado (R$)"].to_numpy(dtype=float)
+        r = np.array([1.06, 1.10]) ** (1 / 12) - 1
+        for m in range(59):
+            v = v * (1 + r) + 1000.0 * 1.05 ** (m / 12) * a
+        assert df_sim["Patrimônio (R$)"].iloc[-1] == pytest.approx(v.sum())
+        assert df_assets["Valor final (R$)"].to_numpy() == pytest.approx(v)
+
+    def test_renda_por_classe_soma_o_total(self):
+        df_sim, meses, _ = simulate_asset_projection(self._carteira(), 500.0, 100.0, max_years=30,
+                                                     **self._PREMISSAS)
+        assert df_sim["Renda Mensal (R$)"].iloc[0] == pytest.approx(23.0)
+        assert (df_sim["Renda FII (R$)"] + df_sim["Renda Ação (R$)"]).to_numpy() == pytest.approx(
+            df_sim["Renda Mensal (R$)"].to_numpy())
+        assert meses is not None and df_sim["Renda Mensal (R$)"].iloc[meses] >= 100.0
+
+    def test_politicas_de_alocacao(self):
+        df = self._carteira()
+        assert allocation_vector(df, "Igual entre ativos") == pytest.approx([0.5, 0.5])
+        assert allocation_vector(df, "Proporcional à carteira") == pytest.approx([0.25, 0.75])
+        assert allocation_vector(df, "Pesos-alvo por classe", {"FII": 80, "Ação": 20}) == pytest.approx([0.8, 0.2])
+
+    def test_centenas_de_ativos_em_50_anos(self):
+        n = 500
+        df = _metrics(*[(f"T{i}", "FII" if i % 2 else "Ação", 10, 10.0 + i) for i in range(n)])
+        df["Renda Mensal Est. (R$)"] = df["Valor de Mercado (R$)"] * 0.007
+        inicio = time.perf_counter()
+        df_sim, _, _ = simulate_asset_projection(df, 2000.0, 1e12, max_years=50, **self._PREMISSAS)
+        assert time.perf_counter() - inicio < 2.0
+        assert len(df_sim) == 600
+
+
+# ============= Risco =============
+
+def _precos(n_dias=300, n_ativos=4, seed=0):
+    rng = np.random.default_rng(seed)
+    rets = rng.normal(0.0005, 0.015, size=(n_dias, n_ativos))
+    datas = pd.bdate_range("2024-01-01", periods=n_dias)
+    return pd.DataFrame(100 * np.cumprod(1 + rets, axis=0), index=datas,
+                        columns=[f"ATV{i}11" for i in range(n_ativos)])
+
+
+class TestRisk:
+    def test_covariancia_par_a_par_igual_ao_pandas(self):
+        precos = _precos()
+        precos.iloc[:50, 0] = np.nan  # ativo listado depois
+        engine = _risk_mod.RiskEngine(list(precos.columns))
+        engine.update(precos)
+        esperado = precos.pct_change(fill_method=None).cov().to_numpy()
+        assert engine.moments.cov() == pytest.approx(esperado)
+
+    def test_atualizacao_incremental_igual_ao_recalculo(self):
+        precos = _precos(400)
+        engine = _risk_mod.RiskEngine(list(precos.columns), window=200)
+        engine.update(precos.iloc[:300])
+        assert engine.update(precos.iloc[50:400]) == 100  # janela deslizou: só 100 retornos novos
+        novo = _risk_mod.RiskEngine(list(precos.columns), window=200)
+        novo.update(precos.iloc[50:400])
+        assert engine.moments.cov() == pytest.approx(novo.moments.cov())
+        assert engine.returns == pytest.approx(novo.returns)
+
+    def test_drawdown_e_var(self, monkeypatch):
+        monkeypatch.setattr(_risk_mod, "_reports", MemoryLRUCache())
+        assert _risk_mod.max_drawdown(np.array([[0.1], [-0.5], [0.2]]))[0] == pytest.approx(-0.5)
+        precos = _precos()
+        pesos = pd.Series(1.0, index=precos.columns)
+        rel = _risk_mod.risk_report(precos, pesos)
+        rp = precos.pct_change().dropna().to_numpy().mean(axis=1)
+        assert rel["carteira"]["VaR histórico 1d (%)"] == pytest.approx(-np.quantile(rp, 0.05) * 100)
+        assert rel["carteira"]["VaR paramétrico 1d (%)"] == pytest.approx(
+            -(rp.mean() - 1.6448536 * rp.std(ddof=1)) * 100, rel=1e-6)
+        assert _risk_mod.risk_report(precos, pesos) is rel  # em cache pela versão do histórico
+
+    def test_200_ativos_5_anos(self, monkeypatch):
+        monkeypatch.setattr(_risk_mod, "_reports", MemoryLRUCache())
+        monkeypatch.setattr(_risk_mod, "_engines", MemoryLRUCache())
+        precos = _precos(1260, 200)
+        inicio = time.perf_counter()
+        rel = _risk_mod.risk_report(precos, pd.Series(1.0, index=precos.columns))
+        assert time.perf_counter() - inicio < 2.0
+        assert rel["correlacao"].shape == (200, 200)
+
+
+    def test_motor_por_periodo_e_sessoes_concorrentes(self, monkeypatch):
+        monkeypatch.setattr(_risk_mod, "_reports", MemoryLRUCache())
+        monkeypatch.setattr(_risk_mod, "_engines", MemoryLRUCache(max_entries=2))
+        precos = _precos(600, 5)
+        pesos = pd.Series(1.0, index=precos.columns)
+        curto = _risk_mod.risk_report(precos.iloc[-250:], pesos, period="1y")
+        longo = _risk_mod.risk_report(precos, pesos, period="5y")
+        assert curto["carteira"]["Pregões"] == 249 and longo["carteira"]["Pregões"] == 599
+        motor = _risk_mod._engine_for(precos, None, "5y")
+        assert motor.update(precos) == 0  # alternar períodos não reconstrói o motor de cada um
+
+        monkeypatch.setattr(_risk_mod, "_reports", MemoryLRUCache(max_entries=1))
+        esperado = {n: _risk_mod.risk_report(precos.iloc[:n], pesos, period="x")["carteira"] for n in (300, 600)}
+        erros = []
+
+        def sessao(n):
+            for _ in range(20):
+                if _risk_mod.risk_report(precos.iloc[:n], pesos, period="x")["carteira"] != pytest.approx(esperado[n]):
+                    erros.append(n)
+
+        threads = [threading.Thread(target=sessao, args=(n,)) for n in (300, 600) * 3]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not erros
+
+# ============= Otimizador =============
+
+class TestOptimizer:
+    def test_ledoit_wolf_encolhe_menos_com_mais_pregoes(self):
+        rng = np.random.default_rng(3)
+        fator = rng.normal(0, 0.01, (3000, 1))  # fator comum: covariância longe do alvo μ·I
+        rets = fator + rng.normal(0, 0.01, (3000, 20)) * rng.uniform(0.5, 2, 20)
+        _, k_poucos = _optimizer_mod.ledoit_wolf(rets[:30])
+        cov, k_muitos = _optimizer_mod.ledoit_wolf(rets)
+        assert 0 <= k_muitos < k_poucos <= 1
+        assert np.linalg.eigvalsh(cov).min() > 0
+
+    def test_minima_variancia_igual_a_forma_fechada(self):
+        var = np.array([0.04, 0.09, 0.01, 0.16])
+        classes = np.array(["FII"] * 4)
+        names, lo, hi = _optimizer_mod._check_bounds(classes, {})
+        w, _, _ = _optimizer_mod.frank_wolfe(np.zeros(4), np.diag(var), 1.0, [np.arange(4)], lo, hi, tol=1e-12)
+        assert w == pytest.approx((1 / var) / (1 / var).sum(), abs=1e-6)
+
+    def test_fronteira_respeita_limites_por_classe(self):
+        rng = np.random.default_rng(4)
+        mu = rng.uniform(0.05, 0.25, 12)
+        a = rng.normal(0, 0.1, (12, 12))
+        cov = a @ a.T / 12 + np.diag(rng.uniform(0.01, 0.05, 12))
+        classes = np.array(["FII", "Ação", "ETF"] * 4)
+        frontier, pesos = _optimizer_mod.efficient_frontier(mu, cov, classes, {"FII": (0.3, 0.5), "ETF": (0.0, 0.1)},
+                                                            n_points=20)
+        assert pesos.min() >= -1e-12 and pesos.sum(axis=1) == pytest.approx(np.ones(20))
+        fii = pesos[:, classes == "FII"].sum(axis=1)
+        etf = pesos[:, classes == "ETF"].sum(axis=1)
+        assert (fii >= 0.3 - 1e-9).all() and (fii <= 0.5 + 1e-9).all() and (etf <= 0.1 + 1e-9).all()
+        assert np.diff(frontier["Retorno esperado (%)"]).max() <= 1e-6  # mais aversão, menos retorno
+        with pytest.raises(ValueError):
+            _optimizer_mod.efficient_frontier(mu, cov, classes, {"FII": (0.8, 1.0), "ETF": (0.5, 1.0)})
+
+    def test_100_ativos_50_pontos(self, monkeypatch):
+        monkeypatch.setattr(_optimizer_mod, "_estimates", MemoryLRUCache())
+        precos = _precos(750, 100, seed=5)
+        inicio = time.perf_counter()
+        est = _optimizer_mod.estimate(precos)
+        assert _optimizer_mod.estimate(precos) is est  # fatoração em cache pela versão do histórico
+        mu = _optimizer_mod.expected_returns(est, pd.Series(8.0, index=precos.columns))
+        frontier, _ = _optimizer_mod.efficient_frontier(mu, est["cov"], np.array(["FII", "Ação"] * 50),
+                                                        chol=est["chol"])
+        assert time.perf_counter() - inicio < 3.0
+        assert len(frontier) == 50
+
+
+# ============= Logging =============
+
+class TestLogging:
+    def _record(self, msg="Tentativa %d falhou para %s", args=(1, "MXRF11"), level=logging.WARNING, **extra):
+        record = logging.LogRecord("api.prices", level, __file__, 1, msg, args, None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_com_campos_estruturados(self):
+        linha = _logging_mod.JsonFormatter().format(
+            self._record(ticker="MXRF11", source="brapi", latency_ms=12.5))
+        entry = json.loads(linha)
+        assert entry["msg"] == "Tentativa 1 falhou para MXRF11"
+        assert (entry["ticker"], entry["source"], entry["latency_ms"]) == ("MXRF11", "brapi", 12.5)
+        assert "suppressed" not in entry
+
+    def test_rajada_de_avisos_limitada_e_contada(self):
+        f = _logging_mod.RateLimitFilter(burst=3, interval=0.05)
+        passaram = [f.filter(self._record(args=(1, f"T{i}"))) for i in range(10)]
+        assert passaram.count(True) == 3  # mesma mensagem-modelo, tickers diferentes
+        assert all(f.filter(self._record(level=logging.INFO)) for _ in range(10))
+        time.sleep(0.06)
+        proximo = self._record()
+        assert f.filter(proximo) and proximo.suppressed == 7
+
+    def test_fila_grava_em_segundo_plano_e_rotaciona_com_gzip(self, tmp_path):
+        import gzip
+        path = str(tmp_path / "logs" / "dashboard.log")
+        root = logging.getLogger()
+        nivel = root.level
+        try:
+            listener = _logging_mod.setup_logging(path, level="INFO")
+            listener.handlers[0].maxBytes = 2000
+            assert _logging_mod.setup_logging(path) is listener  # reexecução do app.py
+            log = logging.getLogger("api.scraping")
+            for i in range(100):
+                log.info("DY StatusInvest: %s = %.2f%%", f"T{i}", 8.0, extra={"ticker": f"T{i}", "source": "StatusInvest"})
+        finally:
+            _logging_mod.stop_logging()
+            root.setLevel(nivel)
+        assert not any(isinstance(h, logging.handlers.QueueHandler) for h in root.handlers)
+        with gzip.open(path + ".1.gz", "rt", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        assert entries and all(e["source"] == "StatusInvest" for e in entries)
+        assert os.path.getsize(path) <= 2000
+
+
+# ============= Universo indexado por ticker =============
+
+class TestAssetUniverse:
+    def _setup(self, tmp_path, monkeypatch, n=8):
+        for attr, value in [("ATIVOS_CSV", str(tmp_path / "ativos.csv")),
+                            ("ATIVOS_DELTA_CSV", str(tmp_path / "ativos_delta.csv")),
+                            ("DATA_DIR", str(tmp_path)), ("_universe", None), ("_universe_key", None),
+                            ("_tipo_index", {}), ("_tipo_index_mtime", None)]:
+            monkeypatch.setattr(_assets_mod, attr, value)
+        monkeypatch.setattr(_history_mod, "HISTORY_DIR", str(tmp_path / "historico"))
+        monkeypatch.setattr(_alerts_mod, "ALERTS_DB", str(tmp_path / "alertas.sqlite3"))
+        monkeypatch.setattr(_alerts_mod, "_store", None)
+        df = pd.DataFrame({"ticker": [f"FII{i:03d}11" for i in range(n)], "nome": "x", "tipo": "FII",
+                           "preco_atual": 10.0, "dy_12m": 8.0, "data_atualizacao": ""})
+        df.to_csv(tmp_path / "ativos.csv", index=False)
+        return _assets_mod.get_universe()
+
+    def test_lote_aplicado_de_uma_vez(self, tmp_path, monkeypatch):
+        universe = self._setup(tmp_path, monkeypatch)
+        n = universe.update_fields({"FII001": {"dy_12m": 1.0},  # fora do universo: ignorado
+                                    "FII00111": {"dy_12m": 9.5, "data_atualizacao": "2026-01-02 10:00"},
+                                    "FII00511": {"dy_12m": 11.0}}, persist=False)
+        assert n == 2 and universe.version == 1
+        assert universe.get("FII00111")["dy_12m"] == 9.5
+        assert universe.get("FII00111")["data_atualizacao"] == "2026-01-02 10:00"
+        assert universe.get("XXXX11") is None and "FII00511" in universe
+        with pytest.raises(ValueError):
+            universe.update_fields({"FII00111": {"cotacao": 1.0}})
+
+    def test_lote_com_formatos_mistos_nao_apaga_campos(self, tmp_path, monkeypatch):
+        universe = self._setup(tmp_path, monkeypatch, n=40)
+        universe.update_fields({"FII00111": {"data_atualizacao": "ontem"}, "FII00211": {"data_atualizacao": "ontem"}})
+        universe.update_fields({"FII00111": {"dy_12m": 1.0},
+                                "FII00211": {"dy_12m": 2.0, "data_atualizacao": "hoje"},
+                                "FII00311": {"preco_atual": 12.0}})
+        assert universe.get("FII00111")["data_atualizacao"] == "ontem" and universe.get("FII00111")["dy_12m"] == 1.0
+        assert universe.get("FII00211")["data_atualizacao"] == "hoje"
+        assert universe.get("FII00311")["dy_12m"] == 8.0 and universe.get("FII00311")["preco_atual"] == 12.0
+        delta = pd.read_csv(tmp_path / "ativos_delta.csv").drop_duplicates("ticker", keep="last").set_index("ticker")
+        assert delta.loc["FII00111", "data_atualizacao"] == "ontem" and delta.loc["FII00311", "dy_12m"] == 8.0
+
+    def test_delta_so_com_linhas_alteradas_e_releitura(self, tmp_path, monkeypatch):
+        universe = self._setup(tmp_path, monkeypatch)
+        base = (tmp_path / "ativos.csv").read_bytes()
+        universe.update_fields({"FII00611": {"dy_12m": 7.0, "data_atualizacao": "2026-01-02 10:00"}})
+        assert _assets_mod.get_universe() is universe  # a própria escrita não força releitura
+        assert (tmp_path / "ativos.csv").read_bytes() == base
+        assert len(pd.read_csv(tmp_path / "ativos_delta.csv")) == 1
+        monkeypatch.setattr(_assets_mod, "_universe", None)
+        relido = _assets_mod.get_universe()
+        assert relido is not universe
+        assert relido.df["ticker"].tolist() == universe.df["ticker"].tolist()  # ordem preservada
+        assert relido.get("FII00611")["dy_12m"] == 7.0 and relido.get("FII00611")["data_atualizacao"] == "2026-01-02 10:00"
+
+    def test_delta_grande_compacta_no_csv(self, tmp_path, monkeypatch):
+        universe = self._setup(tmp_path, monkeypatch, n=8)
+        universe.update_fields({"FII00011": {"dy_12m": 1.0}})
+        assert (tmp_path / "ativos_delta.csv").exists()
+        universe.update_fields({t: {"dy_12m": 2.0} for t in ["FII00111", "FII00211"]})  # 3 > 25% de 8
+        assert not (tmp_path / "ativos_delta.csv").exists()
+        assert pd.read_csv(tmp_path / "ativos.csv").set_index("ticker").loc["FII00211", "dy_12m"] == 2.0
+
+    def test_screener_acompanha_atualizacoes(self, tmp_path, monkeypatch):
+        universe = self._setup(tmp_path, monkeypatch, n=2000)
+        screener = universe.screener()
+        assert universe.screener() is screener
+        inicio = time.perf_counter()
+        universe.update_fields({f"FII{i:03d}11": {"dy_12m": 20.0} for i in range(0, 2000, 4)}, persist=False)
+        assert time.perf_counter() - inicio < 0.5
+        assert universe.screener() is not screener
+        assert len(universe.screener().query(dy_min=15)) == 500
+
+    def test_atualizacoes_concorrentes_nao_perdem_o_delta(self, tmp_path, monkeypatch):
+        universe = self._setup(tmp_path, monkeypatch, n=8)
+        compactando, liberar = threading.Event(), threading.Event()
+        salvar = _assets_mod.save_ativos_list
+
+        def save_lento(df):
+            if not compactando.is_set():  # só a primeira compactação fica presa
+                compactando.set()
+                liberar.wait(5)
+            salvar(df)
+
+        monkeypatch.setattr(_assets_mod, "save_ativos_list", save_lento)
+        a = threading.Thread(target=universe.update_fields,
+                             args=({t: {"dy_12m": 2.0} for t in ["FII00011", "FII00111", "FII00211"]},))
+        b = threading.Thread(target=universe.update_fields, args=({"FII00711": {"dy_12m": 9.5}},))
+        a.start()
+        assert compactando.wait(5)
+        b.start()
+        b.join(0.2)
+        assert b.is_alive()  # espera a compactação em andamento
+        liberar.set()
+        a.join(5)
+        b.join(5)
+        monkeypatch.setattr(_assets_mod, "_universe", None)
+        relido = _assets_mod.get_universe()
+        assert relido.get("FII00711")["dy_12m"] == 9.5 and relido.get("FII00211")["dy_12m"] == 2.0
+
+
+# ============= Histórico de preço/DY =============
+
+class TestHistory:
+    @pytest.fixture(autouse=True)
+    def _dir(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_history_mod, "HISTORY_DIR", str(tmp_path / "historico"))
+        monkeypatch.setattr(_history_mod, "COMPACT_EVERY", 3)
+        monkeypatch.setattr(_history_mod, "_queries", MemoryLRUCache())
+        monkeypatch.setattr(_history_mod, "_last_retention", datetime.now().date())
+        self.dir = tmp_path / "historico"
+
+    def test_consulta_atravessa_meses_compactados_e_pendentes(self):
+        inicio = datetime(2026, 1, 30, 12).timestamp()
+        for k in range(8):  # 12h entre snapshots: jan → fev, com compactação a cada 3
+            _history_mod.append_snapshot(["MXRF11", "HGLG11"], [10 + k, 160 + k], [12.0, 8.0 - k / 10],
+                                         ts=inicio + k * 43200)
+        assert (self.dir / "2026-02" / "segmento" / "dt.npy").exists()
+        assert np.load(self.dir / "2026-02" / "segmento" / "dt.npy").dtype == np.uint32
+        df = _history_mod.query(["HGLG11", "XXXX11"], datetime(2026, 1, 1), datetime(2026, 3, 1))
+        assert df["ticker"].unique().tolist() == ["HGLG11"]
+        assert df["preco"].tolist() == [160.0 + k for k in range(8)]
+        assert (df["data"].diff().dropna() == pd.Timedelta(hours=12)).all()
+        so_fev = _history_mod.query(["HGLG11"], datetime(2026, 2, 1), datetime(2026, 3, 1))
+        assert 0 < len(so_fev) < 8
+
+    def test_compactacoes_concorrentes_nao_perdem_snapshots(self, monkeypatch):
+        monkeypatch.setattr(_history_mod, "COMPACT_EVERY", 2)
+        inicio = datetime(2026, 3, 1, 12).timestamp()
+
+        def gravar(base):
+            for k in range(25):
+                _history_mod.append_snapshot(["MXRF11", "HGLG11"], [10.0, 160.0], [12.0, 8.0],
+                                             ts=inicio + (base + k) * 60)
+
+        threads = [threading.Thread(target=gravar, args=(b * 100,)) for b in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        _history_mod.compact("2026-03")
+        df = _history_mod.query(["MXRF11", "HGLG11"], datetime(2026, 3, 1), datetime(2026, 4, 1))
+        assert len(df) == 6 * 25 * 2
+        assert sorted(p.name for p in (self.dir / "2026-03").iterdir() if p.is_dir()) == ["pendente", "segmento"]
+        assert not list((self.dir / "2026-03" / "pendente").glob("*.npz"))
+
+    def test_retencao_reduz_a_diario_e_apaga_antigos(self):
+        base = datetime(2025, 1, 10).timestamp()
+        for k in range(6):  # 4 pontos por dia em jan/2025
+            _history_mod.append_snapshot(["MXRF11"], [10 + k], [12.0], ts=base + k * 6 * 3600)
+        _history_mod.append_snapshot(["MXRF11"], [9.0], [11.0], ts=datetime(2023, 1, 5).timestamp())
+        _history_mod.apply_retention(now=datetime(2025, 6, 1))
+        assert not (self.dir / "2023-01").exists()
+        df = _history_mod.query(["MXRF11"], datetime(2025, 1, 1), datetime(2025, 2, 1))
+        assert df["preco"].tolist() == [13.0, 15.0]  # último ponto de cada dia
+
+    def test_sparklines_na_ordem_pedida(self):
+        agora = time.time()
+        for k in range(50):
+            _history_mod.append_snapshot(["MXRF11"], [10.0], [10 + k / 10], ts=agora - (50 - k) * 3600)
+        linhas = _history_mod.sparklines(["XXXX11", "MXRF11"], field="dy", days=30, points=10)
+        assert linhas[0] == [] and len(linhas[1]) == 10
+        assert linhas[1][0] == pytest.approx(10.0) and linhas[1][-1] == pytest.approx(14.9)
+
+    def test_atualizacao_do_universo_grava_snapshot(self, tmp_path, monkeypatch):
+        for attr, value in [("ATIVOS_CSV", str(tmp_path / "ativos.csv")),
+                            ("ATIVOS_DELTA_CSV", str(tmp_path / "ativos_delta.csv")),
+                            ("DATA_DIR", str(tmp_path)), ("_universe", None), ("_universe_key", None),
+                            ("_tipo_index", {}), ("_tipo_index_mtime", None)]:
+            monkeypatch.setattr(_assets_mod, attr, value)
+        monkeypatch.setattr(_alerts_mod, "ALERTS_DB", str(tmp_path / "alertas.sqlite3"))
+        monkeypatch.setattr(_alerts_mod, "_store", None)
+        pd.DataFrame({"ticker": ["MXRF11", "HGLG11"], "nome": "x", "tipo": "FII", "preco_atual": [10.0, 160.0],
+                      "dy_12m": [12.0, 8.0], "data_atualizacao": ""}).to_csv(tmp_path / "ativos.csv", index=False)
+        universe = _assets_mod.get_universe()
+        universe.update_fields({"MXRF11": {"dy_12m": 11.5}})
+        universe.update_fields({"HGLG11": {"data_atualizacao": "2026-01-02 10:00"}})  # sem preço/DY: sem snapshot
+        df = _history_mod.query(["MXRF11", "HGLG11"], datetime.now() - pd.Timedelta(hours=1))
+        assert df[["ticker", "dy"]].values.tolist() == [["MXRF11", 11.5]]
+
+
+# ============= Alertas =============
+
+class TestAlerts:
+    @pytest.fixture(autouse=True)
+    def _store(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(_alerts_mod, "ALERTS_DB", str(tmp_path / "alertas.sqlite3"))
+        monkeypatch.setattr(_alerts_mod, "_store", None)
+        self.store = _alerts_mod.get_alert_store()
+
+    @staticmethod
+    def _changes(*rows):
+        return pd.DataFrame(rows, columns=["ticker", "tipo", "preco_ant", "preco", "dy_ant", "dy"])
+
+    def test_regras_de_nivel_disparam_na_transicao(self):
+        self.store.add_rule("dy_abaixo", 6.0, tipo="FII")
+        self.store.add_rule("preco_acima", 40.0, ticker="itub4")
+        with pytest.raises(ValueError):
+            self.store.add_rule("dy_entre", 1.0)
+        eventos = _alerts_mod.AlertEngine(self.store.rules()).evaluate(self._changes(
+            ("MXRF11", "FII", 10.0, 10.0, 7.0, 5.5),    # entrou na faixa: dispara
+            ("KNRI11", "FII", 150.0, 151.0, 5.0, 4.0),  # já violava: não repete
+            ("TAEE11", "Ação", 35.0, 35.0, 7.0, 5.0),   # regra vale só para FII
+            ("ITUB4", "Ação", 39.0, 41.0, 6.0, 6.0),
+            ("HGLG11", "FII", np.nan, 160.0, np.nan, 5.0),  # ticker novo
+        ))
+        assert sorted((e["ticker"], e["kind"]) for e in eventos) == [
+            ("HGLG11", "dy_abaixo"), ("ITUB4", "preco_acima"), ("MXRF11", "dy_abaixo")]
+
+    def test_variacao_entre_atualizacoes(self):
+        self.store.add_rule("variacao", 5.0)
+        eventos = _alerts_mod.AlertEngine(self.store.rules()).evaluate(self._changes(
+            ("MXRF11", "FII", 10.0, 9.4, 12.0, 12.0), ("KNRI11", "FII", 150.0, 153.0, 8.0, 8.0),
+            ("HGLG11", "FII", np.nan, 160.0, np.nan, 8.0)))
+        assert [(e["ticker"], round(e["value"], 1)) for e in eventos] == [("MXRF11", -6.0)]
+
+    def test_universo_avalia_so_as_mudancas(self, tmp_path, monkeypatch):
+        for attr, value in [("ATIVOS_CSV", str(tmp_path / "ativos.csv")),
+                            ("ATIVOS_DELTA_CSV", str(tmp_path / "ativos_delta.csv")),
+                            ("DATA_DIR", str(tmp_path)), ("_universe", None), ("_universe_key", None),
+                            ("_tipo_index", {}), ("_tipo_index_mtime", None)]:
+            monkeypatch.setattr(_assets_mod, attr, value)
+        monkeypatch.setattr(_history_mod, "HISTORY_DIR", str(tmp_path / "historico"))
+        pd.DataFrame({"ticker": [f"FII{i:04d}11" for i in range(5000)], "nome": "x", "tipo": "FII",
+                      "preco_atual": 10.0, "dy_12m": 8.0, "data_atualizacao": ""}).to_csv(tmp_path / "ativos.csv",
+                                                                                          index=False)
+        self.store.add_rule("dy_abaixo", 6.0)
+        avaliadas = []
+        original = _alerts_mod.AlertEngine.evaluate
+        monkeypatch.setattr(_alerts_mod.AlertEngine, "evaluate",
+                            lambda eng, changes, now=None: avaliadas.append(len(changes)) or original(eng, changes, now))
+        universe = _assets_mod.get_universe()
+        universe.update_fields({"FII000111": {"dy_12m": 5.0}, "FII000211": {"dy_12m": 8.0},  # FII0002 não mudou
+                                "FII000311": {"dy_12m": 9.0}})
+        assert avaliadas == [2]
+        assert self.store.events()["ticker"].tolist() == ["FII000111"]
+        assert self.store.unseen_count() == 1
+        self.store.mark_seen()
+        assert self.store.unseen_count() == 0
+
+    def test_varredura_de_desatualizados_avisa_uma_vez(self):
+        self.store.add_rule("desatualizado", 24.0, tipo="FII")
+        df = pd.DataFrame({"ticker": ["MXRF11", "HGLG11", "ITUB4", "KNRI11"], "nome": "x",
+                           "tipo": ["FII", "FII", "Ação", "FII"], "preco_atual": 10.0, "dy_12m": 8.0,
+                           "data_atualizacao": ["2026-01-01 10:00", "2026-01-03 09:00", "2026-01-01 10:00", ""]})
+        agora = datetime(2026, 1, 3, 12, 0)
+        screener = AssetScreener(df)
+        assert _alerts_mod.sweep_stale(screener, now=agora) == 2
+        assert sorted(self.store.events()["ticker"]) == ["KNRI11", "MXRF11"]
+        assert _alerts_mod.sweep_stale(screener, now=agora) == 0
+        self.store.clear_stale(["MXRF11"])  # atualizado e vencido de novo
+        assert _alerts_mod.sweep_stale(screener, now=agora) == 1
+
+
+    def test_atualizacao_com_mesmos_valores_libera_aviso_de_desatualizado(self, tmp_path, monkeypatch):
+        for attr, value in [("ATIVOS_CSV", str(tmp_path / "ativos.csv")),
+                            ("ATIVOS_DELTA_CSV", str(tmp_path / "ativos_delta.csv")),
+                            ("DATA_DIR", str(tmp_path)), ("_universe", None), ("_universe_key", None)]:
+            monkeypatch.setattr(_assets_mod, attr, value)
+        monkeypatch.setattr(_history_mod, "HISTORY_DIR", str(tmp_path / "historico"))
+        pd.DataFrame({"ticker": [f"FII{i:03d}11" for i in range(20)], "nome": "x", "tipo": "FII",
+                      "preco_atual": 10.0, "dy_12m": 8.0, "data_atualizacao": "2026-01-01 10:00"}).to_csv(
+            tmp_path / "ativos.csv", index=False)
+        regra = self.store.add_rule("desatualizado", 24.0)
+        self.store.mark_stale(regra, ["FII00111", "FII00211"])
+        universe = _assets_mod.get_universe(refresh=False)
+        universe.update_fields({"FII00111": {"preco_atual": 10.0, "data_atualizacao": "2026-01-05 10:00"},
+                                "FII00211": {"preco_atual": 10.0}})
+        assert self.store.stale_known(regra, ["FII00111", "FII00211"]) == {"FII00211"}
+
+    def test_refresh_so_le_o_universo_anterior_com_alertas(self, tmp_path, monkeypatch):
+        lidos = []
+        monkeypatch.setattr(_assets_mod, "_universe", None)
+        monkeypatch.setattr(_assets_mod, "_universe_key", None)
+        monkeypatch.setattr(_assets_mod, "_previous_csv", lambda: lidos.append(1))
+        for attr in ("_build_ativos_list", "fill_dy_bulk", "apply_local_dy", "save_ativos_list",
+                     "set_classification_index", "_record_history", "_notify_alerts"):
+            monkeypatch.setattr(_assets_mod, attr, lambda *a: pd.DataFrame(
+                {"ticker": ["MXRF11"], "tipo": "FII", "preco_atual": 10.0, "dy_12m": 12.0, "data_atualizacao": ""}))
+        _assets_mod.refresh_universe()
+        assert lidos == [1]
+        monkeypatch.setattr(_assets_mod, "_universe", None)
+        monkeypatch.setattr(_alerts_mod, "_store", None)
+        monkeypatch.setattr(_alerts_mod, "ALERTS_DB", str(tmp_path / "sem_alertas.sqlite3"))
+        _assets_mod.refresh_universe()
+        assert lidos == [1]
+
+# ============= Linha de comando =============
+
+class TestCli:
+    _CARTEIRAS = {"ana": _make_portfolio(_pos("MXRF11", 100, 9.0)),
+                  "bia": _make_portfolio(_pos("HGLG11", 10, 150.0), _pos("MXRF11", 50, 10.0))}
+
+    @pytest.fixture(autouse=True)
+    def _offline(self, monkeypatch):
+        universo = _assets_mod.AssetUniverse(pd.DataFrame({
+            "ticker": ["HGLG11", "MXRF11"], "preco_atual": [160.0, 10.0], "dy_12m": [8.0, 12.0]}))
+        monkeypatch.setattr(_portfolio_mod, "get_universe", lambda: universo)
+        monkeypatch.setattr(_assets_mod, "get_universe", lambda: universo)
+        monkeypatch.setattr(_portfolio_mod, "read_portfolio", lambda pid: self._CARTEIRAS[pid])
+        monkeypatch.setattr(_logging_mod, "setup_logging", lambda: None)
+
+    def test_relatorio_grava_metricas_e_projecao(self, tmp_path):
+        resumo = _cli_mod.build_report("bia", str(tmp_path), {"monthly_contribution": 0.0,
+                                                              "target_monthly_income": 15.0})
+        assert resumo["Patrimônio (R$)"] == pytest.approx(2100.0)
+        assert resumo["meses_ate_meta"] == 0
+        assert sorted(os.listdir(tmp_path / "bia")) == ["posicoes.csv", "projecao.csv", "resumo.json"]
+        assert pd.read_csv(tmp_path / "bia" / "posicoes.csv")["Ticker"].tolist() == ["HGLG11", "MXRF11"]
+        assert len(pd.read_csv(tmp_path / "bia" / "projecao.csv")) == 30 * 12
+        assert json.loads((tmp_path / "bia" / "resumo.json").read_text(encoding="utf-8")) == resumo
+
+    def test_falha_de_uma_carteira_nao_interrompe_as_demais(self, tmp_path, capsys):
+        code = _cli_mod.main(["report", "--carteiras", "ana", "zeca", "bia", "--workers", "1",
+                              "--saida", str(tmp_path), "--anos", "5"])
+        assert code == 1
+        assert sorted(os.listdir(tmp_path)) == ["ana", "bia"]
+        assert "zeca: KeyError" in capsys.readouterr().err
+
+    def test_camada_de_dados_importa_sem_streamlit(self):
+        code = ("import sys, cli, data_layer.portfolio, data_layer.proventos, utils; "
+                "sys.exit('streamlit' in sys.modules)")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
+
+    @pytest.mark.parametrize("modulo", ["cli", "server"])
+    def test_dotenv_carregado_antes_do_config(self, modulo, tmp_path):
+        (tmp_path / ".env").write_text("STORAGE_BACKEND=sqlite\n", encoding="utf-8")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {k: v for k, v in os.environ.items() if k != "STORAGE_BACKEND"}
+        env["PYTHONPATH"] = root
+        code = f"import sys, {modulo}; sys.exit({modulo}.STORAGE_BACKEND != 'sqlite')"
+        assert subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=env).returncode == 0
+
+
+# ============= API JSON =============
+
+class TestServer:
+    @pytest.fixture
+    def snapshots(self, tmp_path, monkeypatch):
+        for attr, value in [("ATIVOS_CSV", str(tmp_path / "ativos.csv")),
+                            ("ATIVOS_DELTA_CSV", str(tmp_path / "ativos_delta.csv")),
+                            ("DATA_DIR", str(tmp_path)), ("_universe", None), ("_universe_key", None)]:
+            monkeypatch.setattr(_assets_mod, attr, value)
+        pd.DataFrame({"ticker": [f"FII{i:03d}11" for i in range(120)], "nome": "Fundo", "tipo": "FII",
+                      "preco_atual": 10.0, "dy_12m": np.arange(120) / 10, "data_atualizacao": ""}).to_csv(
+            tmp_path / "ativos.csv", index=False)
+        self.store = PortfolioStore(str(tmp_path / "carteiras.sqlite3"))
+        for mod in (_portfolio_mod, _server_mod):
+            monkeypatch.setattr(mod, "STORAGE_BACKEND", "sqlite")
+            monkeypatch.setattr(mod, "get_store", lambda: self.store)
+        monkeypatch.setattr(_portfolio_mod, "get_last_price", lambda t: pytest.fail("consultou a Brapi"))
+        self.store.save_portfolio("ana", {"positions": [_pos("FII00111", 10, 9.0), _pos("XPTO3", 5, 20.0)]})
+        self.store.save_portfolio("bia", {"positions": [_pos("FII05011", 100, 10.0)]})
+        snapshots = _server_mod.SnapshotStore()
+        snapshots.refresh()
+        return snapshots
+
+    def test_rotas_servem_snapshots_sem_fontes_externas(self, snapshots):
+        ana = json.loads(snapshots.route("/carteiras/ana", {}).body)
+        assert ana["totais"]["Patrimônio (R$)"] == pytest.approx(100.0)  # XPTO3 fora do universo: preço 0
+        pagina = json.loads(snapshots.route("/universo", {"ordem": "-dy", "dy_min": "5", "pagina": "2",
+                                                          "por_pagina": "10"}).body)
+        assert pagina["total"] == 70
+        assert [i["ticker"] for i in pagina["itens"][:2]] == ["FII10911", "FII10811"]
+        proj = json.loads(snapshots.route("/carteiras/bia/projecao", {"aporte": "0", "meta": "1", "anos": "2"}).body)
+        assert proj["meses_ate_meta"] == 0 and len(proj["serie"]) == 24
+        assert snapshots.route("/universo", {"ordem": "-dy"}) is snapshots.route("/universo", {"ordem": "-dy"})
+        for path, query in [("/carteiras/zeca", {}), ("/universo", {"por_pagina": "9999"})]:
+            with pytest.raises(_server_mod.ApiError):
+                snapshots.route(path, query)
+
+    def test_refresh_refaz_so_as_carteiras_alteradas(self, snapshots):
+        ana, bia = (snapshots.route(f"/carteiras/{p}", {}) for p in ("ana", "bia"))
+        assert snapshots.refresh() is False
+        self.store.apply_operation("bia", "FII05011", 10, 10.0)
+        assert snapshots.refresh() is True
+        assert snapshots.route("/carteiras/ana", {}) is ana
+        novo = snapshots.route("/carteiras/bia", {})
+        assert novo.etag != bia.etag and json.loads(novo.body)["posicoes"][0]["Qtde"] == 110
+
+    def test_json_pela_metade_nao_apaga_a_carteira(self, snapshots, tmp_path, monkeypatch):
+        path = tmp_path / "portfolio.json"
+        for mod in (_portfolio_mod, _server_mod):
+            monkeypatch.setattr(mod, "STORAGE_BACKEND", "json")
+            monkeypatch.setattr(mod, "PORTFOLIO_JSON", str(path))
+        monkeypatch.setattr(_portfolio_mod, "DATA_DIR", str(tmp_path))
+        _portfolio_mod.save_portfolio({"positions": [_pos("FII00111", 10, 9.0)]})
+        assert os.listdir(tmp_path).count("portfolio.json") == 1 and not list(tmp_path.glob("*.tmp"))
+        snapshots.refresh()
+        antes = snapshots.route(f"/carteiras/{_server_mod.DEFAULT_PORTFOLIO_ID}", {})
+
+        truncado = path.read_text(encoding="utf-8")[:20]
+        path.write_text(truncado, encoding="utf-8")
+        os.utime(path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        snapshots.refresh()
+        assert path.read_text(encoding="utf-8") == truncado
+        assert snapshots.route(f"/carteiras/{_server_mod.DEFAULT_PORTFOLIO_ID}", {}) is antes
+
+    def test_http_etag_e_gzip(self, snapshots):
+        server = _server_mod.make_server("127.0.0.1", 0, snapshots)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+            conn.request("GET", "/universo?por_pagina=100", headers={"Accept-Encoding": "gzip"})
+            r = conn.getresponse()
+            body, etag = r.read(), r.getheader("ETag")
+            assert r.status == 200 and r.getheader("Content-Encoding") == "gzip"
+            assert len(json.loads(gzip.decompress(body))["itens"]) == 100
+            conn.request("GET", "/universo?por_pagina=100", headers={"If-None-Match": etag})
+            r = conn.getresponse()
+            assert r.status == 304 and r.read() == b""
+            conn.request("GET", "/carteiras/zeca")
+            r = conn.getresponse()
+            assert r.status == 404 and "erro" in json.loads(r.read())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+# ============= Perfil sob demanda =============
+
+def _funcao_lenta():
+    return sum(i * i for i in range(200_000))
+
+
+class TestProfiling:
+    def test_perfil_gravado_com_ranking_e_retencao(self, tmp_path):
+        for _ in range(3):
+            with _profiling_mod.profile_rerun("🔍 Explorar Ativos", str(tmp_path), keep=2) as run:
+                _funcao_lenta()
+        assert len(os.listdir(tmp_path)) == 2 and os.path.basename(run.report.path) in os.listdir(tmp_path)
+        assert run.report.path.endswith("-explorar-ativos.prof")
+        top = run.report.top(5, by="acumulado")
+        assert len(top) == 5 and top["Função"].str.contains("_funcao_lenta").any()
+
+    def test_excecao_da_pagina_ainda_grava_o_perfil(self, tmp_path):
+        with pytest.raises(RuntimeError):
+            with _profiling_mod.profile_rerun("Minha Carteira", str(tmp_path)) as run:
+                raise RuntimeError("st.rerun")
+        assert run.report is not None and os.path.exists(run.report.path)
+
+    def test_uma_execucao_perfilada_por_vez(self, tmp_path):
+        with _profiling_mod.profile_rerun("a", str(tmp_path)) as externo:
+            with _profiling_mod.profile_rerun("b", str(tmp_path)) as interno:
+                pass
+        assert interno.report is None and externo.report is not None
+        assert len(os.listdir(tmp_path)) == 1
+
+
+# ============= Teste de carga =============
+
+class TestLoadtestStubs:
+    def test_fontes_simuladas_sao_lidas_pelos_parsers_do_app(self, monkeypatch):
+        stub = _loadtest_mod.StubUpstream(tickers={"F00011": ("FII", 100.0, 8.5), "F00111": ("FII", 90.0, 9.0),
+                                                   "A0003": ("Ação", 20.0, 6.25)}).start()
+        try:
+            monkeypatch.setattr(_scraping_mod, "FUNDSEXPLORER_BASE_URL", stub.url)
+            monkeypatch.setattr(_scraping_mod, "STATUSINVEST_BASE_URL", stub.url)
+            monkeypatch.setattr(_prices_mod, "BRAPI_BASE_URL", stub.url)
+            assert inspect.unwrap(_scraping_mod.get_dy_from_fundsexplorer)("F00111") == pytest.approx(0.09)
+            assert inspect.unwrap(_scraping_mod.get_dy_from_statusinvest)("A0003", "Ação") == pytest.approx(0.0625)
+            # o lote omite 1 em cada 20 tickers, para exercitar o scraping das lacunas
+            assert inspect.unwrap(_scraping_mod.get_dy_bulk_from_statusinvest)("FII") == {"F00111": pytest.approx(0.09)}
+            lista = inspect.unwrap(_prices_mod.fetch_ativos_from_brapi)("stock")
+            assert lista == [{"stock": "A0003", "name": "Ativo A0003", "close": 20.0}]
+            assert stub.requests == 4
+        finally:
+            stub.stop()
+
+    def test_yfinance_simulado_alimenta_historicos(self, monkeypatch):
+        monkeypatch.setattr(_prices_mod, "yf", _loadtest_mod.StubYFinance())
+        divs = _prices_mod.fetch_dividend_history(["F00011", "F00111"])
+        assert set(divs["ticker"]) == {"F00011", "F00111"} and (divs["valor"] == 0.8).all()
+        hist = inspect.unwrap(_prices_mod.get_price_history)(("F00011", "A0003"), "1y")
+        assert list(hist.columns) == ["F00011", "A0003"] and len(hist) == 500
+        serie, pct = inspect.unwrap(_prices_mod.get_benchmark_performance)("IFIX11.SA")
+        assert list(serie.columns) == ["Date", "Close"] and np.isfinite(pct)
+
+
+# ============= Cotações ao vivo =============
+
+class TestLiveQuotes:
+    def test_pregao_da_b3_em_horario_de_brasilia(self, monkeypatch):
+        monkeypatch.setattr(_utils_mod, "B3_FERIADOS", {"2026-11-20"})
+        brt = _utils_mod.BRT
+        assert _utils_mod.is_b3_open(datetime(2026, 10, 19, 10, 0, tzinfo=brt))       # segunda, abertura
+        assert not _utils_mod.is_b3_open(datetime(2026, 10, 19, 17, 0, tzinfo=brt))   # fechamento
+        assert not _utils_mod.is_b3_open(datetime(2026, 10, 19, 9, 59, tzinfo=brt))
+        assert not _utils_mod.is_b3_open(datetime(2026, 10, 18, 12, 0, tzinfo=brt))   # domingo
+        assert not _utils_mod.is_b3_open(datetime(2026, 11, 20, 12, 0, tzinfo=brt))   # feriado
+        # 14h UTC = 11h em Brasília
+        assert _utils_mod.is_b3_open(datetime(2026, 10, 19, 14, 0, tzinfo=_utils_mod.timezone.utc))
+
+    def test_cotacoes_em_lote_numa_requisicao_por_bloco(self, monkeypatch):
+        stub = _loadtest_mod.StubUpstream(tickers={"F00011": ("FII", 100.0, 8.5), "F00111": ("FII", 90.5, 9.0),
+                                                   "A0003": ("Ação", 20.0, 6.25)}).start()
+        try:
+            monkeypatch.setattr(_prices_mod, "_client", Brapi(api_key="x", base_url=stub.url))
+            monkeypatch.setattr(_prices_mod, "BRAPI_QUOTE_BATCH", 2)
+            quotes = inspect.unwrap(_prices_mod.get_quotes_batch)(("F00011", "F00111", "A0003", "XPTO11"))
+            assert quotes == {"F00011": 100.0, "F00111": 90.5, "A0003": 20.0}
+            assert stub.requests == 2
+        finally:
+            stub.stop()
+
+    def test_so_precos_alterados_atualizam_o_modelo(self):
+        model = PortfolioMetrics([
+            _portfolio_mod.position_row("HGLG11", "FII", 10, 150.0, 160.0, 8.0),
+            _portfolio_mod.position_row("PETR4", "Ação", 100, 30.0, 35.0, 10.0),
+        ])
+        quotes = {"HGLG11": 160.0, "PETR4": 36.0, "VALE3": 60.0}
+        changed = [t for t, p in quotes.items() if model.apply_price(t, p)]
+        assert changed == ["PETR4"]
+        assert model.totals["Patrimônio (R$)"] == pytest.approx(10 * 160.0 + 100 * 36.0)
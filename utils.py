@@ -1,11 +1,13 @@
 """Utilitários compartilhados: formatação, simulação e helpers de UI."""
-from datetime import datetime
+from datetime import datetime, time, timedelta, timezone
 
 import pandas as pd
-import streamlit as st
 from dateutil.relativedelta import relativedelta
 
-from config import ASSET_CONFIG
+from config import ASSET_CONFIG, B3_CLOSE, B3_FERIADOS, B3_OPEN
+
+# Horário de Brasília (sem horário de verão desde 2019); dispensa a base tzdata no Windows
+BRT = timezone(timedelta(hours=-3), "BRT")
 
 
 def brl(value: float) -> str:
@@ -18,6 +20,14 @@ def pct(value: float) -> str:
     return f"{value:,.2f}%".replace(",", "X").replace(".", ",").replace("X", ".")
 
 
+def is_b3_open(now: datetime | None = None) -> bool:
+    """Se a B3 está em pregão: dia útil fora de B3_FERIADOS, entre B3_OPEN e B3_CLOSE (Brasília)."""
+    now = (now or datetime.now(BRT)).astimezone(BRT)
+    if now.weekday() >= 5 or now.date().isoformat() in B3_FERIADOS:
+        return False
+    return time.fromisoformat(B3_OPEN) <= now.time() < time.fromisoformat(B3_CLOSE)
+
+
 def simulate_projection(
     start_capital: float,
     current_monthly_income: float,